@@ -1,30 +1,59 @@
 # active_memory.py
 from long_term_memory import LongTermMemoryFile
+from turn_event import TurnEvent
+from collections import deque
+from itertools import islice
 import logging
 
 # Get a logger specific to this module, inheriting from 'memory'
 logger = logging.getLogger('memory.active')
 
+IMPORTANT_KEYWORDS = ["project", "park", "school", "relationship", "conflict", "emotion", "together", "hug", "sorry", "antidepressants", "anxiety", "house", "library", "fault"]
+
+def select_by_keywords(batch, important_keywords, summary_size):
+    """Keyword compression: up to `summary_size` whole turns, those mentioning a keyword first, then the most recent."""
+    important_memories = [m for m in batch if m.mentions(important_keywords)]
+    logger.info("Compress: Found %d important memories in batch.", len(important_memories))
+    logger.debug("Important memories found: %s", important_memories)
+    if len(important_memories) >= summary_size:
+        logger.debug("Compress: Using first %d important memories for LTM summary.", summary_size)
+        return important_memories[:summary_size]
+    selected = list(important_memories)
+    needed = summary_size - len(selected)
+    if needed > 0:
+        chosen = set(selected)
+        recent_non_important = [m for m in reversed(batch) if m not in chosen]
+        fill_count = min(needed, len(recent_non_important))
+        selected.extend(recent_non_important[:fill_count])
+        logger.debug("Compress: Using %d important + %d recent non-important memories for LTM summary.", len(important_memories), fill_count)
+    return selected
+
+
 class ActiveMemoryFile:
-    def __init__(self, threshold=25, summary_size=5):
-        self.memories = [] # Active memory buffer
+    def __init__(self, threshold=25, summary_size=5, long_term_file=None):
+        self.memories = deque() # Active memory buffer (oldest first; batches leave from the left in O(1))
+        self._index = set() # Hash index of the buffer for duplicate checks
         self.threshold = threshold # Limit to compress to LTM
         self.summary_size = summary_size # How many memories to save to LTM per batch
-        self.long_term_file = LongTermMemoryFile() # LTM instance
+        self.long_term_file = long_term_file if long_term_file is not None else LongTermMemoryFile() # LTM instance (pass one to use a per-session file)
         self.message_count = 0 # Counter
-        self.important_keywords = ["project", "park", "school", "relationship", "conflict", "emotion", "together", "hug", "sorry", "antidepressants", "anxiety", "house", "library", "fault"] # Keywords for LTM compression
+        self.important_keywords = list(IMPORTANT_KEYWORDS) # Keywords for LTM compression
+        self.summarizer = None # Optional ExtractiveSummarizer (attached by RPLogic when the vector store is available)
         logger.debug("ActiveMemoryFile initialized. Threshold: %d, Summary Size: %d", self.threshold, self.summary_size)
 
     def add_memory(self, memory):
-        """Adds a memory received from dynamic memory (if relevant)."""
+        """Adds a memory (TurnEvent) received from dynamic memory (if relevant)."""
+        if isinstance(memory, str):
+            memory = TurnEvent.from_text(memory)
         logger.debug("--- ActiveMemory: add_memory called ---")
-        logger.debug("Input memory: '%s...'", memory[:100])
+        logger.debug("Input memory: %r", memory)
         logger.debug("Current active memory state (before add, size %d): %s", len(self.memories), self.memories if len(self.memories) < 10 else "[Too long to log fully]") # Log content only if short
 
-        if memory not in self.memories:
+        if memory not in self._index:
              self.memories.append(memory)
+             self._index.add(memory)
              # Keep INFO log for successful addition summary
-             logger.info("Added to active memory: '%s...'", memory[:70])
+             logger.info("Added to active memory: '%s...'", memory.preview(70))
              logger.debug("Active memory state (after add, size %d): %s", len(self.memories), self.memories if len(self.memories) < 10 else "[Too long to log fully]")
              self.message_count += 1
              logger.debug("Message count incremented to: %d", self.message_count)
@@ -33,10 +62,15 @@ class ActiveMemoryFile:
                  logger.info("Active memory threshold (%d) reached. Triggering compression.", self.threshold)
                  self.compress_and_send()
         else:
-             logger.debug("Skipped adding duplicate to active memory: '%s...'", memory[:70])
+             logger.debug("Skipped adding duplicate to active memory: '%s...'", memory.preview(70))
         logger.debug("--- ActiveMemory: add_memory finished ---")
 
 
+    def contains(self, memory):
+        """Whether an equal memory is already buffered (constant time)."""
+        return memory in self._index
+
+
     def compress_and_send(self):
         """Compresses the oldest batch of memories and sends them to LTM."""
         logger.debug("--- ActiveMemory: compress_and_send called ---")
@@ -45,37 +79,28 @@ class ActiveMemoryFile:
              logger.debug("--- ActiveMemory: compress_and_send finished (skipped) ---")
              return
 
-        batch_to_process = self.memories[:self.threshold]
-        self.memories = self.memories[self.threshold:] # Remove the processed batch
+        batch_to_process = [self.memories.popleft() for _ in range(self.threshold)] # Remove the processed batch
+        self._index.difference_update(batch_to_process)
 
         logger.info("Compress: Processing batch of %d. Remaining active: %d", len(batch_to_process), len(self.memories))
         logger.debug("Batch to process: %s", batch_to_process)
         logger.debug("Active memories after removing batch: %s", self.memories if len(self.memories) < 10 else "[Too long to log fully]")
 
-        # Select important memories from the batch
-        important_memories = [m for m in batch_to_process if any(keyword in m.lower() for keyword in self.important_keywords)]
-        logger.info("Compress: Found %d important memories in batch.", len(important_memories))
-        logger.debug("Important memories found: %s", important_memories)
-
-        # Create the summary for LTM
+        # Create the summary for LTM: extractive (embedding-based) when a summarizer is attached, else keyword selection
         compressed_summary_list = []
-        if len(important_memories) >= self.summary_size:
-            compressed_summary_list = important_memories[:self.summary_size]
-            logger.debug("Compress: Using first %d important memories for LTM summary.", self.summary_size)
-        else:
-            compressed_summary_list = important_memories
-            needed = self.summary_size - len(compressed_summary_list)
-            if needed > 0:
-                recent_non_important = [m for m in reversed(batch_to_process) if m not in compressed_summary_list]
-                fill_count = min(needed, len(recent_non_important))
-                compressed_summary_list.extend(recent_non_important[:fill_count])
-                logger.debug("Compress: Using %d important + %d recent non-important memories for LTM summary.", len(important_memories), fill_count)
+        if self.summarizer is not None:
+            try:
+                compressed_summary_list = list(self.summarizer.summarize(batch_to_process))
+            except Exception as e:
+                logger.error("Compress: Extractive summarizer failed (%s). Falling back to keyword selection.", e, exc_info=True)
+        if not compressed_summary_list:
+            compressed_summary_list = select_by_keywords(batch_to_process, self.important_keywords, self.summary_size)
 
         logger.debug("Final summary list for LTM: %s", compressed_summary_list)
 
-        # Join the summary and send it to LTM if not empty
+        # Send the summary to LTM if not empty (its events are joined into text only when a prompt shows it)
         if compressed_summary_list:
-            summary_event = "\n---\n".join(compressed_summary_list) # Use separator
+            summary_event = tuple(compressed_summary_list)
             # Let long_term_file handle its own logging
             self.long_term_file.add_event(summary_event)
             logger.info("Compress: Sent summary of %d items to LTM.", len(compressed_summary_list))
@@ -89,7 +114,7 @@ class ActiveMemoryFile:
         logger.debug("Getting last %d active memories.", count)
         # Ensure count is not larger than the list size
         actual_count = min(count, len(self.memories))
-        mems = self.memories[-actual_count:]
+        mems = list(islice(self.memories, len(self.memories) - actual_count, None))
         logger.debug("Returning %d memories: %s", actual_count, mems if actual_count < 5 else "[Too many to log fully]")
         return mems
 
@@ -0,0 +1,94 @@
+# autosaver.py
+import logging
+import threading
+import time
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.autosave')
+
+AUTOSAVE_DEBOUNCE_S = 5.0 # Quiet time after the last change before saving
+AUTOSAVE_MAX_DELAY_S = 60.0 # Save at the latest this long after the first unsaved change
+
+
+class Autosaver:
+    def __init__(self, save_func, debounce_s=AUTOSAVE_DEBOUNCE_S, max_delay_s=AUTOSAVE_MAX_DELAY_S, name="autosave"):
+        """
+        Debounced background saver. mark_dirty() after each change; `save_func` runs on a daemon thread
+        once changes stop for `debounce_s` (or `max_delay_s` after the first unsaved one), so a burst of
+        turns becomes one write. flush()/stop() save synchronously.
+        """
+        self.save_func = save_func
+        self.debounce_s = debounce_s
+        self.max_delay_s = max_delay_s
+        self.name = name
+        self._cond = threading.Condition()
+        self._first_dirty = None # monotonic time of the first unsaved change
+        self._last_dirty = None
+        self._urgent = False
+        self._stopping = False
+        self._thread = None
+        self.stats = {"changes": 0, "saves": 0, "errors": 0}
+
+    def mark_dirty(self, urgent=False):
+        """Records a change. `urgent` skips the debounce (e.g. too many turns since the last save)."""
+        with self._cond:
+            now = time.monotonic()
+            if self._first_dirty is None:
+                self._first_dirty = now
+            self._last_dirty = now
+            self._urgent = self._urgent or urgent
+            self.stats["changes"] += 1
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _take_pending(self):
+        """Clears the pending change (caller holds the condition). Returns True if there was one."""
+        pending = self._first_dirty is not None
+        self._first_dirty = self._last_dirty = None
+        self._urgent = False
+        return pending
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and self._first_dirty is None:
+                    self._cond.wait()
+                while not self._stopping and not self._urgent:
+                    due = min(self._last_dirty + self.debounce_s, self._first_dirty + self.max_delay_s)
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+                self._take_pending()
+            self._save()
+
+    def _save(self):
+        try:
+            self.save_func()
+            self.stats["saves"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error("Autosave '%s' failed: %s", self.name, e, exc_info=True)
+
+    def flush(self):
+        """Saves now (in the calling thread) if anything changed since the last save."""
+        with self._cond:
+            pending = self._take_pending()
+        if pending:
+            self._save()
+        return pending
+
+    def stop(self, flush=True):
+        """Stops the background thread and, by default, saves what is still pending."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush()
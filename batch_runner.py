@@ -0,0 +1,156 @@
+# batch_runner.py (Non-interactive script mode: many sessions replayed concurrently)
+import asyncio
+import json
+import logging
+import os
+import time
+
+from session import Session
+
+# Get a logger specific to this module
+logger = logging.getLogger('batch_runner')
+
+TRANSCRIPT_FILE = "transcript.jsonl" # Per-session output (user input, reply, timings)
+
+
+def load_transcripts(path):
+    """
+    Reads a JSONL script into {session_id: [user inputs]} (file order is kept).
+
+    Each line is either {"session": "s1", "turns": ["hi", ...]} or {"session": "s1", "input": "hi"};
+    lines for the same session are concatenated. A missing "session" gets an id from the line number.
+    """
+    sessions = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+            session_id = str(entry.get("session") or f"session-{line_number}")
+            if "turns" in entry:
+                turns = entry["turns"]
+            elif "input" in entry:
+                turns = [entry["input"]]
+            else:
+                raise ValueError(f"{path}:{line_number}: expected a 'turns' list or an 'input' string.")
+            sessions.setdefault(session_id, []).extend(str(turn) for turn in turns)
+    return sessions
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def latency_summary(values):
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "mean_s": sum(values) / len(values),
+        "p50_s": percentile(values, 0.50),
+        "p95_s": percentile(values, 0.95),
+        "max_s": max(values),
+    }
+
+
+class BatchRun:
+    def __init__(self, dialogue_generator, sessions_dir="sessions", parallelism=4, user_name="User", on_session_start=None, logic_options=None):
+        """
+        Replays scripted sessions concurrently against one shared generator.
+
+        Args:
+            dialogue_generator (AsyncRPDialogueGenerator): Shared by every session (turn state is per task).
+            sessions_dir (str): Each session keeps its state in sessions_dir/<session id>/.
+            parallelism (int): Max sessions running at once.
+            user_name (str): User name for every session.
+            on_session_start (callable): Optional hook called with each new RPLogic (e.g. to seed initial context).
+            logic_options (dict): Extra RPLogic arguments for every session (e.g. storage="sqlite").
+        """
+        self.dialogue_generator = dialogue_generator
+        self.sessions_dir = sessions_dir
+        self.parallelism = max(1, parallelism)
+        self.user_name = user_name
+        self.on_session_start = on_session_start
+        self.logic_options = dict(logic_options or {})
+        self.turn_reports = []
+        self.turns_ok = 0
+        self.turns_failed = 0
+        self.sessions_failed = 0
+
+    async def _run_session(self, session_id, turns, semaphore):
+        async with semaphore:
+            logger.info("Session '%s': %d turns", session_id, len(turns))
+            try:
+                session = await Session.open(session_id, self.sessions_dir, self.user_name, self.on_session_start, self.logic_options)
+            except Exception as e:
+                logger.error("Session '%s' could not start: %s", session_id, e, exc_info=True)
+                self.sessions_failed += 1
+                self.turns_failed += len(turns)
+                return
+            try:
+                with open(os.path.join(session.state_dir, TRANSCRIPT_FILE), 'a', encoding='utf-8') as transcript:
+                    for turn_index, user_text in enumerate(turns):
+                        reports = []
+                        try:
+                            reply = await session.turn(self.dialogue_generator, user_text, reports=reports)
+                        except Exception as e:
+                            logger.error("Session '%s' turn %d failed: %s", session_id, turn_index, e, exc_info=True)
+                            self.turns_failed += 1
+                            transcript.write(json.dumps({"turn": turn_index, "user": user_text, "error": str(e)}, ensure_ascii=False) + "\n")
+                            continue
+                        self.turns_ok += 1
+                        self.turn_reports.extend(reports)
+                        transcript.write(json.dumps({"turn": turn_index, "user": user_text, "reply": reply, "report": reports[0] if reports else None}, ensure_ascii=False) + "\n")
+            finally:
+                await session.close()
+
+    async def run(self, sessions):
+        """Runs every session and returns the summary report."""
+        semaphore = asyncio.Semaphore(self.parallelism)
+        start = time.perf_counter()
+        await asyncio.gather(*(self._run_session(session_id, turns, semaphore) for session_id, turns in sessions.items()))
+        return self.summary(sessions, time.perf_counter() - start)
+
+    def summary(self, sessions, wall_seconds):
+        total_turns = self.turns_ok + self.turns_failed
+        # A turn is degraded when some route fell back to canned output (no tier answered)
+        degraded = sum(1 for report in self.turn_reports if "none" in report.get("tiers", {}).values())
+        stage_names = sorted({name for report in self.turn_reports for name in report["stages"]})
+        return {
+            "sessions": len(sessions),
+            "sessions_failed": self.sessions_failed,
+            "parallelism": self.parallelism,
+            "turns": total_turns,
+            "turns_failed": self.turns_failed,
+            "turns_degraded": degraded,
+            "error_rate": self.turns_failed / total_turns if total_turns else 0.0,
+            "degraded_rate": degraded / self.turns_ok if self.turns_ok else 0.0,
+            "wall_s": wall_seconds,
+            "turns_per_s": self.turns_ok / wall_seconds if wall_seconds > 0 else 0.0,
+            "stages": {
+                name: latency_summary([report["stages"][name] for report in self.turn_reports if name in report["stages"]])
+                for name in stage_names
+            },
+            "critical_path": latency_summary([report["critical_path_s"] for report in self.turn_reports]),
+            "commit_wait": latency_summary([report["commit_wait_s"] for report in self.turn_reports]),
+        }
+
+
+def format_summary(summary):
+    """Human-readable version of BatchRun.summary()."""
+    lines = [
+        f"Sessions: {summary['sessions']} ({summary['sessions_failed']} failed to start), parallelism {summary['parallelism']}",
+        f"Turns: {summary['turns']} in {summary['wall_s']:.2f}s -> {summary['turns_per_s']:.2f} turns/s",
+        f"Errors: {summary['turns_failed']} ({summary['error_rate']:.1%}), degraded (canned fallback): {summary['turns_degraded']} ({summary['degraded_rate']:.1%})",
+    ]
+    rows = list(summary["stages"].items()) + [("critical_path", summary["critical_path"]), ("commit_wait", summary["commit_wait"])]
+    for name, stats in rows:
+        if stats:
+            lines.append(f"  {name:<14} mean {stats['mean_s']:.3f}s  p50 {stats['p50_s']:.3f}s  p95 {stats['p95_s']:.3f}s  max {stats['max_s']:.3f}s")
+    return "\n".join(lines)
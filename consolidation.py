@@ -0,0 +1,155 @@
+# consolidation.py (Sleep-time consolidation of the vector memories recorded since the last sleep)
+import logging
+import time
+
+import numpy as np
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.consolidation')
+
+DUPLICATE_SIMILARITY = 0.92 # Cosine similarity above which two turns count as near-duplicates
+PRUNE_VALUE = 0.2 # Single turns valued below this are dropped
+FULL_WEIGHT_VALUE = 0.5 # Turns valued at least this keep full retrieval weight; below it they are downweighted
+MIN_WEIGHT = 0.3
+VALUE_WORDS = 30 # Words for full length credit
+CONSOLIDATED_KEY = "consolidated" # Metadata flag: processed by a consolidation pass
+
+
+def memory_value(memory, important_keywords=()):
+    """Rough worth (0-1) of keeping a memory: length, emotional intensity, important keywords."""
+    metadata = memory.get("metadata") or {}
+    if metadata.get("type") == "system_context":
+        return 1.0 # Injected background is never pruned
+    text = memory.get("text", "")
+    emotions = metadata.get("emotions") or {}
+    intensity = max((value for value in emotions.values() if isinstance(value, (int, float))), default=0.0)
+    keyword_hit = any(keyword in text.lower() for keyword in important_keywords)
+    return min(1.0, 0.4 * min(1.0, len(text.split()) / VALUE_WORDS) + 0.4 * min(1.0, intensity) + (0.2 if keyword_hit else 0.0))
+
+
+def _normalized(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms > 0, norms, 1.0)
+
+
+def _duplicate_groups(normalized, threshold):
+    """Groups of row indexes linked by similarity >= threshold (connected components), each in row order."""
+    parent = list(range(len(normalized)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    similarity = normalized @ normalized.T
+    for i, j in zip(*np.nonzero(np.triu(similarity >= threshold, k=1))):
+        parent[find(int(j))] = find(int(i))
+    groups = {}
+    for i in range(len(normalized)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def merged_text(base_text, metadata):
+    count = metadata.get("merged_count", 1)
+    if count <= 1:
+        return base_text
+    return f"{base_text}\n[Happened {count} times, {metadata.get('first_seen')} to {metadata.get('last_seen')}]"
+
+
+def _merge_metadata(metadata, members):
+    """Metadata of a merged memory: the representative's, plus how often and when the merged turns happened."""
+    times = [m["metadata"].get("first_seen", m["metadata"].get("roleplay_time")) for m in members]
+    last_times = [m["metadata"].get("last_seen", m["metadata"].get("roleplay_time")) for m in members]
+    times = [t for t in times if t]
+    last_times = [t for t in last_times if t]
+    merged = dict(metadata)
+    merged.update({
+        CONSOLIDATED_KEY: True,
+        "merged_count": sum(m["metadata"].get("merged_count", 1) for m in members),
+        "merged_ids": sorted({i for m in members for i in m["metadata"].get("merged_ids", [m["id"]])}),
+        "first_seen": min(times) if times else None,
+        "last_seen": max(last_times) if last_times else None,
+        "weight": 1.0,
+    })
+    return merged
+
+
+def plan_consolidation(day_rows, older_rows=(), important_keywords=(), duplicate_similarity=DUPLICATE_SIMILARITY, prune_value=PRUNE_VALUE):
+    """
+    Decides what a consolidation pass does; changes nothing (the owner applies the plan).
+
+    Near-duplicate turns of the day are merged into one memory: the most central member's text with how
+    often and when it happened, and the mean embedding. A group that repeats an older consolidated memory
+    is folded into it. Single turns of low value are pruned and middling ones downweighted. Every
+    surviving day memory is flagged as consolidated, so the next pass only looks at newer ones.
+
+    Args:
+        day_rows / older_rows (list): (memory object, embedding) pairs: memories not yet consolidated, and the rest.
+    Returns:
+        dict: "remove" (ids), "update" (id -> (text, metadata, embedding or None)), "stats".
+    """
+    start = time.perf_counter()
+    remove, update = set(), {}
+    stats = {"day_memories": len(day_rows), "merged_groups": 0, "merged_memories": 0, "folded_into_older": 0,
+             "pruned": 0, "downweighted": 0}
+    if not day_rows:
+        stats["seconds"] = time.perf_counter() - start
+        return {"remove": remove, "update": update, "stats": stats}
+
+    day_memories = [memory for memory, _ in day_rows]
+    day_embeddings = np.vstack([embedding for _, embedding in day_rows]).astype('float32')
+    day_normalized = _normalized(day_embeddings)
+    older_memories = [memory for memory, _ in older_rows] # Replaced by their updated copies as day groups fold into them
+    older_embeddings = np.vstack([embedding for _, embedding in older_rows]).astype('float32') if older_rows else None
+    older_normalized = _normalized(older_embeddings) if older_rows else None
+
+    for group in _duplicate_groups(day_normalized, duplicate_similarity):
+        members = [day_memories[i] for i in group]
+        centroid = day_embeddings[group].mean(axis=0)
+        if older_normalized is not None:
+            similarity = older_normalized @ (centroid / (np.linalg.norm(centroid) or 1.0))
+            best = int(np.argmax(similarity))
+            if similarity[best] >= duplicate_similarity:
+                # Repeats something from an earlier day: count it there instead of storing it again
+                target = older_memories[best]
+                metadata = _merge_metadata(target["metadata"], [target] + members)
+                base_text = target["metadata"].get("base_text", target["text"])
+                metadata["base_text"] = base_text
+                count = target["metadata"].get("merged_count", 1)
+                embedding = (older_embeddings[best] * count + day_embeddings[group].sum(axis=0)) / (count + len(group))
+                older_memories[best] = {"id": target["id"], "text": merged_text(base_text, metadata), "metadata": metadata}
+                older_embeddings[best] = embedding
+                older_normalized[best] = embedding / (np.linalg.norm(embedding) or 1.0)
+                update[target["id"]] = (older_memories[best]["text"], metadata, embedding)
+                remove.update(m["id"] for m in members)
+                stats["folded_into_older"] += len(group)
+                continue
+        if len(group) > 1:
+            # The member closest to the group's centre speaks for it; it keeps its id (and place in time order)
+            central = group[int(np.argmax(day_normalized[group] @ day_normalized[group].mean(axis=0)))]
+            keeper = members[0]
+            base_text = day_memories[central]["text"]
+            metadata = _merge_metadata(day_memories[central]["metadata"], members)
+            metadata["base_text"] = base_text
+            update[keeper["id"]] = (merged_text(base_text, metadata), metadata, centroid)
+            remove.update(m["id"] for m in members[1:])
+            stats["merged_groups"] += 1
+            stats["merged_memories"] += len(group)
+            continue
+        memory = members[0]
+        value = memory_value(memory, important_keywords)
+        if value < prune_value:
+            remove.add(memory["id"])
+            stats["pruned"] += 1
+            continue
+        metadata = dict(memory["metadata"], **{CONSOLIDATED_KEY: True})
+        if value < FULL_WEIGHT_VALUE:
+            metadata["weight"] = round(max(MIN_WEIGHT, value / FULL_WEIGHT_VALUE), 2)
+            stats["downweighted"] += 1
+        update[memory["id"]] = (memory["text"], metadata, None)
+
+    stats["removed"] = len(remove)
+    stats["seconds"] = time.perf_counter() - start
+    return {"remove": remove, "update": update, "stats": stats}
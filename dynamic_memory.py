@@ -1,5 +1,8 @@
 # dynamic_memory.py
 import logging
+from collections import deque
+
+from turn_event import TurnEvent
 
 # Get a logger specific to this module, inheriting from 'memory'
 # This ensures its messages go to memory_log_handler (if configured)
@@ -11,9 +14,9 @@ class DynamicMemory:
         self.location = "Science class"  # Initial location
         self.current_action = "Waiting before the project discussion"  # Initial action
         self.last_narrative_action = "*Is waiting impatiently.*"  # Initial narrative action state
-        self.memories = []  # Stores recent conversation turns/events
+        # Stores recent conversation turns/events (TurnEvent); bounded, so the oldest drops off in O(1)
         # Increased to keep more short-term continuity for RP coherence
-        self.max_events = 8
+        self.memories = deque(maxlen=8)
         self.relevance_keywords = [
             "hug", "tears", "sorry", "together", "project", "conflict", "emotion",
             "fault", "explain", "antidepressants", "anxiety", "house", "library",
@@ -26,10 +29,24 @@ class DynamicMemory:
             self.last_narrative_action,
         )
 
+    @property
+    def max_events(self):
+        return self.memories.maxlen
+
+    @max_events.setter
+    def max_events(self, value):
+        self.memories = deque(self.memories, maxlen=value) # Keeps the newest `value` events
+
+    def replace_memories(self, memories):
+        """Replaces the buffer (loading saved state); only the newest max_events are kept."""
+        self.memories = deque(memories, maxlen=self.max_events)
+
     def add_memory(self, memory, active_memory=None):
-        """Adds a memory event and optionally proposes relevant entries to active memory."""
+        """Adds a memory event (TurnEvent, or free text) and optionally proposes relevant entries to active memory."""
+        if isinstance(memory, str):
+            memory = TurnEvent.from_text(memory)
         logger.debug("--- DynamicMemory: add_memory called ---")
-        logger.debug("Input memory: '%s...'", memory[:100])
+        logger.debug("Input memory: %r", memory)
         logger.debug("Current dynamic memory state (before add): %s", self.memories)
 
         is_new_memory_relevant = self._is_relevant(memory)
@@ -37,14 +54,15 @@ class DynamicMemory:
 
         memory_already_in_active = False
         if active_memory is not None:
-            memory_already_in_active = any(memory == m for m in active_memory.memories)
+            memory_already_in_active = active_memory.contains(memory) # Hash lookup, not a scan of the buffer
         logger.debug("Is memory already in active? %s", memory_already_in_active)
 
-        self.memories.append(memory)
-        log_msg_info = f"Added to dynamic: '{memory[:70]}...'"
+        oldest_memory = self.memories[0] if len(self.memories) == self.max_events else None
+        self.memories.append(memory) # A full deque drops its oldest entry
+        log_msg_info = f"Added to dynamic: '{memory.preview(70)}...'"
 
         if is_new_memory_relevant and active_memory is not None and not memory_already_in_active:
-            logger.debug("Proposing relevant memory to active: '%s...'", memory[:70])
+            logger.debug("Proposing relevant memory to active: %r", memory)
             active_memory.add_memory(memory)
             log_msg_info += " | Proposed relevant to active."
         elif is_new_memory_relevant and active_memory is None:
@@ -52,10 +70,9 @@ class DynamicMemory:
         elif is_new_memory_relevant and memory_already_in_active:
             log_msg_info += " | Relevant but already in active."
 
-        if len(self.memories) > self.max_events:
-            oldest_memory = self.memories.pop(0)
-            log_msg_info += f" | Popped oldest due to capacity: '{oldest_memory[:70]}...'"
-            logger.debug("Popped oldest memory: '%s...'", oldest_memory[:100])
+        if oldest_memory is not None:
+            log_msg_info += f" | Popped oldest due to capacity: '{oldest_memory.preview(70)}...'"
+            logger.debug("Popped oldest memory: %r", oldest_memory)
 
         logger.info(log_msg_info)
         logger.debug("Dynamic memory state (after add): %s", self.memories)
@@ -63,9 +80,8 @@ class DynamicMemory:
 
     def _is_relevant(self, memory):
         """Check if a memory is relevant based on keywords."""
-        memory_lower = memory.lower()
-        is_rel = any(keyword in memory_lower for keyword in self.relevance_keywords)
-        logger.debug("Relevance check for '%s...': %s", memory[:50], is_rel)
+        is_rel = memory.mentions(self.relevance_keywords)
+        logger.debug("Relevance check for %r: %s", memory, is_rel)
         return is_rel
 
     def set_last_narrative_action(self, action_text):
@@ -98,5 +114,5 @@ class DynamicMemory:
         return {
             "location": self.location,
             "action": self.current_action,
-            "recent_memories": " | ".join(self.memories[-self.max_events:]),
+            "recent_memories": list(self.memories), # TurnEvents; rendered when the prompt is built
         }
@@ -0,0 +1,117 @@
+# emotion_benchmark.py (Seeded EmotionalCore benchmark and output check against another emotionalcore.py)
+import argparse
+import importlib.util
+import logging
+import random
+import sys
+from time import perf_counter
+
+import emotionalcore
+
+# Get a logger specific to this module
+logger = logging.getLogger('emotional_core.benchmark')
+
+BENCHMARK_MESSAGES = [
+    "I want to hug you, I'm here for you", "My grandmother died last week, the funeral was awful",
+    "You abandoned me, nobody loves me", "Watch out, this place is a danger, a real threat",
+    "It was your fault, you failed the project", "I'm so happy, this is wonderful and great",
+    "Maybe we could plan something for tomorrow", "You have to do it, you must, it's expected",
+    "I feel so ashamed, it's my mistake", "ok", "Let's go to the library together",
+    "That's disgusting and horrible", "I trust you, I feel safe with you", "I hate this, it's unfair",
+    "I don't know, perhaps I could try again", "Thanks, that was a perfect afternoon",
+]
+
+
+class SimulatedClock:
+    """Stands in for the `time` module of an EmotionalCore module while benchmarking, so every run sees the same times."""
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+
+def benchmark_turns(count, seed):
+    """Seeded script of (seconds since the last turn, fatigue, message, context flags) turns."""
+    rng = random.Random(seed)
+    turns = []
+    for _ in range(count):
+        context = {
+            "user_name": "Lin",
+            "location": rng.choice(["public", "home", "school"]),
+            "recent_failure": rng.random() < 0.1,
+            "high_impact_event": rng.random() < 0.1,
+            "social_situation": rng.random() < 0.3,
+            "previous_interaction_negative": rng.random() < 0.2,
+        }
+        if rng.random() < 0.2: context["inappropriate_emotions"] = rng.sample(["anger", "joy", "shame", "fear"], 2)
+        if rng.random() < 0.2: context["interlocutor_emotions"] = {"joy": rng.random(), "fear": rng.random(), "anger": rng.random()}
+        turns.append((rng.choice([5, 60, 600, 3600]), rng.random(), rng.choice(BENCHMARK_MESSAGES), context))
+    return turns
+
+
+def run_turns(module, turns, seed):
+    """Runs `turns` through a new module.EmotionalCore (global random seeded). Returns (per-turn outputs, seconds in process_interaction)."""
+    saved_time, clock = module.time, SimulatedClock()
+    module.time = clock
+    random.seed(seed)
+    try:
+        core = module.EmotionalCore(character_name="Poppy")
+        outputs, elapsed = [], 0.0
+        for seconds, fatigue, message, context in turns:
+            clock.now += seconds
+            core.fatigue_level = fatigue
+            start = perf_counter()
+            guidance = core.process_interaction(message, dict(context))
+            elapsed += perf_counter() - start
+            outputs.append((guidance, dict(core.internal_emotions), dict(core.expressed_emotions), core.facade_intensity))
+    finally:
+        module.time = saved_time
+    return outputs, elapsed
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark EmotionalCore.process_interaction on a seeded script of turns and, "
+                                                 "with --reference, check that another emotionalcore.py gives identical outputs.")
+    parser.add_argument("--reference", help="emotionalcore.py to compare with (e.g. an older revision: git show <rev>:emotionalcore.py > emotionalcore_old.py).")
+    parser.add_argument("--turns", type=int, default=500, help="Turns in the script.")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the script and for the cores' random choices.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per implementation, alternated (the fastest is reported).")
+    return parser.parse_args()
+
+
+def main(args):
+    turns = benchmark_turns(args.turns, args.seed)
+    implementations = {"current": emotionalcore}
+    if args.reference:
+        implementations["reference"] = load_module("emotionalcore_reference", args.reference)
+    outputs, best = {}, {}
+    for _ in range(args.repeat):
+        for name, module in implementations.items():
+            outputs[name], seconds = run_turns(module, turns, args.seed)
+            best[name] = min(seconds, best.get(name, seconds))
+    for name, seconds in best.items():
+        print(f"{name:9s}: {seconds / len(turns) * 1e6:7.1f} us per turn ({len(turns)} turns, best of {args.repeat})")
+    if not args.reference:
+        return 0
+    differing = [i for i, (ours, theirs) in enumerate(zip(outputs["current"], outputs["reference"])) if ours != theirs]
+    max_diff = max(abs(ours[part][emotion] - theirs[part][emotion])
+                   for ours, theirs in zip(outputs["current"], outputs["reference"]) for part in (1, 2) for emotion in ours[part])
+    print(f"speed vs reference: x{best['reference'] / best['current']:.2f}; largest emotion difference: {max_diff:.3g}")
+    if differing:
+        print(f"{len(differing)} of {len(turns)} turns differ (first: turn {differing[0]})")
+        return 1
+    print(f"Outputs identical on all {len(turns)} turns (guidance, internal and expressed emotions, facade).")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s - %(levelname)-8s - %(name)-15s - %(message)s")
+    sys.exit(main(parse_args()))
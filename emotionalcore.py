@@ -1035,8 +1035,8 @@ class EmotionalCore:
         self.relationship_state["conflict_level"] = max(0.0, self.relationship_state["conflict_level"] * 0.8)
         logger.info(f"Conflict level reduced after sleep cycle to: {self.relationship_state['conflict_level']:.2f}")
 
-        # 4. Trigger Memory Consolidation (Conceptual)
-        memory_logger.info("Sleep cycle: Triggering memory consolidation process (conceptual).")
+        # 4. Memory Consolidation: RPLogic starts it right after this (RPLogic.start_consolidation, consolidation.py)
+        memory_logger.info("Sleep cycle: memory consolidation of the day's vector memories follows (RPLogic).")
 
         logger.info("Sleep cycle processing complete.")
 
@@ -1216,7 +1216,7 @@ class EmotionalCore:
     # --- Helper Methods ---
     def _determine_emotional_state(self): # <-- SECTION REVIEWED/KEPT (Logic from your code)
         # (Detailed implementation from the previous version)
-        states = set(); threshold = 0.6; state_mapping = {
+        states = {}; threshold = 0.6; state_mapping = { # dict as an ordered set: mapping order, same every run
             "vulnerability": {"high": "Exposed", "low_safe": "Guarded", "high_safe": "Opening Up"}, "connection": {"high": "Connected", "low": "Isolated"},
             "autonomy": {"high": "In Control", "low": "Powerless"}, "validation": {"high": "Affirmed", "low": "Invalidated"},
             "authenticity": {"high": "Authentic", "low": "Inauthentic"}, "psychological_safety": {"low": "Unsafe"}, "grieving": {"high": "Grieving"},
@@ -1225,14 +1225,14 @@ class EmotionalCore:
         for emotion, mapping in state_mapping.items():
             intensity = self.internal_emotions.get(emotion, 0); safety = self.internal_emotions.get("psychological_safety", 0)
             if "high" in mapping and intensity > threshold:
-                if emotion == "vulnerability" and safety > 0.6: states.add(mapping["high_safe"])
-                else: states.add(mapping["high"])
+                if emotion == "vulnerability" and safety > 0.6: states[mapping["high_safe"]] = None
+                else: states[mapping["high"]] = None
             if "low" in mapping and intensity < (1.0 - threshold):
-                if emotion == "vulnerability" and safety < 0.4: states.add(mapping["low_safe"])
-                else: states.add(mapping["low"])
-        if self.fatigue_level > 0.7: states.add("Fatigued")
-        if not states: states.add("Neutral")
-        return list(states)
+                if emotion == "vulnerability" and safety < 0.4: states[mapping["low_safe"]] = None
+                else: states[mapping["low"]] = None
+        if self.fatigue_level > 0.7: states["Fatigued"] = None
+        if not states: states["Neutral"] = None
+        return list(states) # Insertion order: a set's order varies between runs (hash seed), which would change the prompts
 
     def _determine_attitude(self, context=None, trauma_activation=None): # <-- SECTION REVIEWED/KEPT (Logic from your code)
         # (Detailed implementation from the previous version)
@@ -1285,30 +1285,30 @@ class EmotionalCore:
 
     def _generate_nonverbal_cues(self, trauma_activation=None): # <-- SECTION REVIEWED/KEPT (Logic from your code)
         # (Detailed implementation from the previous version)
-        cues_set = set(); num_cues = 3
+        cues = {}; num_cues = 3 # dict as an ordered set: trauma cues first, then emotion, attitude and default cues
         if trauma_activation and trauma_activation["activated"]:
             ttype = trauma_activation["response_type"]
-            if ttype == "fight": cues_set.update(["Clenched fists", "Challenging stare"]) # ENGLISH TRANSLATION
-            elif ttype == "flight": cues_set.update(["Restlessness", "Looks towards exit"]) # ENGLISH TRANSLATION
-            elif ttype == "freeze": cues_set.update(["Motionless", "Vacant stare"]) # ENGLISH TRANSLATION
-            elif ttype == "fawn": cues_set.update(["Nervous smile", "Nods frequently"]) # ENGLISH TRANSLATION
-            elif ttype == "dissociation": cues_set.update(["Empty stare", "Slow movements"]) # ENGLISH TRANSLATION
+            if ttype == "fight": cues.update(dict.fromkeys(["Clenched fists", "Challenging stare"])) # ENGLISH TRANSLATION
+            elif ttype == "flight": cues.update(dict.fromkeys(["Restlessness", "Looks towards exit"])) # ENGLISH TRANSLATION
+            elif ttype == "freeze": cues.update(dict.fromkeys(["Motionless", "Vacant stare"])) # ENGLISH TRANSLATION
+            elif ttype == "fawn": cues.update(dict.fromkeys(["Nervous smile", "Nods frequently"])) # ENGLISH TRANSLATION
+            elif ttype == "dissociation": cues.update(dict.fromkeys(["Empty stare", "Slow movements"])) # ENGLISH TRANSLATION
         sorted_expressed = sorted(self.expressed_emotions.items(), key=lambda item: abs(item[1] - 0.5), reverse=True)
         # ENGLISH TRANSLATION of cues
         emotion_cue_map = { "anger": ["Frown", "Tight lips"], "fear": ["Wide eyes", "Swallows hard"], "joy": ["Genuine smile", "Bright eyes"], "grieving": ["Teary eyes", "Slumped shoulders"], "shame": ["Avoids eye contact", "Shrinks back"], "disgust": ["Grimace of disgust", "Looks away"], "vulnerability": ["Soft eye contact", "Open posture"], "connection": ["Leans in", "Nods"] }
         for emotion, intensity in sorted_expressed:
-            if intensity > 0.6 and emotion in emotion_cue_map: cues_set.update(random.sample(emotion_cue_map[emotion], min(len(emotion_cue_map[emotion]), 1)))
-            if len(cues_set) >= num_cues: break
-        if len(cues_set) < num_cues:
+            if intensity > 0.6 and emotion in emotion_cue_map: cues.update(dict.fromkeys(random.sample(emotion_cue_map[emotion], min(len(emotion_cue_map[emotion]), 1))))
+            if len(cues) >= num_cues: break
+        if len(cues) < num_cues:
             attitude = self._determine_attitude(None, None)
-            if attitude in ["Dismissive", "Arrogant", "Superior", "Contemptuous"]: cues_set.add("Rolls eyes") # ENGLISH TRANSLATION
-            if attitude in ["Cold", "Aloof", "Indifferent", "Detached"]: cues_set.add("Distant stare") # ENGLISH TRANSLATION
-            if self.facade_intensity > 0.75: cues_set.add("Forced smile") # ENGLISH TRANSLATION
-            if self.fatigue_level > 0.7: cues_set.add("Subtly yawns") # ENGLISH TRANSLATION
+            if attitude in ["Dismissive", "Arrogant", "Superior", "Contemptuous"]: cues["Rolls eyes"] = None # ENGLISH TRANSLATION
+            if attitude in ["Cold", "Aloof", "Indifferent", "Detached"]: cues["Distant stare"] = None # ENGLISH TRANSLATION
+            if self.facade_intensity > 0.75: cues["Forced smile"] = None # ENGLISH TRANSLATION
+            if self.fatigue_level > 0.7: cues["Subtly yawns"] = None # ENGLISH TRANSLATION
         # ENGLISH TRANSLATION of default cues
         default_cues = ["Adjusts clothing", "Shifts weight", "Looks around", "Clears throat", "Plays with hair", "Rubs eyes"]
-        while len(cues_set) < num_cues and default_cues: cue_to_add = random.choice(default_cues); cues_set.add(cue_to_add); default_cues.remove(cue_to_add)
-        return list(cues_set)[:num_cues]
+        while len(cues) < num_cues and default_cues: cue_to_add = random.choice(default_cues); cues[cue_to_add] = None; default_cues.remove(cue_to_add)
+        return list(cues)[:num_cues]
 
     def _determine_tone(self, context=None, trauma_activation=None): # <-- SECTION REVIEWED/KEPT (Logic from your code)
         # (Detailed implementation from the previous version)
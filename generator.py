@@ -1,20 +1,91 @@
 # generator.py (Local Ollama - RAG Tuning v3 - Stricter Output Format - Combined Fatigue/Sleep Logic - Tuned Timeout & Crisis Prompt v3)
-import requests
+import asyncio
+import contextvars
 import logging
 import random
 import json
 import re
+import threading
+import time
 from collections import deque
+from contextlib import contextmanager
+
+import aiohttp
+
+from llm_cache import LLMResponseCache
+from llm_scheduler import FairLLMScheduler, default_num_parallel
+from ollama_pool import OllamaEndpointPool
+from turn_event import render_summary
 
 # Logging setup
 logger = logging.getLogger('generator')
 
-
-# --- Local Generator Class ---
-class RPDialogueGenerator:
-    def __init__(self, model_name, ollama_base_url="http://localhost:11434"):
+# Tabla de rutas: cada tipo de llamada (action, dialogue, summary) con su modelo y opciones.
+# "model": None usa el modelo principal del generador.
+# "stop": secuencias de parada de Ollama; "stop_at_closing_asterisk": corta el stream al cerrar *...*
+DEFAULT_ROUTES = {
+    "action": {
+        "model": None, "max_tokens": 75, "temperature": 0.7, "repeat_penalty": 1.1,
+        # "*" alone would also match the opening asterisk, so only unambiguous endings are used here
+        "stop": ["*\n", "\n\n"],
+        "stop_at_closing_asterisk": True,
+        "hedge": True, # Short call: worth duplicating on a second host when the first is slow
+    },
+    "dialogue": {"model": None, "max_tokens": 400, "temperature": 0.8, "repeat_penalty": 1.1},
+    "summary": {"model": None, "max_tokens": 200, "temperature": 0.3, "repeat_penalty": 1.1},
+}
+ROUTE_LATENCY_WINDOW = 50 # Number of recent latencies kept per route for stats
+CLOSED_ACTION_REGEX = re.compile(r"\*[^*]*\S[^*]*\*") # A complete *action* span
+
+# Presupuesto de latencia por turno y cascada de modelos (primary -> fallback)
+DEFAULT_LATENCY_SLO = {
+    "turn_budget_s": 90.0, # Max wall time for the whole turn (action + dialogue)
+    "call_deadline_s": 45.0, # Max time a non-final tier may spend on one call before cascading
+    "first_token_deadline_s": 15.0, # Max wait for the first streamed token on a non-final tier
+    "min_tokens_per_s": 3.0, # Tokens/sec floor on a non-final tier (checked after grace tokens)
+    "grace_tokens": 8,
+    "fallback_model": None, # Faster model used when the primary misses its deadline
+}
+
+# Per-turn state (session, deadline, tier that answered each route). A ContextVar keeps concurrent turns apart.
+_current_turn = contextvars.ContextVar("rp_generator_turn", default=None)
+
+
+# --- Local Generator Class (asyncio) ---
+class AsyncRPDialogueGenerator:
+    def __init__(self, model_name, ollama_base_url="http://localhost:11434", keep_alive="30m", routes=None, latency_slo=None,
+                 hedge_after_s=0.0, response_cache=None, num_parallel=None):
         self.model_name = model_name
-        self.ollama_url = f"{ollama_base_url.rstrip('/')}/api/chat"
+        # Content-addressed response cache (record/replay); off unless an LLMResponseCache is passed
+        self.response_cache = response_cache or LLMResponseCache(mode="off")
+        # ollama_base_url puede ser una URL o una lista de hosts Ollama (balanceo por carga)
+        # Each host serves num_parallel requests at once (OLLAMA_NUM_PARALLEL); the pool holds a slot per request
+        num_parallel = num_parallel or default_num_parallel()
+        self.pool = OllamaEndpointPool(ollama_base_url, num_parallel=num_parallel)
+        # Fair scheduler: admits up to the pool's total slots, action before dialogue before summary
+        self.scheduler = FairLLMScheduler(max_concurrency=num_parallel * len(self.pool))
+        self.ollama_url = self.pool.endpoints[0].chat_url # First host, kept for single-host callers
+        # Hedging: duplicate "hedge" routes on a second host if the first hasn't answered after this many seconds (0 = off)
+        self.hedge_after_s = hedge_after_s
+        self.hedge_stats = {"hedged": 0, "hedge_wins": 0}
+        self._session = None # aiohttp.ClientSession, created lazily inside the running loop
+        # Routing table: per call type model/options, overrides merged on top of DEFAULT_ROUTES
+        self.routes = {name: dict(options) for name, options in DEFAULT_ROUTES.items()}
+        for name, overrides in (routes or {}).items():
+            self.routes.setdefault(name, {}).update(overrides)
+        self.route_latencies = {name: deque(maxlen=ROUTE_LATENCY_WINDOW) for name in self.routes}
+        # Latency SLO: per-turn budget and the tier cascade used when a model stalls or crawls
+        self.latency_slo = dict(DEFAULT_LATENCY_SLO)
+        self.latency_slo.update(latency_slo or {})
+        self.turn_tiers = {} # Route -> tier that answered in the last finished turn
+        self.tier_history = deque(maxlen=ROUTE_LATENCY_WINDOW)
+        # Early termination counters (stream closed once the requested output is complete)
+        # tokens_saved_upper_bound: max_tokens minus the tokens generated, summed (the model may have ended sooner anyway)
+        self.early_stop_stats = {"early_stops": 0, "stop_sequence_stops": 0, "tokens_saved_upper_bound": 0}
+        # Cuanto tiempo mantiene Ollama el modelo en memoria tras cada llamada
+        self.keep_alive = keep_alive
+        self.last_request_time = 0.0
+        self._keep_alive_task = None
         # Frases alternativas y acciones de fallback
         self.used_phrases = set()
         self.phrase_alternatives = {
@@ -24,51 +95,371 @@ class RPDialogueGenerator:
         }
         self.fallback_actions = ["*Looks around.*", "*Pauses thoughtfully.*", "*Sighs softly.*", "*Shifts weight.*", "*Remains silent for a moment.*"]
         self.fallback_dialogue = "*Poppy shrugs.* 'Uh, somethin's busted. Deal with it.'"
-        logger.debug(f"RPDialogueGenerator (Local Ollama Mode) initialized for model '{model_name}' at {ollama_base_url}")
+        logger.debug(f"AsyncRPDialogueGenerator (Local Ollama Mode) initialized for model '{model_name}' at {ollama_base_url}")
+        route_models = {name: self._route_model(name) for name in self.routes}
+        logger.info(f"Model routes: {route_models}")
+
+    def _route_model(self, route_name):
+        """Returns the model configured for a route, falling back to the main model."""
+        return self.routes.get(route_name, {}).get("model") or self.model_name
+
+    def routed_models(self):
+        """Returns the distinct models referenced by the routing table (main model first)."""
+        models = [self.model_name]
+        for name in self.routes:
+            model = self._route_model(name)
+            if model not in models:
+                models.append(model)
+        return models
+
+    def _get_session(self):
+        """Returns the shared aiohttp session (must be called from the running loop)."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers={"Content-Type": "application/json"})
+        return self._session
+
+    async def warm_up(self, timeout=300):
+        """Preloads every routed model on every Ollama host with empty chat requests. Returns total load time in seconds (None if no host could load them)."""
+        start = time.perf_counter()
+        session = self._get_session()
+        warmed_hosts = 0
+        for endpoint in self.pool.endpoints:
+            host_ok = True
+            for model in self.routed_models():
+                payload = {"model": model, "messages": [], "keep_alive": self.keep_alive}
+                try:
+                    logger.info(f"Warming up model '{model}' on {endpoint.base_url} (keep_alive: {self.keep_alive})...")
+                    model_start = time.perf_counter()
+                    async with session.post(endpoint.chat_url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        response.raise_for_status()
+                        body = await response.json(content_type=None)
+                    self.last_request_time = time.time()
+                    load_duration_ns = body.get("load_duration", 0) if isinstance(body, dict) else 0
+                    logger.info(f"Model '{model}' resident on {endpoint.base_url} after {time.perf_counter() - model_start:.2f}s (Ollama load_duration: {load_duration_ns / 1e9:.2f}s)")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"Model warm-up failed for '{model}' on {endpoint.base_url}: {e!r}")
+                    host_ok = False
+                    break
+                except ValueError as e:
+                    logger.warning(f"Model warm-up for '{model}' returned a non-JSON body: {e}")
+            warmed_hosts += host_ok
+        if not warmed_hosts:
+            return None
+        return time.perf_counter() - start
+
+    def _cascade_tiers(self, route_name):
+        """Returns the (tier_name, model) list tried in order for a route."""
+        tiers = [("primary", self._route_model(route_name))]
+        fallback_model = self.latency_slo.get("fallback_model")
+        if fallback_model and fallback_model != tiers[0][1]:
+            tiers.append(("fallback", fallback_model))
+        return tiers
+
+    def _remaining_budget(self):
+        """Seconds left in the current turn budget (a full budget when called outside a turn)."""
+        turn = _current_turn.get()
+        if turn is None:
+            return self.latency_slo["turn_budget_s"]
+        return max(0.0, turn["deadline"] - time.monotonic())
+
+    async def _call_route(self, route_name, prompt):
+        """Calls Ollama with the model and options configured for `route_name`, cascading to the fallback tier on SLO misses."""
+        route = self.routes.get(route_name)
+        if route is None:
+            logger.warning(f"Unknown route '{route_name}'. Using dialogue route options.")
+            route = self.routes["dialogue"]
+        tiers = self._cascade_tiers(route_name)
+        start = time.perf_counter()
+        response_text = ""
+        answered_by = "none"
+        answered_model = None
+        cache_key = None
+        if self.response_cache.enabled:
+            # Keyed on the primary model so a replay does not depend on which tier answered while recording
+            options = self._build_options(route.get("max_tokens", 400), route.get("temperature", 0.8), route.get("repeat_penalty", 1.1), route.get("stop"))
+            cache_key = LLMResponseCache.make_key(tiers[0][1], options, self._build_messages(prompt))
+            cached = self.response_cache.get(cache_key) # Raises CacheMissError on a replay miss
+            if cached is not None:
+                tiers = [] # Skip the network entirely
+                response_text = cached
+                answered_by = "cache"
+        for position, (tier_name, model) in enumerate(tiers):
+            remaining = self._remaining_budget()
+            if remaining <= 0:
+                logger.warning(f"Turn latency budget exhausted before route '{route_name}' tier '{tier_name}'.")
+                break
+            is_last_tier = position == len(tiers) - 1
+            # Non-final tiers are held to the SLO; the final tier only has to fit in the turn budget
+            deadline = remaining if is_last_tier else min(remaining, self.latency_slo["call_deadline_s"])
+            logger.info(f"Routing '{route_name}' call to {tier_name} model '{model}' (max_tokens: {route.get('max_tokens')}, deadline: {deadline:.1f}s)")
+            use_hedge = route.get("hedge") and self.hedge_after_s > 0 and len(self.pool.healthy_endpoints()) > 1
+            call = self._hedged_call if use_hedge else self._call_ollama_api
+            response_text, status = await call(
+                prompt,
+                route_name=route_name,
+                max_tokens=route.get("max_tokens", 400),
+                temperature=route.get("temperature", 0.8),
+                repeat_penalty=route.get("repeat_penalty", 1.1),
+                model=model,
+                deadline_s=deadline,
+                enforce_slo=not is_last_tier,
+                stop=route.get("stop"),
+                stop_when=self._action_is_complete if route.get("stop_at_closing_asterisk") else None,
+            )
+            if status == "ok" and response_text:
+                answered_by = tier_name
+                answered_model = model
+                break
+            logger.warning(f"Route '{route_name}' {tier_name} tier '{model}' gave up ({status}).")
+        if cache_key and answered_model:
+            self.response_cache.put(cache_key, response_text, route=route_name, model=answered_model, tier=answered_by)
+        elapsed = time.perf_counter() - start
+        self.route_latencies.setdefault(route_name, deque(maxlen=ROUTE_LATENCY_WINDOW)).append(elapsed)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn["tiers"][route_name] = answered_by
+        logger.info(f"Route '{route_name}' answered by tier '{answered_by}' in {elapsed:.2f}s")
+        return response_text
 
-    def _call_ollama_api(self, prompt, max_tokens, temperature, repeat_penalty=1.1):
-        """Helper function to call the Ollama chat API."""
-        messages = [{"role": "user", "content": prompt}]
+    @staticmethod
+    def _build_messages(prompt):
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _build_options(max_tokens, temperature, repeat_penalty, stop=None):
+        """Ollama `options` for a chat call (also part of the response-cache key)."""
+        options = {
+            "temperature": temperature,
+            "num_predict": max_tokens,
+            "repeat_penalty": repeat_penalty
+        }
+        if stop:
+            options["stop"] = list(stop)
+        return options
+
+    async def _hedged_call(self, prompt, **call_kwargs):
+        """Runs `_call_ollama_api` on the least-loaded host and, if it has not answered within `hedge_after_s`, on a second host too. First good answer wins."""
+        first_url = self.pool.pick()
+        first = asyncio.ensure_future(self._call_ollama_api(prompt, base_url=first_url, **call_kwargs))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after_s)
+        if done:
+            return first.result()
+        second_url = self.pool.pick(exclude=[first_url])
+        if second_url is None:
+            return await first
+        logger.info(f"No answer from {first_url} after {self.hedge_after_s:.2f}s. Hedging on {second_url}.")
+        self.hedge_stats["hedged"] += 1
+        second = asyncio.ensure_future(self._call_ollama_api(prompt, base_url=second_url, **call_kwargs))
+        result = ("", "error")
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result[1] == "ok" and result[0]:
+                        if task is second:
+                            self.hedge_stats["hedge_wins"] += 1
+                        logger.info(f"Hedged call answered by {first_url if task is first else second_url}.")
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel() # Cancelling the loser closes its stream, so Ollama stops generating
+
+    def route_stats(self):
+        """Returns per-route latency stats (count, mean, max in seconds) over the recent window."""
+        stats = {}
+        for name, latencies in self.route_latencies.items():
+            if latencies:
+                stats[name] = {
+                    "model": self._route_model(name),
+                    "count": len(latencies),
+                    "mean_s": sum(latencies) / len(latencies),
+                    "max_s": max(latencies),
+                }
+        return stats
+
+    def start_keep_alive(self, interval_seconds=240):
+        """Starts a background task that re-pings the models whenever no request has been sent for `interval_seconds`. Needs a running loop."""
+        if self._keep_alive_task and not self._keep_alive_task.done():
+            logger.debug("Keep-alive task already running.")
+            return
+
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval_seconds)
+                idle = time.time() - self.last_request_time
+                if idle >= interval_seconds:
+                    logger.debug(f"Model idle for {idle:.0f}s. Sending keep-alive ping.")
+                    await self.warm_up(timeout=60)
+
+        self._keep_alive_task = asyncio.get_running_loop().create_task(_loop())
+        logger.info(f"Keep-alive task started (interval: {interval_seconds}s).")
+
+    async def stop_keep_alive(self):
+        """Stops the keep-alive task if running."""
+        if self._keep_alive_task:
+            self._keep_alive_task.cancel()
+            try:
+                await self._keep_alive_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_alive_task = None
+            logger.info("Keep-alive task stopped.")
+
+    @staticmethod
+    def _action_is_complete(text):
+        """True once the streamed text contains a closed *action* span."""
+        return CLOSED_ACTION_REGEX.search(text) is not None
+
+    async def aclose(self):
+        """Stops background work (keep-alive, host probes) and closes the HTTP session."""
+        await self.stop_keep_alive()
+        await asyncio.to_thread(self.pool.stop_probes)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _call_ollama_api(self, prompt, max_tokens, temperature, repeat_penalty=1.1, model=None, deadline_s=300, enforce_slo=False,
+                               stop=None, stop_when=None, base_url=None, route_name="dialogue"):
+        """Waits for a scheduler slot (fair across sessions, by route priority), then streams the call. Same return as `_stream_chat`.
+
+        Time spent queued counts against `deadline_s`.
+        """
+        turn = _current_turn.get()
+        session_key = turn.get("session") if turn else None
+        try:
+            waited = await self.scheduler.acquire(session_key, route_name, timeout=deadline_s)
+        except asyncio.TimeoutError:
+            logger.warning(f"No LLM slot for '{route_name}' call within {deadline_s:.1f}s ({self.scheduler.in_flight} in flight, queued: {self.scheduler.queued()}).")
+            return "", "deadline"
+        try:
+            return await self._stream_chat(prompt, max_tokens, temperature, repeat_penalty=repeat_penalty, model=model,
+                                           deadline_s=max(deadline_s - waited, 0.1), enforce_slo=enforce_slo,
+                                           stop=stop, stop_when=stop_when, base_url=base_url)
+        finally:
+            self.scheduler.release()
+
+    def _record_early_stop(self, model, generated, max_tokens, stop_sequence=False):
+        """Counts a stream that ended before max_tokens: closed by us (`stop_when`) or by an Ollama stop sequence."""
+        saved = max(0, max_tokens - generated)
+        self.early_stop_stats["early_stops"] += 1
+        if stop_sequence:
+            self.early_stop_stats["stop_sequence_stops"] += 1
+        self.early_stop_stats["tokens_saved_upper_bound"] += saved
+        how = "on a stop sequence" if stop_sequence else "by closing the stream"
+        logger.info(f"Early stop for model '{model}' {how} after {generated} tokens (saved up to {saved} of {max_tokens}).")
+
+    async def _stream_chat(self, prompt, max_tokens, temperature, repeat_penalty=1.1, model=None, deadline_s=300, enforce_slo=False,
+                           stop=None, stop_when=None, base_url=None):
+        """Helper coroutine to call the Ollama chat API (streamed). Returns (text, status) where status is ok/deadline/slow/error.
+
+        `stop` is passed to Ollama as stop sequences; `stop_when(text_so_far)` closes the stream early when it returns True.
+        The request goes to `base_url` if given, otherwise to the least-loaded healthy host in the pool, once that host has a free slot.
+        Cancelling the task closes the stream.
+        """
+        model = model or self.model_name
         payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-                "num_predict": max_tokens,
-                "repeat_penalty": repeat_penalty
-            }
+            "model": model,
+            "messages": self._build_messages(prompt),
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": self._build_options(max_tokens, temperature, repeat_penalty, stop),
         }
-        headers = {"Content-Type": "application/json"}
-        response_text = ""
+        chunks = []
+        status = "ok"
+        start = time.monotonic()
+        first_token_time = None
+        token_count = 0 # Streamed chunks: about one token each (exact count in the final chunk's eval_count)
+        first_token_deadline = self.latency_slo["first_token_deadline_s"]
+        read_timeout = min(deadline_s, first_token_deadline) if enforce_slo else deadline_s
+        min_tps = self.latency_slo["min_tokens_per_s"]
+        grace_tokens = self.latency_slo["grace_tokens"]
+        # sock_read bounds a silent stall; the loop below enforces the overall deadline
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=max(read_timeout, 0.1))
+        endpoint_url = base_url
+        session = self._get_session()
         try:
-            logger.info(f"Sending payload to Ollama API (model: {self.model_name}, temp: {temperature}, repeat_penalty: {repeat_penalty})")
-            # Timeout aumentado a 300 segundos
-            response = requests.post(self.ollama_url, headers=headers, json=payload, timeout=300)
-            response.raise_for_status()
-            response_json = response.json()
-            logger.debug(f"Ollama Raw Response: {response_json}")
-
-            if "message" in response_json and "content" in response_json["message"]:
-                 response_text = response_json["message"]["content"].strip()
-                 if not response_text: logger.warning("Ollama API returned empty content.")
-                 else: logger.info(f"Response received successfully from Ollama: '{response_text[:100]}...'")
-            elif "response" in response_json and isinstance(response_json["response"], str): # Handle older format
-                 response_text = response_json["response"].strip()
-                 if not response_text: logger.warning("Ollama API returned empty 'response' field.")
-                 else: logger.info(f"Response received successfully from Ollama (using 'response' field): '{response_text[:100]}...'")
-            elif "error" in response_json: logger.error(f"Ollama API returned an error in response: {response_json['error']}")
-            else: logger.warning(f"Unexpected Ollama response format: {response_json}")
-
-        except requests.exceptions.Timeout: logger.error("Ollama API request timed out.") # Log specific timeout error
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ollama API Request Error: {e}", exc_info=True)
-            status_code = e.response.status_code if e.response is not None else "N/A"
-            response_body = e.response.text if e.response is not None else "N/A"
-            logger.error(f"Ollama Error Details - Status: {status_code}, Response Text: {response_body[:500]}...")
-        except Exception as e: logger.error(f"Unexpected error during Ollama API call: {e}", exc_info=True)
-
-        return response_text
+            async with self.pool.acquire(base_url=base_url, timeout=deadline_s) as endpoint:
+                endpoint_url = endpoint.base_url
+                logger.info(f"Sending payload to Ollama API (host: {endpoint_url}, model: {model}, temp: {temperature}, repeat_penalty: {repeat_penalty})")
+                async with session.post(endpoint.chat_url, json=payload, timeout=timeout) as response:
+                    self.last_request_time = time.time()
+                    if response.status >= 400:
+                        body = await response.text()
+                        logger.error(f"Ollama Error Details - Status: {response.status}, Response Text: {body[:500]}...")
+                        return "", "error"
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            logger.error(f"Ollama API returned an error in response: {chunk['error']}")
+                            status = "error"
+                            break
+                        piece = chunk.get("message", {}).get("content", "") if "message" in chunk else chunk.get("response", "")
+                        if piece:
+                            chunks.append(piece)
+                            token_count += 1
+                            if first_token_time is None:
+                                first_token_time = time.monotonic()
+                        if chunk.get("done"):
+                            # Ollama drops a matched stop sequence: if putting one back completes the output, it ended there
+                            text = "".join(chunks)
+                            if (stop and stop_when is not None and chunk.get("done_reason") == "stop" and not stop_when(text)
+                                    and any(stop_when(text + sequence) for sequence in stop)):
+                                self._record_early_stop(model, chunk.get("eval_count", token_count), max_tokens, stop_sequence=True)
+                            break
+                        if piece and stop_when is not None and stop_when("".join(chunks)):
+                            self._record_early_stop(model, token_count, max_tokens)
+                            break
+                        now = time.monotonic()
+                        if now - start > deadline_s:
+                            status = "deadline"
+                            break
+                        if enforce_slo:
+                            if first_token_time is None and now - start > first_token_deadline:
+                                status = "deadline"
+                                break
+                            if token_count >= grace_tokens and first_token_time is not None:
+                                rate = token_count / max(now - first_token_time, 1e-6)
+                                if rate < min_tps:
+                                    logger.warning(f"Model '{model}' streaming at {rate:.1f} tok/s (< {min_tps}). Cancelling.")
+                                    status = "slow"
+                                    break
+                # Leaving the `async with` block early closes the connection, which makes Ollama stop generating
+
+        except asyncio.TimeoutError:
+            logger.error(f"Ollama stream stalled (model: {model}, no data for {read_timeout:.1f}s).")
+            status = "deadline"
+        except aiohttp.ClientPayloadError as e:
+            logger.error(f"Ollama stream ended before completion (model: {model}, host: {endpoint_url}): {e!r}")
+            status = "error"
+        except aiohttp.ClientConnectionError as e:
+            logger.error(f"Ollama API Connection Error: {e!r}")
+            if endpoint_url:
+                self.pool.mark_unhealthy(endpoint_url, reason=repr(e))
+            status = "error"
+        except aiohttp.ClientError as e:
+            logger.error(f"Ollama API Request Error: {e!r}", exc_info=True)
+            status = "error"
+        except ValueError as e:
+            logger.error(f"Could not decode Ollama stream chunk: {e}")
+            status = "error"
+        except Exception as e:
+            logger.error(f"Unexpected error during Ollama API call: {e}", exc_info=True)
+            status = "error"
+
+        response_text = "".join(chunks).strip()
+        if status != "ok":
+            logger.warning(f"Ollama call to '{model}' on {endpoint_url} ended with status '{status}' after {time.monotonic() - start:.2f}s ({token_count} tokens).")
+            return "", status
+        if not response_text:
+            logger.warning("Ollama API returned empty content.")
+        else:
+            logger.info(f"Response received successfully from Ollama: '{response_text[:100]}...'")
+        return response_text, status
 
     def _get_fatigue_description(self, fatigue_level, is_sleeping, threshold_wake, threshold_sleep):
         """Genera una descripción textual del estado de fatiga."""
@@ -86,9 +477,17 @@ class RPDialogueGenerator:
         else: # Muy exhausto
             return "is feeling extremely exhausted and barely able to keep their eyes open."
 
-    def _generate_narrative_action(self, context):
+    async def generate_narrative_action(self, context):
         """Generates the character's narrative action using Local Ollama API."""
         logger.info("Generating narrative action via Local Ollama...")
+        action_prompt = self._build_action_prompt(context)
+
+        # Llamada a la API
+        generated_text = await self._call_route("action", action_prompt)
+        return self._extract_narrative_action(generated_text)
+
+    def _build_action_prompt(self, context):
+        """Builds the prompt for the narrative-action call."""
         # (Sin cambios significativos, sigue obteniendo info del contexto)
         emotional_guidance = context.get("emotional_guidance", {})
         char_name = context.get('character_name', 'Character')
@@ -123,10 +522,10 @@ class RPDialogueGenerator:
             f"Show progression or reaction. Consider the pending location if set.\n\n"
             f"FINAL INSTRUCTION: Output ONLY the action description enclosed in asterisks (e.g., *She sighs.*). Generate NO other text, reasoning, explanations, or tags before or after the asterisks."
         )
+        return action_prompt
 
-        # Llamada a la API
-        generated_text = self._call_ollama_api(action_prompt, max_tokens=75, temperature=0.7, repeat_penalty=1.1)
-
+    def _extract_narrative_action(self, generated_text):
+        """Pulls the *action* out of the raw model output, falling back to a canned action."""
         # Extracción de acción
         narrative_action = random.choice(self.fallback_actions)
         if generated_text:
@@ -137,6 +536,10 @@ class RPDialogueGenerator:
              elif generated_text.startswith("*") and generated_text.endswith("*"):
                  narrative_action = generated_text
                  logger.info(f"Using action text as is (already wrapped): {narrative_action}")
+             elif generated_text.startswith("*") and generated_text.count("*") == 1 and generated_text.strip("*").strip():
+                 # Ollama strips the matched stop sequence, which can swallow the closing asterisk
+                 narrative_action = f"*{generated_text.strip('*').strip()}*"
+                 logger.info(f"Closed action cut by stop sequence: {narrative_action}")
              else:
                  logger.warning(f"Generated action text missing asterisks or incorrect format (Local): '{generated_text}'. Wrapping first line.")
                  first_line = generated_text.strip().splitlines()[0]
@@ -192,11 +595,11 @@ class RPDialogueGenerator:
              rag_context_str = "None relevant found."
              logger.debug("No relevant RAG memories found to include in prompt.")
 
-         # (Formatear memoria dinámica - sin cambios)
+         # (Formatear memoria dinámica: los TurnEvents se convierten en texto solo aquí)
          dynamic_memory_list = context.get('dynamic_memory', [])
-         dynamic_memory_str = "\n- ".join(dynamic_memory_list) if dynamic_memory_list else 'None'
+         dynamic_memory_str = "\n- ".join(str(event) for event in dynamic_memory_list) if dynamic_memory_list else 'None'
          long_term_summaries = context.get('long_term_summaries', [])
-         long_term_summaries_str = "\n- ".join(long_term_summaries) if long_term_summaries else 'None'
+         long_term_summaries_str = "\n- ".join(render_summary(summary) for summary in long_term_summaries) if long_term_summaries else 'None'
          internal_objective = context.get('internal_objective', 'Maintain continuity and respond in-character.')
 
          # Construir el prompt
@@ -241,27 +644,56 @@ class RPDialogueGenerator:
          return prompt
 
 
-    def generate_response(self, context, image_url=None):
-        """Generates the AI's response using the Local Ollama API."""
+    async def generate_response(self, context, image_url=None):
+        """Generates the AI's response using the Local Ollama API, within the per-turn latency budget."""
+        with self.turn_scope():
+            return await self._generate_turn(context, image_url=image_url)
+
+    @contextmanager
+    def turn_scope(self, session_id=None):
+        """Opens a turn: starts the latency budget and records which tiers answered. Tasks created inside share it.
+
+        `session_id` is the key the scheduler queues this turn's calls under.
+        """
+        turn = {"session": session_id, "deadline": time.monotonic() + self.latency_slo["turn_budget_s"], "tiers": {}}
+        token = _current_turn.set(turn)
+        turn_start = time.perf_counter()
+        try:
+            yield turn
+        finally:
+            _current_turn.reset(token)
+            self.turn_tiers = dict(turn["tiers"])
+            report = {"tiers": self.turn_tiers, "elapsed_s": time.perf_counter() - turn_start}
+            self.tier_history.append(report)
+            logger.info(f"Turn answered by tiers {report['tiers']} in {report['elapsed_s']:.2f}s")
+
+    def tier_stats(self):
+        """Counts how often each tier answered each route over the recent turn window."""
+        counts = {}
+        for report in self.tier_history:
+            for route_name, tier_name in report["tiers"].items():
+                route_counts = counts.setdefault(route_name, {})
+                route_counts[tier_name] = route_counts.get(tier_name, 0) + 1
+        return counts
+
+    async def _generate_turn(self, context, image_url=None):
+        """Runs the action and dialogue calls for one turn."""
         logger.info("--- Starting Local Response Generation ---")
-        emotional_guidance = context.get("emotional_guidance", {})
 
         # STEP 1: Generate Narrative Action via Local API
-        narrative_action = self._generate_narrative_action(context)
+        narrative_action = await self.generate_narrative_action(context)
+
+        # STEP 2-4: Dialogue (or fixed sleeping response) combined with the action
+        return await self.generate_dialogue(context, narrative_action, image_url=image_url)
+
+    async def generate_dialogue(self, context, narrative_action, image_url=None):
+        """Generates the dialogue for an already generated action. Returns (display text, memory text)."""
+        emotional_guidance = context.get("emotional_guidance", {})
 
         # --- Manejo si el personaje está durmiendo ---
         is_sleeping = context.get("is_sleeping", False) # Obtenido de Logic
         if is_sleeping:
-             logger.info(f"{context.get('character_name', 'Character')} is sleeping. Returning fixed sleeping response.")
-             fixed_sleep_responses = [
-                 "*Is fast asleep, breathing softly.*",
-                 "*Seems deeply asleep, unresponsive.*",
-                 "*Mumbles slightly in their sleep but doesn't wake.*",
-                 "*Remains asleep, still and quiet.*"
-             ]
-             # Usar la acción generada (podría ser *stirs slightly*) y añadir diálogo fijo
-             sleep_dialogue = random.choice(fixed_sleep_responses)
-             final_response = f"{narrative_action}\n\n{sleep_dialogue}"
+             final_response = self._sleeping_response(context, narrative_action)
              logger.info("--- Finished Local Response Generation (Sleeping) ---")
              return final_response, final_response # Devuelve lo mismo para ambos valores esperados
         # --- Fin manejo si está durmiendo ---
@@ -274,26 +706,9 @@ class RPDialogueGenerator:
         if image_url:
             logger.warning("Image URL provided, but Local Ollama generator cannot process it directly. Ignoring image.")
 
-        dialogue_text = self.fallback_dialogue
         # Use updated parameters for dialogue generation
-        generated_dialogue = self._call_ollama_api(dialogue_prompt, max_tokens=400, temperature=0.8, repeat_penalty=1.1) # Use adjusted params
-
-        if generated_dialogue:
-            # Limpieza
-            cleaned_dialogue = generated_dialogue.strip()
-            if cleaned_dialogue.startswith('"') and cleaned_dialogue.endswith('"'):
-                 cleaned_dialogue = cleaned_dialogue[1:-1].strip()
-            if "<think>" in cleaned_dialogue.lower() or "</think>" in cleaned_dialogue.lower():
-                 logger.warning("Generated dialogue still contained <think> tags despite prompt instructions. Attempting to strip.")
-                 # Basic stripping - might need refinement
-                 cleaned_dialogue = re.sub(r'<\/?think>', '', cleaned_dialogue, flags=re.IGNORECASE).strip()
-                 if not cleaned_dialogue: # If stripping leaves nothing, use fallback
-                      logger.error("Stripping <think> tags left empty dialogue. Using fallback.")
-                      cleaned_dialogue = self.fallback_dialogue
-            dialogue_text = cleaned_dialogue
-            logger.info(f"Generated dialogue via Local Ollama: '{dialogue_text[:100]}...'")
-        else:
-            logger.warning("Local dialogue generation failed or returned empty. Using fallback dialogue.")
+        generated_dialogue = await self._call_route("dialogue", dialogue_prompt)
+        dialogue_text = self._clean_dialogue(generated_dialogue)
 
         # STEP 4: Combine Action and Dialogue
         final_ai_response = f"{narrative_action}\n\n{dialogue_text}"
@@ -301,3 +716,75 @@ class RPDialogueGenerator:
         logger.info("--- Finished Local Response Generation ---")
         # Asegúrate de devolver dos valores si rp_response.py espera una tupla
         return final_ai_response, final_ai_response
+
+    def _sleeping_response(self, context, narrative_action):
+        """Fixed response used while the character is asleep."""
+        logger.info(f"{context.get('character_name', 'Character')} is sleeping. Returning fixed sleeping response.")
+        fixed_sleep_responses = [
+            "*Is fast asleep, breathing softly.*",
+            "*Seems deeply asleep, unresponsive.*",
+            "*Mumbles slightly in their sleep but doesn't wake.*",
+            "*Remains asleep, still and quiet.*"
+        ]
+        # Usar la acción generada (podría ser *stirs slightly*) y añadir diálogo fijo
+        sleep_dialogue = random.choice(fixed_sleep_responses)
+        return f"{narrative_action}\n\n{sleep_dialogue}"
+
+    def _clean_dialogue(self, generated_dialogue):
+        """Strips quotes and stray <think> tags from the raw dialogue, falling back to the canned line."""
+        if not generated_dialogue:
+            logger.warning("Local dialogue generation failed or returned empty. Using fallback dialogue.")
+            return self.fallback_dialogue
+        # Limpieza
+        cleaned_dialogue = generated_dialogue.strip()
+        if cleaned_dialogue.startswith('"') and cleaned_dialogue.endswith('"'):
+             cleaned_dialogue = cleaned_dialogue[1:-1].strip()
+        if "<think>" in cleaned_dialogue.lower() or "</think>" in cleaned_dialogue.lower():
+             logger.warning("Generated dialogue still contained <think> tags despite prompt instructions. Attempting to strip.")
+             # Basic stripping - might need refinement
+             cleaned_dialogue = re.sub(r'<\/?think>', '', cleaned_dialogue, flags=re.IGNORECASE).strip()
+             if not cleaned_dialogue: # If stripping leaves nothing, use fallback
+                  logger.error("Stripping <think> tags left empty dialogue. Using fallback.")
+                  cleaned_dialogue = self.fallback_dialogue
+        logger.info(f"Generated dialogue via Local Ollama: '{cleaned_dialogue[:100]}...'")
+        return cleaned_dialogue
+
+
+# --- Blocking wrapper (compatibility) ---
+class RPDialogueGenerator:
+    """Blocking front for AsyncRPDialogueGenerator: runs it on a private event-loop thread."""
+
+    def __init__(self, *args, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="generator-loop", daemon=True)
+        self._loop_thread.start()
+        self._impl = AsyncRPDialogueGenerator(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined on the wrapper (model_name, routes, stats, pool, ...)
+        if name == "_impl":
+            raise AttributeError(name)
+        return getattr(self._impl, name)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def generate_response(self, context, image_url=None):
+        return self._run(self._impl.generate_response(context, image_url=image_url))
+
+    def warm_up(self, timeout=300):
+        return self._run(self._impl.warm_up(timeout=timeout))
+
+    def start_keep_alive(self, interval_seconds=240):
+        self._loop.call_soon_threadsafe(self._impl.start_keep_alive, interval_seconds)
+
+    def stop_keep_alive(self):
+        self._run(self._impl.stop_keep_alive())
+
+    def close(self):
+        """Stops background work and the private event loop."""
+        if not self._loop.is_running():
+            return
+        self._run(self._impl.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join(timeout=5)
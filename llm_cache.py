@@ -0,0 +1,92 @@
+# llm_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Get a logger specific to this module, inheriting from 'generator'
+logger = logging.getLogger('generator.cache')
+
+CACHE_MODES = ("off", "record", "replay")
+
+
+class CacheMissError(LookupError):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+class LLMResponseCache:
+    def __init__(self, directory="llm_cache", mode="off"):
+        """
+        On-disk cache of LLM responses, addressed by a hash of model, options and messages.
+
+        Modes:
+            off: never read or write.
+            record: serve recorded responses and write every new one through to disk.
+            replay: serve recorded responses only; a miss raises CacheMissError.
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode '{mode}'. Expected one of {CACHE_MODES}.")
+        self.directory = directory
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+        logger.info("LLMResponseCache initialized (mode: %s, directory: %s)", self.mode, os.path.abspath(self.directory))
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    @staticmethod
+    def make_key(model, options, messages):
+        """SHA-256 of the canonical JSON of the request fields that determine the output."""
+        canonical = json.dumps({"model": model, "options": options, "messages": messages}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        # Two-character fan-out keeps directories small on long recordings
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Returns the recorded response text, or None on a miss (CacheMissError in replay mode)."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with self._lock:
+                self.stats["hits"] += 1
+            return entry["response"]
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, KeyError, OSError) as e:
+            logger.warning("Ignoring unreadable cache entry '%s': %s", path, e)
+        with self._lock:
+            self.stats["misses"] += 1
+        if self.mode == "replay":
+            raise CacheMissError(f"No recorded LLM response for key {key} (cache: {self.directory}).")
+        return None
+
+    def put(self, key, response, **metadata):
+        """Writes a response (record mode only). Extra metadata (model that answered, route...) is stored alongside."""
+        if self.mode != "record":
+            return
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        entry = {"response": response, "recorded_at": time.time(), **metadata}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            with self._lock:
+                self.stats["writes"] += 1
+        except OSError as e:
+            logger.error("Could not write cache entry '%s': %s", path, e)
+            if os.path.exists(temp_path):
+                try: os.remove(temp_path)
+                except OSError: pass
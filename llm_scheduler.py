@@ -0,0 +1,136 @@
+# llm_scheduler.py
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+# Get a logger specific to this module, inheriting from 'generator'
+logger = logging.getLogger('generator.scheduler')
+
+# Lower value = served first. Routes not listed here share the dialogue class.
+ROUTE_PRIORITIES = {
+    "action": 0, # Short interactive call, the user is waiting on it
+    "dialogue": 1,
+    "summary": 2, # Background bookkeeping
+}
+DEFAULT_PRIORITY = ROUTE_PRIORITIES["dialogue"]
+QUEUE_DELAY_WINDOW = 200 # Recent queueing delays kept per route for stats
+BACKGROUND_KEY = "_background" # Scheduling key for calls made outside a session's turn
+
+
+def default_num_parallel():
+    """Requests one Ollama server handles at once: OLLAMA_NUM_PARALLEL if set, else 1."""
+    try:
+        return max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "1")))
+    except ValueError:
+        logger.warning("Ignoring invalid OLLAMA_NUM_PARALLEL=%r.", os.getenv("OLLAMA_NUM_PARALLEL"))
+        return 1
+
+
+class FairLLMScheduler:
+    def __init__(self, max_concurrency=1, priorities=None):
+        """
+        Admission control in front of the Ollama calls.
+
+        At most `max_concurrency` requests are in flight; the rest wait. A freed slot goes to the
+        highest priority class with waiters (see ROUTE_PRIORITIES) and, inside a class, round-robin
+        across sessions, so one session's long calls cannot starve another's short ones.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.priorities = dict(ROUTE_PRIORITIES if priorities is None else priorities)
+        self.in_flight = 0
+        self._queues = {} # priority -> OrderedDict(session key -> deque of (route, future)), in round-robin order
+        self.queue_delays = {} # route -> deque of recent waits (seconds)
+        self.stats = {"admitted": 0, "had_to_wait": 0, "timeouts": 0}
+
+    def priority(self, route_name):
+        return self.priorities.get(route_name, DEFAULT_PRIORITY)
+
+    async def acquire(self, session_key, route_name, timeout=None):
+        """Waits for a slot (asyncio.TimeoutError after `timeout` seconds). Returns the seconds spent queued."""
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        sessions = self._queues.setdefault(self.priority(route_name), OrderedDict())
+        sessions.setdefault(session_key or BACKGROUND_KEY, deque()).append((route_name, future))
+        self._dispatch()
+        if not future.done():
+            self.stats["had_to_wait"] += 1
+            try:
+                await asyncio.wait_for(future, timeout)
+            except BaseException as e:
+                if future.done() and not future.cancelled():
+                    self.release() # Granted just as we gave up: hand the slot on
+                # A cancelled future stays queued and is skipped by _dispatch
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                raise
+        waited = time.monotonic() - start
+        self.stats["admitted"] += 1
+        self.queue_delays.setdefault(route_name, deque(maxlen=QUEUE_DELAY_WINDOW)).append(waited)
+        if waited > 0.5:
+            logger.info("'%s' call for '%s' waited %.2fs for an LLM slot (%d in flight).", route_name, session_key, waited, self.in_flight)
+        return waited
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _next_waiter(self):
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            while sessions:
+                session_key, waiters = next(iter(sessions.items()))
+                while waiters and waiters[0][1].done():
+                    waiters.popleft() # Cancelled or timed out while queued
+                if not waiters:
+                    del sessions[session_key]
+                    continue
+                _, future = waiters.popleft()
+                if waiters:
+                    sessions.move_to_end(session_key) # Round-robin: this session goes to the back of its class
+                else:
+                    del sessions[session_key]
+                return future
+        return None
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrency:
+            future = self._next_waiter()
+            if future is None:
+                break
+            self.in_flight += 1
+            future.set_result(None)
+
+    def queued(self):
+        """Waiting requests per route."""
+        counts = {}
+        for sessions in self._queues.values():
+            for waiters in sessions.values():
+                for route_name, future in waiters:
+                    if not future.done():
+                        counts[route_name] = counts.get(route_name, 0) + 1
+        return counts
+
+    def delay_stats(self):
+        """Queueing delay per route (count, mean, p95, max in seconds) over the recent window."""
+        stats = {}
+        for route_name, delays in self.queue_delays.items():
+            if delays:
+                ordered = sorted(delays)
+                stats[route_name] = {
+                    "count": len(ordered),
+                    "mean_s": sum(ordered) / len(ordered),
+                    "p95_s": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                    "max_s": ordered[-1],
+                }
+        return stats
+
+    def snapshot(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued(),
+            "queue_delay": self.delay_stats(),
+            **self.stats,
+        }
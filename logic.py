@@ -6,6 +6,8 @@ import datetime
 import json # Needed for saving/loading state
 import os   # Needed for checking if save file exists
 import math # Necesario para math.ceil si se usa en tiempo
+import threading
+import sqlite3
 
 # Import VectorMemoryStore for RAG
 try:
@@ -15,6 +17,16 @@ except ImportError:
     logging.critical("Failed to import VectorMemoryStore from vector_memory.py. RAG features disabled.")
     VectorMemoryStore = None # Set to None if import fails
 
+from autosaver import AUTOSAVE_DEBOUNCE_S, Autosaver
+from turn_journal import TURN_JOURNAL_FILE, TurnJournal
+from sqlite_store import STATE_DB_FILE, STORAGE_BACKENDS, SQLiteStateStore
+from summarizer import SUMMARIZERS, ExtractiveSummarizer
+from summary_index import LTM_SUMMARIES_IN_CONTEXT, LongTermSummaryIndex
+from consolidation import CONSOLIDATED_KEY, plan_consolidation
+from save_slots import SLOTS_DIR, SaveSlots
+from turn_event import TurnEvent, summary_from_data, summary_to_data
+from long_term_memory import LEGACY_LONG_TERM_MEMORY_SUFFIX, decode_summary, encode_summary
+
 # Get loggers
 logic_logger = logging.getLogger('logic')
 memory_logger = logging.getLogger('memory.logic_interface') # Specific logger for memory actions here
@@ -32,15 +44,47 @@ SLEEP_END_HOUR = 7 # Hora límite para intentar dormir (7 AM)
 SAVE_STATE_FILE = "save_state.json" # For general state (time, explicit state, dynamic mem, sleep state)
 VECTOR_INDEX_FILE = "memory_index.faiss" # For FAISS index
 VECTOR_DATA_FILE = "memory_data.json" # For FAISS data mapping
+SNAPSHOT_EVERY_TURNS = 20 # Save without waiting for the autosave debounce after this many journaled turns (bounds replay time)
 
 class RPLogic:
-    def __init__(self, character_memory, active_memory, user_memory, emotional_core, dynamic_memory):
+    def __init__(self, character_memory, active_memory, user_memory, emotional_core, dynamic_memory, state_dir=None,
+                 snapshot_every=SNAPSHOT_EVERY_TURNS, autosave_debounce_s=AUTOSAVE_DEBOUNCE_S, storage="files",
+                 summarizer="extractive"):
         self.character_memory = character_memory
+        # Directorio de estado por sesión (None = directorio actual, como antes)
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self.save_state_file = self._state_path(SAVE_STATE_FILE)
+        self.vector_index_file = self._state_path(VECTOR_INDEX_FILE)
+        self.vector_data_file = self._state_path(VECTOR_DATA_FILE)
+        # Write-ahead journal: every committed turn is appended here; the debounced autosaver writes the snapshot
+        self.journal = TurnJournal(self._state_path(TURN_JOURNAL_FILE))
+        self.journal_seq = 0 # Sequence number of the last journaled turn (saved with the snapshot)
+        self.turns_since_snapshot = 0
+        self.snapshot_every = snapshot_every
+        self.autosave_debounce_s = autosave_debounce_s
+        self._last_state_json = None # Last save_state.json contents written (unchanged state is not rewritten)
+        # storage="sqlite": state, LTM and vector memories live in one WAL database, committed once per turn
+        # (replaces the JSON/FAISS files, the journal and the autosaver; the files are imported on first use)
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown storage backend '{storage}' (expected one of {STORAGE_BACKENDS})")
+        self.storage = storage
+        self.store = SQLiteStateStore(self._state_path(STATE_DB_FILE)) if storage == "sqlite" else None
+        self._store_synced = {"vectors": 0, "ltm": 0} # Rows already in the database
+        self.slots = SaveSlots(self._state_path(SLOTS_DIR)) # Named save slots (rewind / branch)
+        # summarizer="extractive": LTM summaries are the batch's most representative sentences (needs the vector store's model);
+        # "keywords": whole turns picked by keyword, as before
+        if summarizer not in SUMMARIZERS:
+            raise ValueError(f"Unknown summarizer '{summarizer}' (expected one of {SUMMARIZERS})")
+        self.summarizer_name = summarizer
+        self._init_autosave()
         self.active_memory = active_memory
         self.long_term_memory = None
         self.long_term_memory_legacy = None
-        if hasattr(self.active_memory, 'long_term_file') and self.active_memory.long_term_file:
-             self.long_term_memory_legacy = self.active_memory.long_term_file
+        if hasattr(self.active_memory, 'long_term_file') and self.active_memory.long_term_file is not None:
+             self.long_term_memory_legacy = self.active_memory.long_term_file # Append-only: each summary is on disk once added
+        self.summary_index = LongTermSummaryIndex() # LTM summaries ranked against the turn's RAG query
 
         self.user_memory = user_memory
         self.dynamic_memory = dynamic_memory
@@ -50,16 +94,7 @@ class RPLogic:
 
         # --- Vector Memory (RAG) Initialization ---
         self.vector_memory = None
-        if VectorMemoryStore:
-            try:
-                self.logger.info("Initializing Vector Memory Store for RAG...")
-                self.vector_memory = VectorMemoryStore(model_name='all-MiniLM-L6-v2')
-                self.vector_memory.load_memory(index_path=VECTOR_INDEX_FILE, data_path=VECTOR_DATA_FILE)
-            except Exception as e:
-                self.logger.error(f"Failed to initialize or load VectorMemoryStore: {e}", exc_info=True)
-                self.vector_memory = None
-        else:
-            self.logger.warning("VectorMemoryStore class not available. RAG features will be disabled.")
+        self._init_vector_memory()
 
         # --- Default Initial State ---
         self.current_roleplay_time = datetime.datetime(2025, 4, 16, 14, 0, 0)
@@ -79,7 +114,8 @@ class RPLogic:
         # --- Fin Variables Ciclo ---
 
         # --- Load General State (overwrites defaults) ---
-        self._load_state() # Carga tiempo, estado explícito, memoria dinámica, estado de sueño, etc.
+        self._load_state() # Carga tiempo, estado explícito, memoria dinámica, estado de sueño, etc. y reaplica el journal
+        self._sync_summary_index()
 
         # Ensure dynamic memory has initial values if not loaded
         if self.dynamic_memory:
@@ -104,96 +140,226 @@ class RPLogic:
                          self.is_sleeping, initial_fatigue)
 
 
+    def _init_vector_memory(self):
+        """Creates the vector store and loads its index from this session's state files (also used after rehydrating a snapshot)."""
+        self.vector_memory = None
+        if VectorMemoryStore:
+            try:
+                self.logger.info("Initializing Vector Memory Store for RAG...")
+                self.vector_memory = VectorMemoryStore(model_name='all-MiniLM-L6-v2')
+                if self.store is not None and self.store.has_state():
+                    saved_state = self.store.load_state() or {}
+                    self.vector_memory.load_rows(self.store.vector_rows(), next_id=int(saved_state.get("vector_next_id", 0)))
+                    self._store_synced["vectors"] = len(self.vector_memory.memory_data)
+                else:
+                    self.vector_memory.load_memory(index_path=self.vector_index_file, data_path=self.vector_data_file)
+            except Exception as e:
+                self.logger.error(f"Failed to initialize or load VectorMemoryStore: {e}", exc_info=True)
+                self.vector_memory = None
+        else:
+            self.logger.warning("VectorMemoryStore class not available. RAG features will be disabled.")
+        self._attach_summarizer()
+
+
+    def _attach_summarizer(self):
+        """Gives active memory an extractive summarizer bound to the current vector store (keyword selection without one)."""
+        if self.active_memory is None or not hasattr(self.active_memory, 'summarizer'):
+            return
+        if self.summarizer_name == "extractive" and self.vector_memory:
+            self.active_memory.summarizer = ExtractiveSummarizer(self.vector_memory, sentences=self.active_memory.summary_size,
+                                                                 important_keywords=self.active_memory.important_keywords)
+        else:
+            self.active_memory.summarizer = None
+
+
+    def _sync_summary_index(self):
+        """Adds the long-term summaries the summary index does not hold yet (all of them after a load, else the newest)."""
+        if self.long_term_memory_legacy is None or not self.vector_memory:
+            return
+        try:
+            self.summary_index.sync(self.long_term_memory_legacy, self.vector_memory)
+        except Exception as e:
+            self.logger.error("Failed to update the long-term summary index: %s", e, exc_info=True)
+            self.summary_index.reset() # Rebuilt at the next sync; until then the newest summaries are used
+
+
+    def _init_autosave(self):
+        """Locks and the debounced autosaver (not pickled; recreated when a session snapshot is loaded)."""
+        self._state_lock = threading.RLock() # Held while a turn mutates state and while a save copies it
+        self._save_lock = threading.Lock() # One save at a time (autosaver thread vs explicit saves)
+        self.autosaver = Autosaver(self._autosave, debounce_s=self.autosave_debounce_s, name=f"autosave-{self.state_dir or 'default'}")
+        self._consolidation_thread = None # Background sleep-time consolidation pass (see start_consolidation)
+
+
+    def __getstate__(self):
+        self.wait_for_consolidation() # A pass swaps the vector store's index: let it finish before copying
+        state = self.__dict__.copy()
+        for name in ("_state_lock", "_save_lock", "autosaver", "_consolidation_thread"):
+            state.pop(name, None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_autosave()
+
+
+    def close(self):
+        """Stops the autosaver and saves everything synchronously (call on shutdown)."""
+        self.wait_for_consolidation()
+        self.autosaver.stop(flush=False)
+        self._save_state()
+        if self.store is not None:
+            self.store.close()
+
+
+    def start_consolidation(self):
+        """Starts a background consolidation pass over the vector memories added since the last one (on falling asleep).
+
+        Returns the thread, or None when there is no vector store or a pass is still running.
+        """
+        if not self.vector_memory or self.vector_memory.index is None:
+            return None
+        if self._consolidation_thread is not None and self._consolidation_thread.is_alive():
+            self.logger.info("A memory consolidation pass is still running. Not starting another.")
+            return None
+        self._consolidation_thread = threading.Thread(target=self._consolidate, name=f"consolidate-{self.state_dir or 'default'}", daemon=True)
+        self._consolidation_thread.start()
+        return self._consolidation_thread
+
+
+    def wait_for_consolidation(self, timeout=None):
+        thread = getattr(self, "_consolidation_thread", None)
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+
+
+    def _consolidate(self):
+        """Merges near-duplicate memories of the day, prunes/downweights low-value ones and compacts the index.
+
+        Planning runs outside the state lock (turns go on meanwhile); memories added in between are not in the
+        plan and stay for the next pass. Returns the plan's stats, or None on error.
+        """
+        try:
+            with self._state_lock:
+                vector_memory = self.vector_memory
+                rows = vector_memory.rows_since(0)
+                keywords = list(self.active_memory.important_keywords) if self.active_memory else []
+            day_rows = [row for row in rows if not (row[0].get("metadata") or {}).get(CONSOLIDATED_KEY)]
+            older_rows = [row for row in rows if (row[0].get("metadata") or {}).get(CONSOLIDATED_KEY)]
+            plan = plan_consolidation(day_rows, older_rows, important_keywords=keywords)
+            if plan["remove"] or plan["update"]:
+                with self._state_lock:
+                    if vector_memory is not self.vector_memory:
+                        self.logger.info("Vector store replaced during consolidation (slot load?). Discarding the pass.")
+                        return None
+                    vector_memory.compact(plan["remove"], plan["update"])
+                    if self.store is not None:
+                        self._sync_store(full=True)
+                    else:
+                        self.autosaver.mark_dirty()
+            memory_logger.info("Sleep consolidation: %s", plan["stats"])
+            return plan["stats"]
+        except Exception as e:
+            self.logger.error("Memory consolidation failed: %s", e, exc_info=True)
+            return None
+
+
+    def _slot_files(self):
+        """State files a save slot holds: (hard-linkable files, files written in place)."""
+        if self.store is not None:
+            return [], []
+        shared = [self.save_state_file, self.vector_index_file, self.vector_data_file]
+        if self.long_term_memory_legacy is not None:
+            shared.append(self.long_term_memory_legacy.storage_file)
+        return shared, [self.journal.rotated_path, self.journal.path]
+
+
+    def save_slot(self, name, note=None):
+        """Saves everything and records it as save slot `name` (replacing it). Returns the slot metadata."""
+        self._save_state()
+        with self._save_lock, self._state_lock:
+            meta = {
+                "turn": self.journal_seq,
+                "roleplay_time": self.current_roleplay_time.isoformat(),
+                "location": self.dynamic_memory.location if self.dynamic_memory else None,
+                "topic": self.current_topic_focus,
+                "storage": self.storage,
+                "note": note,
+            }
+            if self.store is not None:
+                # The database is written in place, so the slot gets a full (online backup) copy
+                return self.slots.save(name, writers={STATE_DB_FILE: self.store.backup}, meta=meta)
+            shared, copied = self._slot_files()
+            return self.slots.save(name, shared=shared, copied=copied, meta=meta)
+
+
+    def load_slot(self, name):
+        """Rewinds to save slot `name`: its files replace the live ones and state, vector store and LTM are reloaded.
+
+        Changes since the slot was saved are lost (save another slot first to keep them). Returns the slot metadata.
+        """
+        with self._save_lock, self._state_lock:
+            if self.store is not None:
+                self.store.close()
+                targets = {filename: self._state_path(filename) for filename in (STATE_DB_FILE, STATE_DB_FILE + "-wal", STATE_DB_FILE + "-shm")}
+            else:
+                shared, copied = self._slot_files()
+                targets = {os.path.basename(path): path for path in shared + copied}
+                if self.long_term_memory_legacy is not None:
+                    # Slots saved before the JSONL format hold the whole-list file (imported by reload())
+                    legacy_path = os.path.splitext(self.long_term_memory_legacy.storage_file)[0] + LEGACY_LONG_TERM_MEMORY_SUFFIX
+                    targets[os.path.basename(legacy_path)] = legacy_path
+            meta = self.slots.restore(name, targets)
+            self.journal_seq = 0
+            self.turns_since_snapshot = 0
+            self._last_state_json = None
+            self._store_synced = {"vectors": 0, "ltm": 0}
+            ltm = self.long_term_memory_legacy
+            if ltm is not None:
+                ltm.reload()
+            self._init_vector_memory()
+            self._load_state()
+            self.summary_index.reset()
+            self._sync_summary_index()
+        self.logger.info("Rewound to save slot '%s' (turn %s, RP Time: %s).", name, meta.get("turn"), meta.get("roleplay_time"))
+        return meta
+
+
+    def list_slots(self):
+        return self.slots.list()
+
+
+    def branch(self, from_slot, state_dir):
+        """Starts a new session state directory from save slot `from_slot` (open an RPLogic on `state_dir` to play it)."""
+        return self.slots.branch(from_slot, state_dir)
+
+
+    def _state_path(self, filename):
+        """Path of a state file inside this session's state directory."""
+        return os.path.join(self.state_dir, filename) if self.state_dir else filename
+
+
     def _load_state(self):
-        """Loads general state (time, explicit state, dynamic memory, sleep cycle state) from JSON."""
-        if os.path.exists(SAVE_STATE_FILE):
-            self.logger.info("Save file '%s' found. Attempting to load general state.", SAVE_STATE_FILE)
+        """Loads general state (time, explicit state, dynamic memory, sleep cycle state) from JSON, then replays the turn journal."""
+        if self.store is not None and self._load_state_from_store():
+            return
+        # Past here the store (if any) holds no state yet, so importing the files into it below overwrites nothing
+        if os.path.exists(self.save_state_file):
+            self.logger.info("Save file '%s' found. Attempting to load general state.", self.save_state_file)
             try:
-                with open(SAVE_STATE_FILE, 'r', encoding='utf-8') as f:
+                with open(self.save_state_file, 'r', encoding='utf-8') as f:
                     state_data = json.load(f)
                 self.logger.debug("Loaded raw state data: %s", state_data)
 
-                # Restore Time
-                time_str = state_data.get("current_roleplay_time")
-                if time_str:
-                    try:
-                        time_str_clean = time_str.split('+')[0].split('Z')[0].split('.')[0]
-                        self.current_roleplay_time = datetime.datetime.fromisoformat(time_str_clean)
-                        self.logger.info("Loaded roleplay time: %s", self.current_roleplay_time.strftime("%Y-%m-%d %H:%M:%S"))
-                    except ValueError as time_err:
-                        self.logger.error("Failed to parse saved roleplay time '%s': %s. Using default.", time_str, time_err)
-                        self.current_roleplay_time = datetime.datetime(2025, 4, 16, 14, 0, 0)
-
-                # Restore Dynamic Memory State
-                if self.dynamic_memory:
-                    last_action = state_data.get("last_narrative_action")
-                    location = state_data.get("location")
-                    current_action = state_data.get("current_action")
-                    if last_action is not None: self.dynamic_memory.last_narrative_action = last_action; self.logger.info("Loaded last narrative action.")
-                    if location is not None: self.dynamic_memory.location = location; self.logger.info("Loaded location: %s", location)
-                    if current_action is not None: self.dynamic_memory.current_action = current_action; self.logger.info("Loaded current action (task): %s", current_action)
-                    self.dynamic_memory.memories = state_data.get("dynamic_memory", [])
-                    self.logger.info("Loaded dynamic memory list (%d items).", len(self.dynamic_memory.memories))
-                else: self.logger.error("Cannot load dynamic memory state: dynamic_memory object missing.")
-
-                # Load Explicit State Variables
-                self.pending_location_target = state_data.get("pending_location_target", None)
-                self.current_topic_focus = state_data.get("current_topic_focus", "Unknown / Resumed")
-                self.logger.info("Loaded explicit state - Pending Location: %s, Topic Focus: %s", self.pending_location_target, self.current_topic_focus)
-
-                # Load user memory history
-                if self.user_memory:
-                    user_history = state_data.get("user_memory_history", [])
-                    if isinstance(user_history, list): self.user_memory.history = user_history
-                    else: self.logger.warning("Loaded user_memory_history is not a list."); self.user_memory.history = []
-                    self.logger.info("Loaded user memory history (%d items).", len(self.user_memory.history))
-                else: self.logger.error("Cannot load user memory history: user_memory object missing.")
-
-                # --- Cargar Estado del CICLO de Sueño/Vigilia (Controlado por Logic) ---
-                self.hours_awake = float(state_data.get("hours_awake", 0.0))
-                self.is_sleeping = bool(state_data.get("is_sleeping", False))
-                self.hours_slept = float(state_data.get("hours_slept", 0.0))
-                self.logger.info("Loaded sleep cycle state - Sleeping: %s, Awake: %.1f hrs, Slept: %.1f hrs",
-                                 self.is_sleeping, self.hours_awake, self.hours_slept)
-                # --- Fin Carga Ciclo ---
-
-                # Load Emotional Core State (incluyendo fatigue_level desde aquí)
-                if self.emotional_core:
-                    emo_state = state_data.get("emotional_core_state", {})
-                    if emo_state:
-                        self.logger.debug("Loading emotional core state attributes: %s", emo_state)
-                        # Carga fatiga y tiempo de sueño (si EC aún lo usa internamente)
-                        try:
-                             # Carga fatiga directamente al atributo de EC
-                             self.emotional_core.fatigue_level = float(emo_state.get("fatigue_level", getattr(self.emotional_core, 'fatigue_level', 0.0)))
-                             self.logger.info("Loaded fatigue level into EC: %.1f", self.emotional_core.fatigue_level)
-                        except (AttributeError, ValueError, KeyError) as fatigue_err: self.logger.warning("Could not load/convert 'fatigue_level' for EC: %s", fatigue_err)
-
-                        # Carga los demás atributos como los tenías
-                        try:
-                            default_trust = getattr(self.emotional_core, 'current_trust', 0.5)
-                            default_intimacy = getattr(self.emotional_core, 'current_intimacy', 0.1)
-                            self.emotional_core.current_trust = float(emo_state.get("current_trust", default_trust))
-                            self.emotional_core.current_intimacy = float(emo_state.get("current_intimacy", default_intimacy))
-                        except (AttributeError, ValueError) as rel_err: self.logger.warning("Could not load/convert 'current_trust' or 'current_intimacy': %s", rel_err)
-
-                        loaded_emotions = emo_state.get("internal_emotions_detailed")
-                        if isinstance(loaded_emotions, dict): self.emotional_core.internal_emotions_detailed = loaded_emotions
-                        else: self.logger.warning("Loaded internal_emotions_detailed is not a dictionary.")
-
-                        loaded_personality = emo_state.get("personality_traits")
-                        if isinstance(loaded_personality, dict): self.emotional_core.personality_traits = loaded_personality
-                        else: self.logger.warning("Loaded personality_traits is not a dictionary.")
-
-                        self.emotional_core.attachment_style = emo_state.get("attachment_style", getattr(self.emotional_core, 'attachment_style', 'Unknown'))
-                        self.logger.info("Loaded other emotional state attributes (trust, intimacy, emotions, personality, attachment).")
-                else: self.logger.error("Cannot load emotional state: emotional_core object missing.")
+                self._apply_state(state_data)
+                self.journal_seq = int(state_data.get("journal_seq", 0))
 
                 self.last_real_time = time.time()
                 self.logger.info("General state loaded successfully. Real time tracker reset.")
 
-            except (json.JSONDecodeError, IOError, TypeError, KeyError) as e:
-                self.logger.error("Failed to load general state from '%s': %s. Starting with default state.", SAVE_STATE_FILE, e, exc_info=True)
+            except (json.JSONDecodeError, IOError, TypeError, KeyError, ValueError) as e:
+                self.logger.error("Failed to load general state from '%s': %s. Starting with default state.", self.save_state_file, e, exc_info=True)
                 # Resetear estado a valores por defecto conocidos
                 self.current_roleplay_time = datetime.datetime(2025, 4, 16, 14, 0, 0)
                 self.pending_location_target = None
@@ -209,71 +375,331 @@ class RPLogic:
                 # if self.emotional_core: self.emotional_core.reset() # Asumiendo que EC tampoco tiene método reset
                 self.logger.warning("Reset methods for dynamic_memory, user_memory, or emotional_core not implemented or called to avoid errors.")
         else:
-            self.logger.info("No general save file '%s' found. Starting with default state.", SAVE_STATE_FILE)
+            self.logger.info("No general save file '%s' found. Starting with default state.", self.save_state_file)
+
+        self._replay_journal()
+        if self.store is not None:
+            # Primera vez con SQLite: importa el estado de los archivos (o el inicial) en una transacción
+            self.logger.info("Importing file-based state into '%s'...", self.store.path)
+            if self._sync_store(full=True):
+                self.journal.reset()
+                if self.long_term_memory_legacy is not None:
+                    self.long_term_memory_legacy.use_memory(self.long_term_memory_legacy.since(0))
+
 
+    def _load_state_from_store(self):
+        """Loads general state and LTM events from the SQLite store. Returns False if it holds no state yet.
 
-    def _save_state(self):
-        """Saves the general state (incluyendo estado del ciclo de sueño) and triggers vector memory save."""
-        self.logger.info("Attempting to save comprehensive state to '%s'...", SAVE_STATE_FILE)
-        temp_save_file = SAVE_STATE_FILE + ".tmp"
+        A database that holds state but cannot be read raises RuntimeError: falling back to the state files would
+        import older state over it (full sync) and reset the journal.
+        """
         try:
-            # Ensure necessary components exist
-            if not all([self.emotional_core, self.dynamic_memory, self.user_memory]):
-                 self.logger.error("Cannot save general state: One or more core components are missing.")
-                 return
-
-            # Prepare emotional state dictionary safely (incluyendo fatigue_level de EC)
-            emo_state_to_save = {
-                "internal_emotions_detailed": getattr(self.emotional_core, 'internal_emotions_detailed', {}),
-                "personality_traits": getattr(self.emotional_core, 'personality_traits', {}),
-                "attachment_style": getattr(self.emotional_core, 'attachment_style', 'Unknown'),
-                "current_trust": getattr(self.emotional_core, 'current_trust', None),
-                "current_intimacy": getattr(self.emotional_core, 'current_intimacy', None),
-                # Guardar fatiga desde EC
-                "fatigue_level": getattr(self.emotional_core, 'fatigue_level', None),
-            }
-            if emo_state_to_save["current_trust"] is None or emo_state_to_save["current_intimacy"] is None:
-                 self.logger.warning("Could not save 'current_trust' or 'current_intimacy'.")
-            if emo_state_to_save["fatigue_level"] is None:
-                 self.logger.warning("Could not save 'fatigue_level' from EmotionalCore.")
-
-            # Prepare main state dictionary (incluyendo estado del ciclo de sueño)
-            state_data = {
-                "current_roleplay_time": self.current_roleplay_time.isoformat(),
-                "last_narrative_action": self.dynamic_memory.last_narrative_action,
-                "location": self.dynamic_memory.location,
-                "current_action": self.dynamic_memory.current_action,
-                "pending_location_target": self.pending_location_target,
-                "current_topic_focus": self.current_topic_focus,
-                "dynamic_memory": self.dynamic_memory.memories,
-                "user_memory_history": self.user_memory.history,
-                "emotional_core_state": emo_state_to_save, # Estado emocional con fatiga de EC
-                # --- Guardar Estado del CICLO de Sueño/Vigilia (Controlado por Logic) ---
-                "hours_awake": self.hours_awake,
-                "is_sleeping": self.is_sleeping,
-                "hours_slept": self.hours_slept,
-                # --- Fin Guardado Ciclo ---
-            }
-            self.logger.debug("General state data prepared for saving.")
+            state_data = self.store.load_state()
+            if state_data is None:
+                return False
+            self._apply_state(state_data)
+            self.journal_seq = int(state_data.get("journal_seq", 0))
+            ltm = self.long_term_memory_legacy
+            if ltm is not None:
+                ltm.use_memory(decode_summary(text) for text in self.store.ltm_events()) # The database holds them, not the JSONL file
+                self._store_synced["ltm"] = len(ltm)
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            self.logger.critical("Failed to load state from '%s': %s. Not falling back to the state files, which would overwrite it.",
+                                 self.store.path, e, exc_info=True)
+            raise RuntimeError(f"Cannot read the saved state in '{self.store.path}': {e}") from e
+        self.last_real_time = time.time()
+        self.logger.info("General state loaded from '%s' (turn %d).", self.store.path, self.journal_seq)
+        return True
 
-            # Save general state atomically
-            with open(temp_save_file, 'w', encoding='utf-8') as f:
-                json.dump(state_data, f, indent=4, ensure_ascii=False)
-            os.replace(temp_save_file, SAVE_STATE_FILE)
-            self.logger.info("General state saved successfully to '%s'.", SAVE_STATE_FILE)
 
-            # Trigger saving of vector memory
-            if self.vector_memory:
-                self.logger.info("Triggering vector memory save...")
-                self.vector_memory.save_memory(index_path=VECTOR_INDEX_FILE, data_path=VECTOR_DATA_FILE)
-            else:
-                 self.logger.warning("Vector memory object not available, skipping vector save.")
+    def _apply_state(self, state_data):
+        """Applies a saved state dict (full snapshot or journal record) to the live objects."""
+        # Restore Time
+        time_str = state_data.get("current_roleplay_time")
+        if time_str:
+            try:
+                time_str_clean = time_str.split('+')[0].split('Z')[0].split('.')[0]
+                self.current_roleplay_time = datetime.datetime.fromisoformat(time_str_clean)
+                self.logger.info("Loaded roleplay time: %s", self.current_roleplay_time.strftime("%Y-%m-%d %H:%M:%S"))
+            except ValueError as time_err:
+                self.logger.error("Failed to parse saved roleplay time '%s': %s. Using default.", time_str, time_err)
+                self.current_roleplay_time = datetime.datetime(2025, 4, 16, 14, 0, 0)
 
-        except Exception as e: # Catch potential errors during save
-            self.logger.error("Failed during save state process: %s", e, exc_info=True)
-            if os.path.exists(temp_save_file):
-                try: os.remove(temp_save_file); self.logger.info("Removed temporary general save file '%s' after error.", temp_save_file)
-                except OSError as remove_err: self.logger.error("Failed to remove temporary general save file '%s': %s", temp_save_file, remove_err)
+        # Restore Dynamic Memory State
+        if self.dynamic_memory:
+            last_action = state_data.get("last_narrative_action")
+            location = state_data.get("location")
+            current_action = state_data.get("current_action")
+            if last_action is not None: self.dynamic_memory.last_narrative_action = last_action; self.logger.info("Loaded last narrative action.")
+            if location is not None: self.dynamic_memory.location = location; self.logger.info("Loaded location: %s", location)
+            if current_action is not None: self.dynamic_memory.current_action = current_action; self.logger.info("Loaded current action (task): %s", current_action)
+            if "dynamic_memory" in state_data: # Journal records carry the new entry instead of the list
+                self.dynamic_memory.replace_memories(TurnEvent.from_data(item) for item in state_data["dynamic_memory"])
+                self.logger.info("Loaded dynamic memory list (%d items).", len(self.dynamic_memory.memories))
+        else: self.logger.error("Cannot load dynamic memory state: dynamic_memory object missing.")
+
+        # Load Explicit State Variables
+        self.pending_location_target = state_data.get("pending_location_target", None)
+        self.current_topic_focus = state_data.get("current_topic_focus", "Unknown / Resumed")
+        self.logger.info("Loaded explicit state - Pending Location: %s, Topic Focus: %s", self.pending_location_target, self.current_topic_focus)
+
+        # Load user memory history
+        if self.user_memory and "user_memory_history" in state_data:
+            user_history = state_data["user_memory_history"]
+            if isinstance(user_history, list): self.user_memory.history = user_history
+            else: self.logger.warning("Loaded user_memory_history is not a list."); self.user_memory.history = []
+            self.logger.info("Loaded user memory history (%d items).", len(self.user_memory.history))
+        elif not self.user_memory: self.logger.error("Cannot load user memory history: user_memory object missing.")
+
+        # --- Cargar Estado del CICLO de Sueño/Vigilia (Controlado por Logic) ---
+        self.hours_awake = float(state_data.get("hours_awake", 0.0))
+        self.is_sleeping = bool(state_data.get("is_sleeping", False))
+        self.hours_slept = float(state_data.get("hours_slept", 0.0))
+        self.logger.info("Loaded sleep cycle state - Sleeping: %s, Awake: %.1f hrs, Slept: %.1f hrs",
+                         self.is_sleeping, self.hours_awake, self.hours_slept)
+        # --- Fin Carga Ciclo ---
+
+        # Load Emotional Core State (incluyendo fatigue_level desde aquí)
+        if self.emotional_core:
+            emo_state = state_data.get("emotional_core_state", {})
+            if emo_state:
+                self.logger.debug("Loading emotional core state attributes: %s", emo_state)
+                # Carga fatiga y tiempo de sueño (si EC aún lo usa internamente)
+                try:
+                     # Carga fatiga directamente al atributo de EC
+                     self.emotional_core.fatigue_level = float(emo_state.get("fatigue_level", getattr(self.emotional_core, 'fatigue_level', 0.0)))
+                     self.logger.info("Loaded fatigue level into EC: %.1f", self.emotional_core.fatigue_level)
+                except (AttributeError, ValueError, KeyError, TypeError) as fatigue_err: self.logger.warning("Could not load/convert 'fatigue_level' for EC: %s", fatigue_err)
+
+                # Carga los demás atributos como los tenías
+                try:
+                    default_trust = getattr(self.emotional_core, 'current_trust', 0.5)
+                    default_intimacy = getattr(self.emotional_core, 'current_intimacy', 0.1)
+                    self.emotional_core.current_trust = float(emo_state.get("current_trust", default_trust))
+                    self.emotional_core.current_intimacy = float(emo_state.get("current_intimacy", default_intimacy))
+                except (AttributeError, ValueError, TypeError) as rel_err: self.logger.warning("Could not load/convert 'current_trust' or 'current_intimacy': %s", rel_err)
+
+                loaded_emotions = emo_state.get("internal_emotions_detailed")
+                if isinstance(loaded_emotions, dict): self.emotional_core.internal_emotions_detailed = loaded_emotions
+                else: self.logger.warning("Loaded internal_emotions_detailed is not a dictionary.")
+
+                loaded_personality = emo_state.get("personality_traits")
+                if isinstance(loaded_personality, dict): self.emotional_core.personality_traits = loaded_personality
+                else: self.logger.warning("Loaded personality_traits is not a dictionary.")
+
+                self.emotional_core.attachment_style = emo_state.get("attachment_style", getattr(self.emotional_core, 'attachment_style', 'Unknown'))
+                self.logger.info("Loaded other emotional state attributes (trust, intimacy, emotions, personality, attachment).")
+        else: self.logger.error("Cannot load emotional state: emotional_core object missing.")
+
+
+    def _replay_journal(self):
+        """Re-applies the turns journaled after the last snapshot (crash recovery)."""
+        records = self.journal.records()
+        pending = [record for record in records if record.get("seq", 0) > self.journal_seq]
+        if pending:
+            self.logger.warning("Recovering %d journaled turns on top of '%s'...", len(pending), self.save_state_file)
+        for record in records:
+            vector_add = record.get("vector_add")
+            # The vector files are written after save_state.json, so a crash in between can leave covered turns
+            # missing from the index (or, the other way round, already in it): the vector id decides
+            if vector_add and self.vector_memory and self.vector_memory.next_id <= vector_add["id"]:
+                self.vector_memory.add_memory(vector_add["text"], metadata=vector_add.get("metadata"))
+            ltm_add = record.get("ltm_add")
+            ltm = self.long_term_memory_legacy
+            if ltm_add and ltm is not None:
+                # Positional: only events past what the LTM file already holds are re-added (normally none: it is appended first)
+                for offset, event in enumerate(ltm_add["events"]):
+                    if ltm_add["start"] + offset >= len(ltm):
+                        ltm.append_summary(summary_from_data(event))
+            if record.get("seq", 0) <= self.journal_seq:
+                continue
+            self._apply_state(record.get("state", {}))
+            added = record.get("dynamic_memory_add")
+            if added and self.dynamic_memory:
+                # Raw append: proposing it to active memory again could duplicate long-term entries
+                self.dynamic_memory.memories.append(TurnEvent.from_data(added)) # Bounded: drops the oldest
+            self.journal_seq = record["seq"]
+        if pending:
+            self.turns_since_snapshot = len(pending)
+            self.last_real_time = time.time()
+            self.logger.info("Journal replayed up to turn %d. RP Time: %s, Location: %s", self.journal_seq,
+                             self.current_roleplay_time.strftime("%Y-%m-%d %H:%M:%S"),
+                             self.dynamic_memory.location if self.dynamic_memory else "N/A")
+
+
+    def _collect_state(self, full=True):
+        """State dict as saved to disk. Without `full`, the dynamic memory list and user history are left out (journal records)."""
+        # Prepare emotional state dictionary safely (incluyendo fatigue_level de EC)
+        emo_state_to_save = {
+            "internal_emotions_detailed": getattr(self.emotional_core, 'internal_emotions_detailed', {}),
+            "personality_traits": getattr(self.emotional_core, 'personality_traits', {}),
+            "attachment_style": getattr(self.emotional_core, 'attachment_style', 'Unknown'),
+            "current_trust": getattr(self.emotional_core, 'current_trust', None),
+            "current_intimacy": getattr(self.emotional_core, 'current_intimacy', None),
+            # Guardar fatiga desde EC
+            "fatigue_level": getattr(self.emotional_core, 'fatigue_level', None),
+        }
+        if full and (emo_state_to_save["current_trust"] is None or emo_state_to_save["current_intimacy"] is None):
+             self.logger.warning("Could not save 'current_trust' or 'current_intimacy'.")
+        if full and emo_state_to_save["fatigue_level"] is None:
+             self.logger.warning("Could not save 'fatigue_level' from EmotionalCore.")
+
+        # Prepare main state dictionary (incluyendo estado del ciclo de sueño)
+        state_data = {
+            "current_roleplay_time": self.current_roleplay_time.isoformat(),
+            "last_narrative_action": self.dynamic_memory.last_narrative_action,
+            "location": self.dynamic_memory.location,
+            "current_action": self.dynamic_memory.current_action,
+            "pending_location_target": self.pending_location_target,
+            "current_topic_focus": self.current_topic_focus,
+            "emotional_core_state": emo_state_to_save, # Estado emocional con fatiga de EC
+            # --- Guardar Estado del CICLO de Sueño/Vigilia (Controlado por Logic) ---
+            "hours_awake": self.hours_awake,
+            "is_sleeping": self.is_sleeping,
+            "hours_slept": self.hours_slept,
+            # --- Fin Guardado Ciclo ---
+        }
+        if full:
+            state_data["dynamic_memory"] = [event.to_dict() for event in self.dynamic_memory.memories]
+            state_data["user_memory_history"] = self.user_memory.history
+            state_data["journal_seq"] = self.journal_seq # Journal records up to here are covered by this snapshot
+            if self.vector_memory:
+                state_data["vector_next_id"] = self.vector_memory.next_id # Kept past pruned ids (the SQLite rows alone lose it)
+        return state_data
+
+
+    def _save_state(self, only_dirty=False):
+        """Saves the general state (incluyendo estado del ciclo de sueño), the vector store and LTM, then drops the journal segment it covers.
+
+        With `only_dirty` (autosave), sections unchanged since the last save are not rewritten.
+        """
+        if self.store is not None:
+            # Every turn is already committed; this only picks up changes made outside a turn
+            with self._save_lock:
+                self._sync_store()
+            return
+        with self._save_lock:
+            self.logger.info("Attempting to save %s state to '%s'...", "changed" if only_dirty else "comprehensive", self.save_state_file)
+            temp_save_file = self.save_state_file + ".tmp"
+            vector_payload = None
+            ltm = self.long_term_memory_legacy
+            try:
+                # Ensure necessary components exist
+                if not all([self.emotional_core, self.dynamic_memory, self.user_memory]):
+                     self.logger.error("Cannot save general state: One or more core components are missing.")
+                     return
+
+                # Copy every section under the state lock (turns wait only for this); disk writes happen after it
+                with self._state_lock:
+                    state_json = json.dumps(self._collect_state(), ensure_ascii=False)
+                    write_state = not only_dirty or state_json != self._last_state_json
+                    if self.vector_memory and self.vector_memory.index is not None and (not only_dirty or self.vector_memory.dirty):
+                        vector_payload = self.vector_memory.serialize()
+                        self.vector_memory.dirty = False
+                    if ltm is not None:
+                        ltm.maybe_compact() # Summaries are appended as they are made; only unreadable lines need a rewrite
+                    # Turns committed from here on go to a new journal segment
+                    self.journal.rotate()
+                    self.turns_since_snapshot = 0
+                self.logger.debug("General state data prepared for saving.")
+
+                # Save general state atomically
+                if write_state:
+                    with open(temp_save_file, 'w', encoding='utf-8') as f:
+                        f.write(state_json)
+                    os.replace(temp_save_file, self.save_state_file)
+                    self._last_state_json = state_json
+                    self.logger.info("General state saved successfully to '%s'.", self.save_state_file)
+                else:
+                    self.logger.debug("General state unchanged since the last save. Skipping '%s'.", self.save_state_file)
+
+                saved = True
+                if vector_payload is not None:
+                    self.logger.info("Writing vector memory...")
+                    if not self.vector_memory.write_serialized(vector_payload, index_path=self.vector_index_file, data_path=self.vector_data_file):
+                        self.vector_memory.dirty = True
+                        saved = False
+                elif not self.vector_memory:
+                     self.logger.warning("Vector memory object not available, skipping vector save.")
+
+                # The snapshot now covers the rotated journal segment (kept if a section did not make it to disk)
+                if saved:
+                    self.journal.discard_rotated()
+
+            except Exception as e: # Catch potential errors during save
+                self.logger.error("Failed during save state process: %s", e, exc_info=True)
+                if vector_payload is not None: self.vector_memory.dirty = True
+                if os.path.exists(temp_save_file):
+                    try: os.remove(temp_save_file); self.logger.info("Removed temporary general save file '%s' after error.", temp_save_file)
+                    except OSError as remove_err: self.logger.error("Failed to remove temporary general save file '%s': %s", temp_save_file, remove_err)
+
+
+    def _sync_store(self, full=False):
+        """Commits the general state plus the vector memories and LTM events added since the last sync in one transaction.
+
+        With `full` (or when a section shrank, e.g. a reset), that section is rewritten instead. Returns True on success.
+        """
+        with self._state_lock:
+            vector_memory = self.vector_memory if self.vector_memory and self.vector_memory.index is not None else None
+            ltm = self.long_term_memory_legacy
+            vector_start = self._store_synced["vectors"]
+            replace_vectors = vector_memory is not None and (full or len(vector_memory.memory_data) < vector_start)
+            if replace_vectors:
+                vector_start = 0
+            ltm_start = self._store_synced["ltm"]
+            replace_ltm = ltm is not None and (full or len(ltm) < ltm_start)
+            if replace_ltm:
+                ltm_start = 0
+            try:
+                self.store.commit(
+                    json.dumps(self._collect_state(), ensure_ascii=False),
+                    vector_rows=vector_memory.rows_since(vector_start) if vector_memory is not None else (),
+                    ltm_events=[encode_summary(summary) for summary in ltm.since(ltm_start)] if ltm is not None else (),
+                    ltm_start=ltm_start,
+                    replace_vectors=replace_vectors,
+                    replace_ltm=replace_ltm,
+                )
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                # Nothing is marked as synced, so the next commit retries these rows
+                self.logger.error("Failed to commit state to '%s': %s", self.store.path, e, exc_info=True)
+                return False
+            if vector_memory is not None:
+                self._store_synced["vectors"] = len(vector_memory.memory_data)
+                vector_memory.dirty = False
+            if ltm is not None:
+                self._store_synced["ltm"] = len(ltm)
+                ltm.dirty = False
+            self.turns_since_snapshot = 0
+        return True
+
+
+    def _autosave(self):
+        self._save_state(only_dirty=True)
+
+
+    def _journal_turn(self, dynamic_memory_add, vector_add, ltm_add=None):
+        """Appends this turn's state delta to the write-ahead journal and schedules a (debounced) autosave."""
+        self.journal_seq += 1
+        if self.store is not None:
+            # SQLite: the turn (state + new vector/LTM rows) is one transaction, no journal needed
+            self._sync_store()
+            return
+        record = {
+            "seq": self.journal_seq,
+            "ts": time.time(),
+            "state": self._collect_state(full=False),
+            "dynamic_memory_add": dynamic_memory_add,
+            "vector_add": vector_add,
+            "ltm_add": ltm_add,
+        }
+        try:
+            self.journal.append(record)
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.error("Could not journal turn %d: %s. Saving right away instead.", self.journal_seq, e, exc_info=True)
+            self.autosaver.mark_dirty(urgent=True)
+            return
+        self.turns_since_snapshot += 1
+        self.autosaver.mark_dirty(urgent=bool(self.snapshot_every) and self.turns_since_snapshot >= self.snapshot_every)
 
 
     def _update_state_from_input(self, user_input):
@@ -343,6 +769,55 @@ class RPLogic:
 
     def construct_context(self, user_input):
         """Constructs the context dictionary, including RAG memories and fatigue/sleep state from EC."""
+        context_dict = self.construct_base_context(user_input)
+        if context_dict:
+            context_dict.update(self.retrieve_context(user_input))
+        return context_dict
+
+
+    def retrieve_memories(self, user_input):
+        """RAG step of construct_context: texts of the memories most relevant to the input and current topic."""
+        return self.retrieve_context(user_input)["retrieved_memories"]
+
+
+    def retrieve_context(self, user_input):
+        """Retrieval step of construct_context: the context keys it fills ('retrieved_memories', and 'long_term_summaries'
+        when the summary index can rank them; otherwise the base context keeps the newest summaries).
+
+        The query is embedded once and used for both the vector store and the long-term summary index.
+        """
+        retrieved = {"retrieved_memories": []}
+        if self.vector_memory:
+            try:
+                query = f"{user_input} Topic: {self.current_topic_focus}"
+                self.logger.info(f"Retrieving relevant memories for query: '{query[:100]}...'")
+                query_embedding = self.vector_memory.encode_query(query)
+                retrieved_memories_full = self.vector_memory.retrieve_relevant_memories(query, k=5, query_embedding=query_embedding)
+                retrieved["retrieved_memories"] = [mem.get('text', '') for mem in retrieved_memories_full if mem.get('text')]
+                self.logger.info(f"Retrieved {len(retrieved['retrieved_memories'])} relevant memories via RAG.")
+                self.logger.debug("Retrieved RAG memories: %s", retrieved["retrieved_memories"])
+                ltm = self.long_term_memory_legacy
+                if ltm is not None and len(self.summary_index) == len(ltm) > LTM_SUMMARIES_IN_CONTEXT:
+                    # Most similar summaries, shown in chronological order
+                    positions = sorted(self.summary_index.search(query_embedding, k=LTM_SUMMARIES_IN_CONTEXT))
+                    retrieved["long_term_summaries"] = ltm.get(positions)
+                    self.logger.info("Selected long-term summaries %s by similarity (of %d).", positions, len(ltm))
+            except Exception as e:
+                self.logger.error(f"Error during RAG retrieval: {e}", exc_info=True)
+                retrieved = {"retrieved_memories": ["Error retrieving relevant memories."]}
+        else:
+            self.logger.warning("VectorMemoryStore not available, skipping RAG retrieval.")
+        return retrieved
+
+
+    def construct_base_context(self, user_input):
+        """Everything in construct_context except RAG ('retrieved_memories' is left empty), so retrieval can run in parallel."""
+        with self._state_lock: # EmotionalCore state changes here; an autosave must not copy it halfway
+            return self._build_base_context(user_input)
+
+
+    def _build_base_context(self, user_input):
+        """Body of construct_base_context (state lock held)."""
         self.logger.debug("--- Logic: construct_context called ---")
         if not self.dynamic_memory:
              self.logger.error("DynamicMemory not initialized in construct_context. Returning empty context.")
@@ -359,34 +834,19 @@ class RPLogic:
         current_location = dyn_state.get('location', 'Unknown')
         self.logger.debug("Dynamic state fetched: %s", dyn_state)
 
-        # --- RAG Retrieval ---
-        retrieved_memories_text = []
-        if self.vector_memory:
-            try:
-                query = f"{user_input} Topic: {self.current_topic_focus}"
-                self.logger.info(f"Retrieving relevant memories for query: '{query[:100]}...'")
-                retrieved_memories_full = self.vector_memory.retrieve_relevant_memories(query, k=5)
-                retrieved_memories_text = [mem.get('text', '') for mem in retrieved_memories_full if mem.get('text')]
-                self.logger.info(f"Retrieved {len(retrieved_memories_text)} relevant memories via RAG.")
-                self.logger.debug("Retrieved RAG memories: %s", retrieved_memories_text)
-            except Exception as e:
-                self.logger.error(f"Error during RAG retrieval: {e}", exc_info=True)
-                retrieved_memories_text = ["Error retrieving relevant memories."]
-        else:
-            self.logger.warning("VectorMemoryStore not available, skipping RAG retrieval.")
-
         # --- Context Flags & Emotional Core ---
         context_flags = {
             "location_type": "public" if current_location not in ["Poppy's House"] else "private",
-            "recent_failure": any("fail" in mem.lower() for mem in dyn_state.get('recent_memories', '').split(" | ") if mem),
+            "recent_failure": any(event.mentions(("fail",)) for event in dyn_state.get('recent_memories', [])),
             "high_impact_event": any(word in user_input.lower() for word in ["die", "death", "gone", "kill", "razor", "cut", "suicide", "depress", "overdose", "scars"])
         }
 
         # Bring in persisted long-term summaries (legacy path via ActiveMemory -> LongTermMemoryFile)
         long_term_summaries = []
-        if self.long_term_memory_legacy:
+        if self.long_term_memory_legacy is not None:
             try:
-                long_term_summaries = self.long_term_memory_legacy.get_memories()[-5:]
+                # Newest summaries; retrieve_context() replaces them with the most relevant ones when it can rank them
+                long_term_summaries = self.long_term_memory_legacy.tail(LTM_SUMMARIES_IN_CONTEXT)
             except Exception as ltm_err:
                 self.logger.warning("Could not fetch long-term summaries: %s", ltm_err)
 
@@ -432,9 +892,9 @@ class RPLogic:
             "current_time_in_roleplay": current_time_str,
             "emotional_guidance": emotional_guidance,
             "previous_action": previous_narrative_action,
-            "dynamic_memory": dyn_state.get('recent_memories', '').split(" | ") if dyn_state.get('recent_memories') else [],
-            "retrieved_memories": retrieved_memories_text, # RAG results
-            "long_term_summaries": long_term_summaries,
+            "dynamic_memory": list(dyn_state.get('recent_memories', [])), # TurnEvents, rendered by the prompt builder
+            "retrieved_memories": [], # RAG results, filled by retrieve_context()
+            "long_term_summaries": long_term_summaries, # Tuples of TurnEvents, rendered by the prompt builder (see retrieve_context)
             "internal_objective": internal_objective,
             "user_name": user_state.get('name', 'User'),
             "user_input": user_input,
@@ -454,6 +914,12 @@ class RPLogic:
 
     def manage_dynamic_memory(self, user_input, full_ai_response):
         """Manages state updates AFTER a turn (time, fatigue/sleep, memory, state resolution)."""
+        with self._state_lock:
+            self._manage_dynamic_memory(user_input, full_ai_response)
+
+
+    def _manage_dynamic_memory(self, user_input, full_ai_response):
+        """Body of manage_dynamic_memory (state lock held)."""
         self.logger.debug("--- Logic: manage_dynamic_memory called ---")
         if not all([self.dynamic_memory, self.user_memory, self.character_memory, self.emotional_core]):
              self.logger.error("Cannot manage memory/state: Core components missing.")
@@ -540,6 +1006,7 @@ class RPLogic:
                      self.emotional_core._process_sleep_cycle()
                  except Exception as e_proc:
                      self.logger.error(f"Error calling _process_sleep_cycle: {e_proc}", exc_info=True)
+                 self.start_consolidation() # Consolidates the day's vector memories in the background
             # --- Fin llamada a _process_sleep_cycle ---
 
         else:
@@ -596,40 +1063,44 @@ class RPLogic:
         current_fatigue_for_log = self.emotional_core.fatigue_level if self.emotional_core else "N/A"
         self.logger.debug("Current emotional state labels for event log: %s", current_emotional_state_labels)
 
-        # Event string for RAG/embedding
-        event_for_rag = (f"User: '{user_input}'\n"
-                         f"{char_name}: '{full_ai_response}'")
-        self.logger.debug("Constructed event string for RAG: '%s...'", event_for_rag[:250])
-
-        # Event string for dynamic memory log
-        event_log_string = (f"User: '{user_input}'. {char_name}: '{full_ai_response}'. "
-                            f"[Loc: {self.dynamic_memory.location}] [Act: {self.dynamic_memory.current_action}] "
-                            f"[Topic: {self.current_topic_focus}] [Pending: {self.pending_location_target if self.pending_location_target else 'None'}] "
-                            f"[Emo: {', '.join(current_emotional_state_labels)}] [Fatigue: {current_fatigue_for_log:.1f}] [Sleeping: {self.is_sleeping}]") # Usar fatiga de EC
-        self.logger.debug("Constructed event string for dynamic log: '%s...'", event_log_string[:300])
-
-        # Add detailed log string to dynamic memory
+        # One structured record for every tier; text is only rendered when a prompt is built
+        event = TurnEvent(
+            user_input=user_input,
+            character=char_name,
+            response=full_ai_response,
+            location=self.dynamic_memory.location,
+            action=self.dynamic_memory.current_action,
+            topic=self.current_topic_focus,
+            pending_location=self.pending_location_target,
+            emotion_labels=current_emotional_state_labels,
+            emotions=current_emotions_detailed,
+            fatigue=current_fatigue_for_log, # Usar fatiga de EC
+            is_sleeping=self.is_sleeping, # Usar estado de Logic
+            roleplay_time=self.current_roleplay_time.isoformat(),
+            timestamp=time.time(),
+        )
+        self.logger.debug("Constructed turn event: %r", event)
+
+        # Add the event to dynamic memory (may push a summary to LTM through active memory)
+        ltm = self.long_term_memory_legacy
+        ltm_size_before = len(ltm) if ltm is not None else 0
         self.logger.debug("Calling dynamic_memory.add_memory...")
         if self.active_memory:
-             self.dynamic_memory.add_memory(event_log_string, self.active_memory)
+             self.dynamic_memory.add_memory(event, self.active_memory)
         else:
              self.logger.warning("Active memory object missing, cannot pass to dynamic_memory.add_memory.")
-             self.dynamic_memory.add_memory(event_log_string)
+             self.dynamic_memory.add_memory(event)
 
-        # Add concise event string + metadata to Vector Memory Store (RAG)
+        # Add the exchange + metadata to Vector Memory Store (RAG)
+        vector_add = None
         if self.vector_memory:
             self.logger.debug("Calling vector_memory.add_memory...")
-            metadata = {
-                "timestamp": time.time(),
-                "roleplay_time": self.current_roleplay_time.isoformat(),
-                "location": self.dynamic_memory.location,
-                "action": self.dynamic_memory.current_action,
-                "topic": self.current_topic_focus,
-                "emotions": current_emotions_detailed,
-                "fatigue": current_fatigue_for_log, # Usar fatiga de EC
-                "is_sleeping": self.is_sleeping # Usar estado de Logic
-            }
+            event_for_rag = event.rag_text()
+            metadata = event.metadata()
+            vector_id = self.vector_memory.next_id
             self.vector_memory.add_memory(event_for_rag, metadata=metadata)
+            if self.vector_memory.next_id > vector_id:
+                vector_add = {"id": vector_id, "text": event_for_rag, "metadata": metadata}
         else: self.logger.warning("Vector memory not available, skipping add.")
 
         # Add AI's response to user's memory history
@@ -649,6 +1120,13 @@ class RPLogic:
         memory_logger.debug("Setting last narrative action in DynamicMemory: %s", extracted_action)
         self.dynamic_memory.set_last_narrative_action(extracted_action)
 
+        # --- 7. Journal the committed turn (the autosaver writes the snapshot later) ---
+        ltm_add = None
+        if ltm is not None and len(ltm) > ltm_size_before:
+            ltm_add = {"start": ltm_size_before, "events": [summary_to_data(summary) for summary in ltm.since(ltm_size_before)]}
+            self._sync_summary_index() # Its events were embedded already (vector store / summarizer): usually no encoder call
+        self._journal_turn(event.to_dict(), vector_add, ltm_add)
+
         # --- Finish ---
         self.logger.info("Memory and State managed for turn.")
         self.logger.debug("--- Logic: manage_dynamic_memory finished ---")
@@ -2,38 +2,226 @@
 import json
 import logging
 import os
+import shutil
+from collections import deque
+from itertools import islice
+
+from turn_event import summary_from_data, summary_to_data
 
 # Get a logger specific to this module, inheriting from 'memory'
 logger = logging.getLogger('memory.longterm')
 
+LONG_TERM_MEMORY_FILE = "long_term_memory.jsonl" # One summary per line, append-only
+LEGACY_LONG_TERM_MEMORY_SUFFIX = ".json" # Whole-list file written by older versions (imported once)
+LTM_TAIL_CACHE = 16 # Newest summaries kept parsed in memory; older ones are read from the file on demand
+LTM_COMPACT_MIN_BYTES = 4096 # Compact once unreadable lines waste this much...
+LTM_COMPACT_RATIO = 0.25 # ...and this share of the file
+
+
+def encode_summary(summary):
+    """One summary (tuple of TurnEvents) as a JSON string (SQLite rows)."""
+    return json.dumps(summary_to_data(summary), ensure_ascii=False)
+
+
+def decode_summary(text):
+    """Inverse of encode_summary(); plain text stored by older versions becomes a single free-form event."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return summary_from_data(text)
+    return summary_from_data(data if isinstance(data, list) else text)
+
 
 class LongTermMemoryFile:
-    def __init__(self, storage_file="long_term_memory.json"):
+    def __init__(self, storage_file=LONG_TERM_MEMORY_FILE, tail_cache=LTM_TAIL_CACHE):
+        """
+        Long-term summaries in an append-only JSONL file.
+
+        Only the byte offset of each summary and the newest `tail_cache` summaries are held in memory:
+        add_event() appends one line and tail(n)/since(i) read just the records asked for, so the cost
+        per add and per turn does not grow with the history. Unreadable lines (a torn write) are skipped
+        and compacted away. An owner that persists summaries elsewhere (the SQLite backend) calls
+        use_memory() and the file is no longer touched.
+        """
         self.storage_file = storage_file
-        self.memory = []
+        self.file_backed = True
+        self._records = None # All summaries, only when not file-backed
+        self._offsets = [] # Byte offset of each summary's line
+        self._end = 0 # File size covered by _offsets
+        self._garbage = 0 # Bytes of unreadable lines
+        self._tail = deque(maxlen=tail_cache)
+        self.dirty = False # Summaries added since the owner last persisted them (SQLite backend)
         self._load()
-        logger.debug("LongTermMemoryFile initialized with %d events.", len(self.memory))
+        logger.debug("LongTermMemoryFile initialized with %d events.", len(self))
+
+    def __len__(self):
+        return len(self._records) if self._records is not None else len(self._offsets)
+
+    @property
+    def memory(self):
+        """Every summary (reads the whole file; prefer tail() / since())."""
+        return self.since(0)
+
+    def _reset(self):
+        self._records = None
+        self._offsets = []
+        self._end = 0
+        self._garbage = 0
+        self._tail.clear()
 
     def _load(self):
+        self._reset()
+        legacy_file = os.path.splitext(self.storage_file)[0] + LEGACY_LONG_TERM_MEMORY_SUFFIX
         if not os.path.exists(self.storage_file):
+            if legacy_file != self.storage_file and os.path.exists(legacy_file):
+                self._import_legacy(legacy_file)
             return
         try:
-            with open(self.storage_file, 'r', encoding='utf-8') as f:
+            with open(self.storage_file, 'rb') as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn last append: cut it off so the next append starts on a clean line
+                        logger.warning("Truncating torn last line (%d bytes) of %s.", len(line), self.storage_file)
+                        break
+                    try:
+                        summary = summary_from_data(json.loads(line))
+                    except (ValueError, TypeError, KeyError) as exc:
+                        logger.warning("Skipping unreadable long-term memory line at byte %d of %s: %s", offset, self.storage_file, exc)
+                        self._garbage += len(line)
+                    else:
+                        self._offsets.append(offset)
+                        self._tail.append(summary)
+                    offset += len(line)
+            self._end = offset
+            if os.path.getsize(self.storage_file) > offset:
+                with open(self.storage_file, 'r+b') as f:
+                    f.truncate(offset)
+        except IOError as exc:
+            logger.error("Failed to load long-term memory from %s: %s", self.storage_file, exc, exc_info=True)
+            self._reset()
+        self.maybe_compact()
+
+    def _import_legacy(self, legacy_file):
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-            if isinstance(data, list):
-                self.memory = data
-            else:
-                logger.warning("Invalid long-term memory format in %s. Resetting.", self.storage_file)
-                self.memory = []
         except (IOError, json.JSONDecodeError) as exc:
-            logger.error("Failed to load long-term memory from %s: %s", self.storage_file, exc, exc_info=True)
-            self.memory = []
+            logger.error("Failed to load long-term memory from %s: %s", legacy_file, exc, exc_info=True)
+            return
+        if not isinstance(data, list):
+            logger.warning("Invalid long-term memory format in %s. Resetting.", legacy_file)
+            return
+        if self._rewrite([summary_from_data(item) for item in data]):
+            os.remove(legacy_file)
+            logger.info("Converted %s to the append-only %s (%d summaries).", legacy_file, self.storage_file, len(self))
+
+    def reload(self):
+        """Re-reads the file (after it was replaced, e.g. a save slot was restored)."""
+        self.file_backed = True
+        self.dirty = False
+        self._load()
+
+    def use_memory(self, summaries):
+        """Keeps `summaries` in memory only; the file is no longer read or written (the owner persists them)."""
+        self._reset()
+        self.file_backed = False
+        self._records = list(summaries)
+        self._tail.extend(self._records[-self._tail.maxlen:])
+        self.dirty = False
+
+    @staticmethod
+    def _encode_line(summary):
+        return (json.dumps(summary_to_data(summary), ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _read_from(self, position):
+        """Summaries from index `position` to the end, read from the file starting at that line's offset."""
+        summaries = []
+        with open(self.storage_file, 'rb') as f:
+            f.seek(self._offsets[position])
+            for line in f:
+                if len(summaries) == len(self._offsets) - position:
+                    break
+                try:
+                    summaries.append(summary_from_data(json.loads(line)))
+                except (ValueError, TypeError, KeyError):
+                    continue # Skipped when loading too (not in _offsets)
+        return summaries
+
+    def since(self, position):
+        """Summaries from index `position` on (the new ones are usually in the tail cache: no file read)."""
+        position = max(0, position) # tail(n) with n > len(self) asks from before the start
+        count = len(self) - position
+        if count <= 0:
+            return []
+        if count <= len(self._tail):
+            return list(islice(self._tail, len(self._tail) - count, None))
+        if self._records is not None:
+            return self._records[position:]
+        return self._read_from(position)
+
+    def tail(self, count):
+        """The newest `count` summaries, oldest first."""
+        return self.since(len(self) - count) if count > 0 else []
 
-    def _save(self):
+    def get(self, positions):
+        """Summaries at the given indexes (in that order): from the tail cache, or one seek per summary."""
+        cached_from = len(self) - len(self._tail)
+        summaries, f = [], None
+        try:
+            for position in positions:
+                if position >= cached_from:
+                    summaries.append(self._tail[position - cached_from])
+                elif self._records is not None:
+                    summaries.append(self._records[position])
+                else:
+                    if f is None:
+                        f = open(self.storage_file, 'rb')
+                    f.seek(self._offsets[position])
+                    summaries.append(summary_from_data(json.loads(f.readline())))
+        finally:
+            if f is not None:
+                f.close()
+        return summaries
+
+    def _ensure_private(self):
+        # Save slots hard-link this file: copy it before appending so the slot keeps its contents (copy-on-write)
+        if os.path.exists(self.storage_file) and os.stat(self.storage_file).st_nlink > 1:
+            tmp = self.storage_file + ".tmp"
+            shutil.copyfile(self.storage_file, tmp)
+            os.replace(tmp, self.storage_file)
+
+    def append_summary(self, summary):
+        """Appends a summary as is (no duplicate check). Returns True once it is stored."""
+        summary = tuple(summary)
+        if not self.file_backed:
+            self._records.append(summary)
+        else:
+            line = self._encode_line(summary)
+            try:
+                self._ensure_private()
+                with open(self.storage_file, 'ab') as f:
+                    f.write(line)
+            except IOError as exc:
+                logger.error("Failed to append to long-term memory %s: %s", self.storage_file, exc, exc_info=True)
+                return False
+            self._offsets.append(self._end)
+            self._end += len(line)
+        self._tail.append(summary)
+        self.dirty = True
+        return True
+
+    def _rewrite(self, summaries):
+        """Atomically replaces the file with `summaries` and rebuilds the index. Returns True on success."""
         tmp = self.storage_file + ".tmp"
+        offsets, end = [], 0
         try:
-            with open(tmp, 'w', encoding='utf-8') as f:
-                json.dump(self.memory, f, ensure_ascii=False, indent=2)
+            with open(tmp, 'wb') as f:
+                for summary in summaries:
+                    line = self._encode_line(summary)
+                    f.write(line)
+                    offsets.append(end)
+                    end += len(line)
             os.replace(tmp, self.storage_file)
         except IOError as exc:
             logger.error("Failed to save long-term memory to %s: %s", self.storage_file, exc, exc_info=True)
@@ -42,29 +230,52 @@ class LongTermMemoryFile:
                     os.remove(tmp)
             except OSError:
                 pass
+            return False
+        self._offsets, self._end, self._garbage = offsets, end, 0
+        self._tail.clear()
+        self._tail.extend(summaries[-self._tail.maxlen:])
+        return True
+
+    def maybe_compact(self):
+        """Rewrites the file without its unreadable lines once they waste enough space. Returns True if it did."""
+        if not self.file_backed or self._garbage < max(LTM_COMPACT_MIN_BYTES, LTM_COMPACT_RATIO * (self._end or 1)):
+            return False
+        wasted = self._garbage
+        if self._rewrite(self.since(0)):
+            logger.info("Compacted %s (%d bytes of unreadable lines dropped).", self.storage_file, wasted)
+            return True
+        return False
 
     def add_event(self, event):
-        """Adds a summarized event (usually from ActiveMemory) to long-term memory."""
+        """Adds a summarized event (usually from ActiveMemory: a sequence of TurnEvents) to long-term memory."""
         logger.debug("--- LongTermMemory: add_event called ---")
-        if not isinstance(event, str) or not event.strip():
-            logger.warning("Ignored invalid long-term memory event: %s", event)
+        if isinstance(event, str):
+            if not event.strip():
+                logger.warning("Ignored invalid long-term memory event: %s", event)
+                return
+            event = summary_from_data(event.strip())
+        elif not event:
+            logger.warning("Ignored empty long-term memory event.")
             return
-        event = event.strip()
-        if self.memory and self.memory[-1] == event:
+        else:
+            event = tuple(event)
+        if self._tail and self._tail[-1] == event:
             logger.debug("Skipped consecutive duplicate long-term memory event.")
             return
-        self.memory.append(event)
-        logger.info("Added event summary to Long Term Memory. Total LTM size: %d", len(self.memory))
-        self._save()
+        if self.append_summary(event):
+            logger.info("Added event summary to Long Term Memory. Total LTM size: %d", len(self))
         logger.debug("--- LongTermMemory: add_event finished ---")
 
     def get_memories(self):
         """Returns all memories stored in long-term memory."""
-        logger.debug("Getting all %d long-term memories.", len(self.memory))
-        return list(self.memory)
+        logger.debug("Getting all %d long-term memories.", len(self))
+        return self.since(0)
 
     def clear_memory(self):
         """Clears all long-term memory."""
-        logger.warning("Clearing ALL (%d) long-term memories!", len(self.memory))
-        self.memory = []
-        self._save()
+        logger.warning("Clearing ALL (%d) long-term memories!", len(self))
+        if self.file_backed:
+            self._rewrite([])
+        else:
+            self.use_memory([])
+        self.dirty = True
@@ -0,0 +1,203 @@
+# ollama_pool.py
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import requests
+
+# Get a logger specific to this module, inheriting from 'generator'
+logger = logging.getLogger('generator.pool')
+
+PROBE_TIMEOUT_SECONDS = 3.0
+LATENCY_EWMA_ALPHA = 0.3 # Weight of the newest probe latency in the moving average
+
+
+class OllamaEndpoint:
+    def __init__(self, base_url, max_parallel=1):
+        self.base_url = base_url.rstrip('/')
+        self.max_parallel = max(1, max_parallel) # Requests the host serves at once (its OLLAMA_NUM_PARALLEL)
+        self.chat_url = f"{self.base_url}/api/chat"
+        self.healthy = True # Optimistic until the first probe or failed request says otherwise
+        self.in_flight = 0 # Requests this process currently has open against the host
+        self.latency_ewma = None # Probe round-trip time (seconds), smoothed
+        self.loaded_models = [] # From /api/ps on the last probe
+        self.last_probe_time = 0.0
+
+    def load_key(self):
+        """Sort key for picking the least-loaded endpoint: in-flight requests first, then probe latency."""
+        return (self.in_flight, self.latency_ewma if self.latency_ewma is not None else 0.0)
+
+    def snapshot(self):
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "max_parallel": self.max_parallel,
+            "latency_ewma_s": self.latency_ewma,
+            "loaded_models": list(self.loaded_models),
+        }
+
+
+class OllamaEndpointPool:
+    def __init__(self, base_urls, num_parallel=1):
+        """
+        Tracks several Ollama hosts and hands out the least-loaded healthy one.
+
+        Args:
+            base_urls (str | list[str]): One base URL or a list of them (e.g. http://host:11434).
+            num_parallel (int): Requests each host serves at once; acquire() waits for a free slot beyond that.
+        """
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        if not base_urls:
+            raise ValueError("OllamaEndpointPool needs at least one base URL.")
+        self.endpoints = [OllamaEndpoint(url, max_parallel=num_parallel) for url in base_urls]
+        self._lock = threading.Lock()
+        self._slot_freed = None # asyncio.Condition, created in the running loop on first acquire()
+        self._probe_thread = None
+        self._probe_stop = threading.Event()
+        logger.info("OllamaEndpointPool initialized with %d endpoint(s): %s", len(self.endpoints), [e.base_url for e in self.endpoints])
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _get(self, base_url):
+        base_url = base_url.rstrip('/')
+        for endpoint in self.endpoints:
+            if endpoint.base_url == base_url:
+                return endpoint
+        return None
+
+    def healthy_endpoints(self):
+        with self._lock:
+            return [e for e in self.endpoints if e.healthy]
+
+    def _candidates(self, exclude):
+        """Healthy endpoints not in `exclude` (lock held)."""
+        excluded = {url.rstrip('/') for url in exclude}
+        candidates = [e for e in self.endpoints if e.healthy and e.base_url not in excluded]
+        if not candidates and not excluded:
+            # Every host looks down: still try the least-loaded one rather than failing outright
+            candidates = list(self.endpoints)
+        return candidates
+
+    def pick(self, exclude=()):
+        """Returns the base URL of the least-loaded healthy endpoint not in `exclude` (None if there is none)."""
+        with self._lock:
+            candidates = self._candidates(exclude)
+            if not candidates:
+                return None
+            return min(candidates, key=OllamaEndpoint.load_key).base_url
+
+    def _reserve(self, base_url, exclude):
+        """Counts a request against `base_url` (or the least-loaded candidate) if it has a free slot. Returns the endpoint, or None when full."""
+        with self._lock:
+            if base_url:
+                endpoint = self._get(base_url)
+                candidates = [endpoint] if endpoint else []
+            else:
+                candidates = self._candidates(exclude)
+            if not candidates:
+                raise RuntimeError("No Ollama endpoint available.")
+            free = [e for e in candidates if e.in_flight < e.max_parallel]
+            if not free:
+                return None
+            endpoint = min(free, key=OllamaEndpoint.load_key)
+            endpoint.in_flight += 1
+            return endpoint
+
+    @asynccontextmanager
+    async def acquire(self, base_url=None, exclude=(), timeout=None):
+        """Async context manager yielding an endpoint (picked if not given) with one of its slots held.
+
+        A host serves at most `max_parallel` requests; when the endpoint (or every candidate) is full, this waits
+        for a slot (asyncio.TimeoutError after `timeout` seconds).
+        """
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        async with self._slot_freed:
+            endpoint = self._reserve(base_url, exclude)
+            while endpoint is None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(self._slot_freed.wait(), remaining)
+                endpoint = self._reserve(base_url, exclude)
+        try:
+            yield endpoint
+        finally:
+            with self._lock:
+                endpoint.in_flight -= 1
+            async with self._slot_freed:
+                self._slot_freed.notify_all()
+
+    def mark_unhealthy(self, base_url, reason=""):
+        endpoint = self._get(base_url)
+        if endpoint and endpoint.healthy:
+            with self._lock:
+                endpoint.healthy = False
+            logger.warning("Marked Ollama endpoint %s unhealthy. %s", endpoint.base_url, reason)
+
+    def probe(self, endpoint):
+        """Pings one endpoint and refreshes its health, latency and loaded models."""
+        start = time.perf_counter()
+        try:
+            response = requests.get(endpoint.base_url, timeout=PROBE_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            latency = time.perf_counter() - start
+            loaded = []
+            try:
+                ps_response = requests.get(f"{endpoint.base_url}/api/ps", timeout=PROBE_TIMEOUT_SECONDS)
+                if ps_response.ok:
+                    loaded = [m.get("name", "") for m in ps_response.json().get("models", [])]
+            except (requests.exceptions.RequestException, ValueError) as ps_err:
+                logger.debug("Probe of %s/api/ps failed: %s", endpoint.base_url, ps_err)
+            with self._lock:
+                was_healthy = endpoint.healthy
+                endpoint.healthy = True
+                endpoint.latency_ewma = latency if endpoint.latency_ewma is None else (
+                    LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * endpoint.latency_ewma
+                )
+                endpoint.loaded_models = loaded
+                endpoint.last_probe_time = time.time()
+            if not was_healthy:
+                logger.info("Ollama endpoint %s is healthy again.", endpoint.base_url)
+        except requests.exceptions.RequestException as e:
+            with self._lock:
+                endpoint.last_probe_time = time.time()
+            self.mark_unhealthy(endpoint.base_url, reason=f"Probe failed: {e}")
+
+    def probe_all(self):
+        for endpoint in self.endpoints:
+            self.probe(endpoint)
+        logger.debug("Endpoint probe results: %s", self.snapshot())
+
+    def start_probes(self, interval_seconds=10.0):
+        """Starts a daemon thread that probes every endpoint immediately and then every `interval_seconds`."""
+        if self._probe_thread and self._probe_thread.is_alive():
+            logger.debug("Probe thread already running.")
+            return
+        self._probe_stop.clear()
+
+        def _loop():
+            self.probe_all()
+            while not self._probe_stop.wait(interval_seconds):
+                self.probe_all()
+
+        self._probe_thread = threading.Thread(target=_loop, name="ollama-probes", daemon=True)
+        self._probe_thread.start()
+        logger.info("Endpoint probe thread started (interval: %.1fs).", interval_seconds)
+
+    def stop_probes(self):
+        self._probe_stop.set()
+        if self._probe_thread:
+            self._probe_thread.join(timeout=PROBE_TIMEOUT_SECONDS * 2 + 1)
+            self._probe_thread = None
+            logger.info("Endpoint probe thread stopped.")
+
+    def snapshot(self):
+        with self._lock:
+            return [e.snapshot() for e in self.endpoints]
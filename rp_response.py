@@ -1,20 +1,33 @@
 # rp_response.py (Local Ollama - configurable runtime)
 import argparse
+import asyncio
+import json
 import logging
 import logging.handlers
 import os
+import random
 import sys
+import threading
 import time
+from collections import deque
 from dataclasses import dataclass
+from typing import Optional
 
 import requests
 
 from active_memory import ActiveMemoryFile
+from batch_runner import BatchRun, format_summary, load_transcripts
 from character_memory import CharacterMemory, UserMemory
 from dynamic_memory import DynamicMemory
 from emotionalcore import EmotionalCore
-from generator import RPDialogueGenerator
+from generator import AsyncRPDialogueGenerator
+from llm_cache import CACHE_MODES, LLMResponseCache
 from logic import RPLogic
+from sqlite_store import STORAGE_BACKENDS
+from summarizer import SUMMARIZERS
+from rp_server import DEFAULT_HOST, DEFAULT_PORT, serve
+from session import SessionPool
+from turn_pipeline import DeferredWriter, run_turn
 
 
 @dataclass
@@ -23,24 +36,202 @@ class AppConfig:
     ollama_base_url: str
     user_name: str
     seed_initial_context: bool
+    keep_alive: str = "30m"
+    keep_alive_interval: float = 240.0
+    warm_up: bool = True
+    action_model: Optional[str] = None
+    summary_model: Optional[str] = None
+    fallback_model: Optional[str] = None
+    turn_budget: float = 90.0
+    min_tokens_per_sec: float = 3.0
+    hedge_after: float = 0.0
+    probe_interval: float = 10.0
+    num_parallel: Optional[int] = None
+    llm_cache: str = "off"
+    llm_cache_dir: str = "llm_cache"
+    seed: Optional[int] = None
+    script: Optional[str] = None
+    sessions_dir: str = "sessions"
+    parallelism: int = 4
+    report_path: Optional[str] = None
+    serve: bool = False
+    host: str = "127.0.0.1"
+    port: int = 8765
+    max_sessions: int = 64
+    max_session_bytes: int = 0
+    session_idle_ttl: float = 1800.0
+    storage: str = "files"
+    summarizer: str = "extractive"
 
 
 DEFAULT_MODEL_NAME = "qwen3:8b"
 DEFAULT_MODEL_NAME = "mistral-small3.1:24b"
 DEFAULT_OLLAMA_BASE_URL = "http://localhost:11434"
 DEFAULT_USER_NAME = "Lin"
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_KEEP_ALIVE_INTERVAL = 240.0
+DEFAULT_TURN_BUDGET = 90.0
+DEFAULT_MIN_TOKENS_PER_SEC = 3.0
+DEFAULT_PROBE_INTERVAL = 10.0
+DEFAULT_LLM_CACHE_DIR = "llm_cache"
+DEFAULT_SESSIONS_DIR = "sessions"
+DEFAULT_PARALLELISM = 4
+DEFAULT_MAX_SESSIONS = 64
+DEFAULT_SESSION_IDLE_TTL = 1800.0
+TURN_REPORT_WINDOW = 50 # Turns kept for the per-stage latency summary
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Run the Project Alyssa roleplay loop.")
     parser.add_argument("--model", default=os.getenv("ALYSSA_OLLAMA_MODEL", DEFAULT_MODEL_NAME))
-    parser.add_argument("--ollama-url", default=os.getenv("ALYSSA_OLLAMA_BASE_URL", DEFAULT_OLLAMA_BASE_URL))
+    parser.add_argument(
+        "--ollama-url",
+        default=os.getenv("ALYSSA_OLLAMA_BASE_URL", DEFAULT_OLLAMA_BASE_URL),
+        help="Ollama base URL, or a comma-separated list of hosts to load-balance across.",
+    )
     parser.add_argument("--user-name", default=os.getenv("ALYSSA_USER_NAME", DEFAULT_USER_NAME))
+    parser.add_argument(
+        "--action-model",
+        default=os.getenv("ALYSSA_ACTION_MODEL"),
+        help="Model for the short narrative-action call (defaults to --model).",
+    )
+    parser.add_argument(
+        "--summary-model",
+        default=os.getenv("ALYSSA_SUMMARY_MODEL"),
+        help="Model for summarization calls (defaults to --model).",
+    )
+    parser.add_argument(
+        "--fallback-model",
+        default=os.getenv("ALYSSA_FALLBACK_MODEL"),
+        help="Faster model used when the primary misses its latency deadline or token-rate floor.",
+    )
+    parser.add_argument(
+        "--turn-budget",
+        type=float,
+        default=float(os.getenv("ALYSSA_TURN_BUDGET", DEFAULT_TURN_BUDGET)),
+        help="Max seconds a turn may spend waiting on Ollama before falling back to canned output.",
+    )
+    parser.add_argument(
+        "--min-tokens-per-sec",
+        type=float,
+        default=float(os.getenv("ALYSSA_MIN_TOKENS_PER_SEC", DEFAULT_MIN_TOKENS_PER_SEC)),
+        help="Token-rate floor below which the primary model is cancelled in favour of --fallback-model.",
+    )
+    parser.add_argument(
+        "--hedge-after",
+        type=float,
+        default=float(os.getenv("ALYSSA_HEDGE_AFTER", 0.0)),
+        help="Seconds before the narrative-action call is duplicated on a second Ollama host (0 disables hedging).",
+    )
+    parser.add_argument(
+        "--probe-interval",
+        type=float,
+        default=float(os.getenv("ALYSSA_PROBE_INTERVAL", DEFAULT_PROBE_INTERVAL)),
+        help="Seconds between background health probes of the Ollama hosts.",
+    )
+    parser.add_argument(
+        "--num-parallel",
+        type=int,
+        default=int(os.environ["OLLAMA_NUM_PARALLEL"]) if os.getenv("OLLAMA_NUM_PARALLEL") else None,
+        help="Requests each Ollama host serves at once (match the server's OLLAMA_NUM_PARALLEL; default 1). "
+             "Extra calls wait in a fair queue: action before dialogue before summary, round-robin across sessions.",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        choices=CACHE_MODES,
+        default=os.getenv("ALYSSA_LLM_CACHE", "off"),
+        help="LLM response cache: 'record' writes every response to disk, 'replay' serves only recorded responses (no Ollama needed).",
+    )
+    parser.add_argument(
+        "--llm-cache-dir",
+        default=os.getenv("ALYSSA_LLM_CACHE_DIR", DEFAULT_LLM_CACHE_DIR),
+        help="Directory of the LLM response cache.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=int(os.environ["ALYSSA_SEED"]) if os.getenv("ALYSSA_SEED") else None,
+        help="Seed the random module (EmotionalCore, fallbacks) so recorded sessions replay with identical prompts.",
+    )
+    parser.add_argument(
+        "--script",
+        help="Non-interactive mode: replay user turns from a JSONL file ({\"session\": id, \"turns\": [...]} per line).",
+    )
+    parser.add_argument(
+        "--sessions-dir",
+        default=os.getenv("ALYSSA_SESSIONS_DIR", DEFAULT_SESSIONS_DIR),
+        help="Script mode: each session keeps its state and transcript in <sessions-dir>/<session id>/.",
+    )
+    parser.add_argument(
+        "--parallelism",
+        type=int,
+        default=int(os.getenv("ALYSSA_PARALLELISM", DEFAULT_PARALLELISM)),
+        help="Script mode: how many sessions run concurrently.",
+    )
+    parser.add_argument(
+        "--report",
+        help="Script mode: also write the run summary (turns/s, stage latencies, error rates) to this JSON file.",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Server mode: expose the turn loop over HTTP/WebSocket, one session per id (state under --sessions-dir).",
+    )
+    parser.add_argument("--host", default=os.getenv("ALYSSA_HOST", DEFAULT_HOST), help="Server mode: address to bind.")
+    parser.add_argument("--port", type=int, default=int(os.getenv("ALYSSA_PORT", DEFAULT_PORT)), help="Server mode: port to bind.")
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=int(os.getenv("ALYSSA_MAX_SESSIONS", DEFAULT_MAX_SESSIONS)),
+        help="Server mode: sessions kept in memory; least recently used ones are snapshotted to disk (0 = unbounded).",
+    )
+    parser.add_argument(
+        "--max-session-bytes",
+        type=int,
+        default=int(os.getenv("ALYSSA_MAX_SESSION_BYTES", 0)),
+        help="Server mode: approximate memory budget for resident sessions, in bytes (0 = no byte budget).",
+    )
+    parser.add_argument(
+        "--session-idle-ttl",
+        type=float,
+        default=float(os.getenv("ALYSSA_SESSION_IDLE_TTL", DEFAULT_SESSION_IDLE_TTL)),
+        help="Server mode: seconds without requests before a session is snapshotted and evicted (0 disables).",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_BACKENDS,
+        default=os.getenv("ALYSSA_STORAGE", "files"),
+        help="State backend: JSON/FAISS files with a turn journal, or one SQLite (WAL) database per session "
+             "committed once per turn (existing files are imported on first use).",
+    )
+    parser.add_argument(
+        "--summarizer",
+        choices=SUMMARIZERS,
+        default=os.getenv("ALYSSA_SUMMARIZER", "extractive"),
+        help="Long-term memory compression: the most representative sentences of each batch (embedding clustering + "
+             "TextRank), or whole turns picked by keyword.",
+    )
     parser.add_argument(
         "--skip-initial-context",
         action="store_true",
         help="Do not seed the default initial context event into memory on startup.",
     )
+    parser.add_argument(
+        "--keep-alive",
+        default=os.getenv("ALYSSA_OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE),
+        help="How long Ollama keeps the model loaded after each request (e.g. '30m', '-1' for forever).",
+    )
+    parser.add_argument(
+        "--keep-alive-interval",
+        type=float,
+        default=float(os.getenv("ALYSSA_KEEP_ALIVE_INTERVAL", DEFAULT_KEEP_ALIVE_INTERVAL)),
+        help="Seconds of user inactivity before a keep-alive ping is sent (0 disables the pinger).",
+    )
+    parser.add_argument(
+        "--skip-warmup",
+        action="store_true",
+        help="Do not preload the model at startup.",
+    )
     return parser.parse_args()
 
 
@@ -50,9 +241,56 @@ def build_config(args: argparse.Namespace) -> AppConfig:
         ollama_base_url=args.ollama_url,
         user_name=args.user_name,
         seed_initial_context=not args.skip_initial_context,
+        keep_alive=args.keep_alive,
+        keep_alive_interval=args.keep_alive_interval,
+        warm_up=not args.skip_warmup,
+        action_model=args.action_model,
+        summary_model=args.summary_model,
+        fallback_model=args.fallback_model,
+        turn_budget=args.turn_budget,
+        min_tokens_per_sec=args.min_tokens_per_sec,
+        hedge_after=args.hedge_after,
+        probe_interval=args.probe_interval,
+        num_parallel=args.num_parallel,
+        llm_cache=args.llm_cache,
+        llm_cache_dir=args.llm_cache_dir,
+        seed=args.seed,
+        script=args.script,
+        sessions_dir=args.sessions_dir,
+        parallelism=args.parallelism,
+        report_path=args.report,
+        serve=args.serve,
+        host=args.host,
+        port=args.port,
+        max_sessions=args.max_sessions,
+        max_session_bytes=args.max_session_bytes,
+        session_idle_ttl=args.session_idle_ttl,
+        storage=args.storage,
+        summarizer=args.summarizer,
     )
 
 
+def parse_ollama_urls(value: str) -> list:
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+def build_routes(config: AppConfig) -> dict:
+    routes = {}
+    if config.action_model:
+        routes["action"] = {"model": config.action_model}
+    if config.summary_model:
+        routes["summary"] = {"model": config.summary_model}
+    return routes
+
+
+def build_latency_slo(config: AppConfig) -> dict:
+    return {
+        "turn_budget_s": config.turn_budget,
+        "min_tokens_per_s": config.min_tokens_per_sec,
+        "fallback_model": config.fallback_model,
+    }
+
+
 def configure_logging() -> None:
     log_formatter_detailed = logging.Formatter("%(asctime)s - %(levelname)-8s - %(name)-15s - %(message)s")
     root_logger = logging.getLogger()
@@ -87,15 +325,149 @@ def configure_logging() -> None:
 main_script_logger = logging.getLogger("rp_response")
 
 
-def main(config: AppConfig):
+async def create_generator(config: AppConfig):
+    """Pings the Ollama hosts and builds the generator. Returns (generator, warm-up task or None).
+
+    Raises ValueError if no URL is configured, and the last requests error if no host answered (unless replaying recorded responses).
+    """
+    ollama_urls = parse_ollama_urls(config.ollama_base_url)
+    if not ollama_urls:
+        raise ValueError(f"No Ollama URL given (--ollama-url / ALYSSA_OLLAMA_BASE_URL is {config.ollama_base_url!r}).")
+    reachable_urls = []
+    ping_error = None
+    for ollama_url in ollama_urls:
+        try:
+            ping_response = await asyncio.to_thread(requests.get, ollama_url, timeout=5)
+            ping_response.raise_for_status()
+            reachable_urls.append(ollama_url)
+            main_script_logger.info("Ollama server responded at %s.", ollama_url)
+        except requests.exceptions.RequestException as err:
+            ping_error = err
+            main_script_logger.warning("Ollama server at %s did not respond: %s", ollama_url, err)
+    replaying = config.llm_cache == "replay"
+    if not reachable_urls and not replaying:
+        raise ping_error
+
+    dialogue_generator = AsyncRPDialogueGenerator(
+        model_name=config.model_name,
+        ollama_base_url=ollama_urls,
+        keep_alive=config.keep_alive,
+        routes=build_routes(config),
+        latency_slo=build_latency_slo(config),
+        hedge_after_s=config.hedge_after,
+        num_parallel=config.num_parallel,
+        response_cache=LLMResponseCache(config.llm_cache_dir, mode=config.llm_cache),
+    )
+    for ollama_url in ollama_urls:
+        if ollama_url not in reachable_urls:
+            dialogue_generator.pool.mark_unhealthy(ollama_url, reason="Startup ping failed.")
+    if len(ollama_urls) > 1:
+        dialogue_generator.pool.start_probes(config.probe_interval)
+    warm_up_task = None
+    if replaying:
+        main_script_logger.info("Replaying recorded LLM responses from %s. Ollama is not needed.", config.llm_cache_dir)
+    elif config.warm_up:
+        main_script_logger.info("Preloading model %s in background...", config.model_name)
+        warm_up_task = asyncio.create_task(dialogue_generator.warm_up())
+    return dialogue_generator, warm_up_task
+
+
+def seed_initial_context(logic: RPLogic) -> None:
+    """Adds the default background event to vector and dynamic memory."""
+    try:
+        main_script_logger.info("Injecting initial context event into memory...")
+        if logic and logic.vector_memory:
+            initial_context_event_text = (
+                "Background: Lin fell asleep at Poppy's house yesterday, missing project work. "
+                "They are now in Science Class. Poppy is irritated about the extra work."
+            )
+            initial_metadata = {
+                "timestamp": time.time(),
+                "roleplay_time": logic.current_roleplay_time.isoformat(),
+                "location": logic.dynamic_memory.location,
+                "action": logic.dynamic_memory.current_action,
+                "topic": logic.current_topic_focus,
+                "type": "system_context",
+            }
+            logic.vector_memory.add_memory(initial_context_event_text, metadata=initial_metadata)
+            if logic.active_memory:
+                logic.dynamic_memory.add_memory(f"System Context: {initial_context_event_text}", logic.active_memory)
+            else:
+                logic.dynamic_memory.add_memory(f"System Context: {initial_context_event_text}")
+            main_script_logger.info("Initial context event added to VectorMemoryStore and DynamicMemory.")
+        else:
+            main_script_logger.warning("Skipping initial context injection: Logic or VectorMemoryStore not available.")
+    except Exception as init_mem_err:
+        main_script_logger.error("Error injecting initial context event: %s", init_mem_err, exc_info=True)
+
+
+def log_generator_stats(dialogue_generator: AsyncRPDialogueGenerator, config: AppConfig) -> None:
+    """Logs the generator's cache, hedging, routing, tier and early-stop counters."""
+    if dialogue_generator.response_cache.enabled:
+        main_script_logger.info("LLM response cache (%s): %s", config.llm_cache, dialogue_generator.response_cache.stats)
+    if dialogue_generator.hedge_stats["hedged"]:
+        main_script_logger.info("Hedged calls: %s", dialogue_generator.hedge_stats)
+    for route_name, stats in dialogue_generator.route_stats().items():
+        main_script_logger.info(
+            "Route '%s' (%s): %d calls, mean %.2fs, max %.2fs",
+            route_name, stats["model"], stats["count"], stats["mean_s"], stats["max_s"],
+        )
+    for route_name, tier_counts in dialogue_generator.tier_stats().items():
+        main_script_logger.info("Route '%s' answered by tier: %s", route_name, tier_counts)
+    for route_name, stats in dialogue_generator.scheduler.delay_stats().items():
+        main_script_logger.info(
+            "Route '%s' queueing delay: %d calls, mean %.3fs, p95 %.3fs, max %.3fs",
+            route_name, stats["count"], stats["mean_s"], stats["p95_s"], stats["max_s"],
+        )
+    main_script_logger.info(
+        "Early-stopped streams: %d (%d on Ollama stop sequences; saved up to %d tokens)",
+        dialogue_generator.early_stop_stats["early_stops"],
+        dialogue_generator.early_stop_stats["stop_sequence_stops"],
+        dialogue_generator.early_stop_stats["tokens_saved_upper_bound"],
+    )
+
+
+async def ainput(prompt: str = "") -> str:
+    """input() that does not block the event loop (keep-alive and probes keep running while we wait).
+
+    Uses a daemon thread rather than the default executor so a pending read cannot hold up interpreter exit after Ctrl+C.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _deliver(setter, value):
+        try:
+            loop.call_soon_threadsafe(lambda: future.done() or setter(value))
+        except RuntimeError:
+            pass  # Loop already closed (shutdown while waiting for input)
+
+    def _read():
+        try:
+            result = input(prompt)
+        except BaseException as exc:  # EOFError / KeyboardInterrupt are re-raised in the loop
+            _deliver(future.set_exception, exc)
+        else:
+            _deliver(future.set_result, result)
+
+    threading.Thread(target=_read, name="stdin-reader", daemon=True).start()
+    return await future
+
+
+async def main_async(config: AppConfig):
     main_script_logger.info("--- Starting main function (Local Ollama Mode) ---")
     main_script_logger.info("--- Using Model: %s ---", config.model_name)
     main_script_logger.info("--- Ollama URL: %s ---", config.ollama_base_url)
 
+    if config.seed is not None:
+        random.seed(config.seed)
+        main_script_logger.info("--- Random seed: %d ---", config.seed)
+
     dialogue_generator = None
     logic = None
     character = None
     user = None
+    # Model warm-up runs in the background while the embedding model and saved state load
+    warm_up_task = None
 
     try:
         main_script_logger.info("Initializing components...")
@@ -108,14 +480,11 @@ def main(config: AppConfig):
 
         main_script_logger.info("Attempting to initialize generator with model: %s", config.model_name)
         try:
-            ping_response = requests.get(config.ollama_base_url, timeout=5)
-            ping_response.raise_for_status()
-            main_script_logger.info("Ollama server responded at %s.", config.ollama_base_url)
-
-            dialogue_generator = RPDialogueGenerator(
-                model_name=config.model_name,
-                ollama_base_url=config.ollama_base_url,
-            )
+            dialogue_generator, warm_up_task = await create_generator(config)
+        except ValueError as config_err:
+            main_script_logger.error("%s", config_err)
+            print(f"ERROR: {config_err}")
+            sys.exit(1)
         except requests.exceptions.Timeout:
             main_script_logger.error("Ollama server connection timed out at %s.", config.ollama_base_url)
             print(f"ERROR: Connection to Ollama timed out at {config.ollama_base_url}. Is it running and responsive?")
@@ -130,15 +499,27 @@ def main(config: AppConfig):
             sys.exit(1)
 
         main_script_logger.info("Initializing RPLogic (includes VectorMemoryStore)...")
-        logic = RPLogic(
+        logic = await asyncio.to_thread(
+            RPLogic,
             character_memory=character,
             active_memory=active,
             user_memory=user,
             emotional_core=emotional_core,
             dynamic_memory=dynamic,
+            storage=config.storage,
+            summarizer=config.summarizer,
         )
         main_script_logger.info("Components initialized successfully (state loaded if available).")
 
+        if warm_up_task is not None:
+            load_seconds = await warm_up_task
+            if load_seconds is None:
+                main_script_logger.warning("Model warm-up failed. The first turn will pay the model load time.")
+            else:
+                main_script_logger.info("Model warm-up finished (%.2fs).", load_seconds)
+        if config.keep_alive_interval > 0 and config.llm_cache != "replay":
+            dialogue_generator.start_keep_alive(config.keep_alive_interval)
+
     except ImportError as ie:
         main_script_logger.critical("Missing dependency while initializing: %s", ie, exc_info=True)
         print(f"FATAL: Missing dependency: {ie}. Install requirements with `pip install -r requirements.txt`.")
@@ -149,31 +530,7 @@ def main(config: AppConfig):
         sys.exit(1)
 
     if config.seed_initial_context:
-        try:
-            main_script_logger.info("Injecting initial context event into memory...")
-            if logic and logic.vector_memory:
-                initial_context_event_text = (
-                    "Background: Lin fell asleep at Poppy's house yesterday, missing project work. "
-                    "They are now in Science Class. Poppy is irritated about the extra work."
-                )
-                initial_metadata = {
-                    "timestamp": time.time(),
-                    "roleplay_time": logic.current_roleplay_time.isoformat(),
-                    "location": logic.dynamic_memory.location,
-                    "action": logic.dynamic_memory.current_action,
-                    "topic": logic.current_topic_focus,
-                    "type": "system_context",
-                }
-                logic.vector_memory.add_memory(initial_context_event_text, metadata=initial_metadata)
-                if logic.active_memory:
-                    logic.dynamic_memory.add_memory(f"System Context: {initial_context_event_text}", logic.active_memory)
-                else:
-                    logic.dynamic_memory.add_memory(f"System Context: {initial_context_event_text}")
-                main_script_logger.info("Initial context event added to VectorMemoryStore and DynamicMemory.")
-            else:
-                main_script_logger.warning("Skipping initial context injection: Logic or VectorMemoryStore not available.")
-        except Exception as init_mem_err:
-            main_script_logger.error("Error injecting initial context event: %s", init_mem_err, exc_info=True)
+        seed_initial_context(logic)
 
     current_location = logic.dynamic_memory.location if logic and logic.dynamic_memory else "Unknown Location"
     user_name_for_opening = user.user_name if user and hasattr(user, "user_name") else "User"
@@ -189,33 +546,56 @@ def main(config: AppConfig):
     print(opening_text)
     print("\n" + "-" * 50 + "\n")
 
+    turn_reports = deque(maxlen=TURN_REPORT_WINDOW)
+    # Post-turn memory/state writes run here while the user reads the reply and types
+    writer = DeferredWriter(window=TURN_REPORT_WINDOW)
     main_script_logger.info("Entering main interactive loop...")
     while True:
         try:
             user_name_for_prompt = user.user_name if user else "User"
-            user_input = input(f"{user_name_for_prompt} -> ")
-        except (EOFError, KeyboardInterrupt):
+            user_input = await ainput(f"{user_name_for_prompt} -> ")
+        except (EOFError, KeyboardInterrupt, asyncio.CancelledError):
+            await writer.barrier()
             if logic:
-                logic._save_state()
+                logic.close() # Stops the autosaver and saves synchronously
                 print("\nInput interrupted. State saved (if possible). Ending roleplay.")
             else:
                 print("\nInput interrupted before logic initialized. Cannot save state. Exiting.")
             break
 
         if user_input.lower() in ["quit", "exit"]:
+            await writer.barrier()
             if logic:
-                logic._save_state()
+                logic.close() # Stops the autosaver and saves synchronously
                 print("State saved. Roleplay ended. Bye!")
             else:
                 print("Exiting before logic initialized. Cannot save state. Bye!")
             break
 
+        # Save slots: /save <name>, /load <name> (rewind), /slots
+        command, _, slot_name = user_input.strip().partition(" ")
+        if logic and command.lower() in ("/save", "/load", "/slots"):
+            await writer.barrier()
+            try:
+                if command.lower() == "/slots":
+                    for meta in logic.list_slots():
+                        print(f"  {meta['name']}: turn {meta.get('turn')}, {meta.get('roleplay_time')}, {meta.get('location')}")
+                elif command.lower() == "/save":
+                    meta = await asyncio.to_thread(logic.save_slot, slot_name.strip())
+                    print(f"[Saved slot '{meta['name']}' ({meta['bytes_copied']} bytes copied)]")
+                else:
+                    meta = await asyncio.to_thread(logic.load_slot, slot_name.strip())
+                    print(f"[Rewound to slot '{meta['name']}': {meta.get('roleplay_time')}, {meta.get('location')}]")
+            except (FileNotFoundError, ValueError) as e:
+                print(f"[Slot error: {e}]")
+            continue
+
         image_url = None
         user_text_for_context = user_input
         if user_input.lower() == "image":
             try:
-                image_url = input("Enter the image URL: ")
-                user_text_about_image = input("Enter your message about the image: ")
+                image_url = await ainput("Enter the image URL: ")
+                user_text_about_image = await ainput("Enter your message about the image: ")
                 user_text_for_context = user_text_about_image
             except (EOFError, KeyboardInterrupt):
                 print("\nInput cancelled. Please try again.")
@@ -226,15 +606,12 @@ def main(config: AppConfig):
                 print("ERROR: Core components not initialized. Exiting.")
                 break
 
-            context = logic.construct_context(user_text_for_context)
-            ai_text_to_display, ai_text_for_memory = dialogue_generator.generate_response(context, image_url=image_url)
-
-            if logic.active_memory:
-                memory_input = user_input if not image_url else f"{user_text_about_image} [Image: {image_url}]"
-                logic.manage_dynamic_memory(memory_input, ai_text_for_memory)
-            else:
-                main_script_logger.warning("Active memory missing when calling manage_dynamic_memory.")
+            memory_input = user_input if not image_url else f"{user_text_about_image} [Image: {image_url}]"
+            ai_text_to_display = await run_turn(
+                logic, dialogue_generator, writer, user_text_for_context, memory_input, image_url=image_url, reports=turn_reports,
+            )
 
+            # Bookkeeping (and the time advance) for this turn is still running; show the time the reply was made at
             current_rp_time_obj = logic.current_roleplay_time
             time_str = current_rp_time_obj.strftime("%I:%M %p")
             char_name = character.character_name if character else "Character"
@@ -249,6 +626,115 @@ def main(config: AppConfig):
             print(f"[Error occurred. Check debug.log. Error: {e}]")
             print("\n" + "-" * 50 + "\n")
 
+    await writer.aclose()
+    if writer.write_durations:
+        main_script_logger.info(
+            "Deferred bookkeeping: %d writes, mean %.3fs off the reply path, mean wait %.3fs, %d errors",
+            len(writer.write_durations), sum(writer.write_durations) / len(writer.write_durations),
+            sum(writer.wait_durations) / max(len(writer.wait_durations), 1), writer.errors,
+        )
+    if dialogue_generator:
+        await dialogue_generator.aclose()
+        log_generator_stats(dialogue_generator, config)
+        if turn_reports:
+            critical_paths = [report["critical_path_s"] for report in turn_reports]
+            main_script_logger.info(
+                "Turn critical path over last %d turns: mean %.2fs, max %.2fs",
+                len(critical_paths), sum(critical_paths) / len(critical_paths), max(critical_paths),
+            )
+
+async def run_script_mode(config: AppConfig):
+    """Replays the sessions in config.script concurrently and prints throughput, stage latencies and error rates."""
+    main_script_logger.info("--- Script mode: %s (parallelism %d) ---", config.script, config.parallelism)
+    if config.seed is not None:
+        random.seed(config.seed)
+    try:
+        sessions = load_transcripts(config.script)
+    except (OSError, ValueError) as err:
+        main_script_logger.error("Could not read script %s: %s", config.script, err)
+        print(f"ERROR: Could not read script {config.script}: {err}")
+        sys.exit(1)
+
+    try:
+        dialogue_generator, warm_up_task = await create_generator(config)
+    except ValueError as err:
+        main_script_logger.error("%s", err)
+        print(f"ERROR: {err}")
+        sys.exit(1)
+    except requests.exceptions.RequestException as err:
+        main_script_logger.error("Ollama not reachable at %s: %s", config.ollama_base_url, err)
+        print(f"ERROR: Cannot connect to Ollama at {config.ollama_base_url}. Error: {err}")
+        sys.exit(1)
+    if warm_up_task is not None:
+        await warm_up_task
+
+    batch = BatchRun(
+        dialogue_generator,
+        sessions_dir=config.sessions_dir,
+        parallelism=config.parallelism,
+        user_name=config.user_name,
+        on_session_start=seed_initial_context if config.seed_initial_context else None,
+        logic_options={"storage": config.storage, "summarizer": config.summarizer},
+    )
+    try:
+        summary = await batch.run(sessions)
+    finally:
+        await dialogue_generator.aclose()
+    log_generator_stats(dialogue_generator, config)
+    print(format_summary(summary))
+    if config.report_path:
+        with open(config.report_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Report written to {config.report_path}")
+
+
+async def run_server_mode(config: AppConfig):
+    """Serves many sessions over HTTP/WebSocket until interrupted."""
+    main_script_logger.info("--- Server mode on %s:%d ---", config.host, config.port)
+    try:
+        dialogue_generator, warm_up_task = await create_generator(config)
+    except ValueError as err:
+        main_script_logger.error("%s", err)
+        print(f"ERROR: {err}")
+        sys.exit(1)
+    except requests.exceptions.RequestException as err:
+        main_script_logger.error("Ollama not reachable at %s: %s", config.ollama_base_url, err)
+        print(f"ERROR: Cannot connect to Ollama at {config.ollama_base_url}. Error: {err}")
+        sys.exit(1)
+    if warm_up_task is not None:
+        await warm_up_task
+    if config.keep_alive_interval > 0 and config.llm_cache != "replay":
+        dialogue_generator.start_keep_alive(config.keep_alive_interval)
+
+    pool = SessionPool(
+        config.sessions_dir,
+        config.user_name,
+        on_session_start=seed_initial_context if config.seed_initial_context else None,
+        max_sessions=config.max_sessions,
+        max_bytes=config.max_session_bytes,
+        idle_ttl=config.session_idle_ttl,
+        logic_options={"storage": config.storage, "summarizer": config.summarizer},
+    )
+    try:
+        await serve(dialogue_generator, pool, host=config.host, port=config.port)
+    finally:
+        await dialogue_generator.aclose()
+        log_generator_stats(dialogue_generator, config)
+
+
+def main(config: AppConfig):
+    """Blocking entry point: runs the async turn loop (or script/server mode) to completion."""
+    if config.serve:
+        mode = run_server_mode(config)
+    elif config.script:
+        mode = run_script_mode(config)
+    else:
+        mode = main_async(config)
+    try:
+        asyncio.run(mode)
+    except KeyboardInterrupt:
+        main_script_logger.info("Interrupted.")
+
 
 if __name__ == "__main__":
     configure_logging()
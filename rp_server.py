@@ -0,0 +1,210 @@
+# rp_server.py (HTTP/WebSocket front end: many sessions in one process)
+import asyncio
+import json
+import logging
+import time
+
+from aiohttp import WSMsgType, web
+
+from session import is_valid_session_id
+
+# Get a logger specific to this module
+logger = logging.getLogger('rp_server')
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class RPServer:
+    def __init__(self, dialogue_generator, pool):
+        """
+        Exposes the turn loop over HTTP and WebSocket.
+
+        Routes:
+            GET    /health                     generator hosts and session pool stats
+            POST   /sessions/{id}/turn         {"input": "...", "image_url": optional} -> reply
+            GET    /sessions/{id}              state summary (location, time, topic, fatigue...)
+            POST   /sessions/{id}/save         write the session's state to disk
+            DELETE /sessions/{id}              save and close the session
+            GET    /sessions/{id}/ws           WebSocket: send {"input": ...} (or plain text), receive replies
+            GET    /sessions/{id}/slots        save slots of the session
+            POST   /sessions/{id}/slots/{slot} save the session as slot {slot} ({"note": optional})
+            POST   /sessions/{id}/slots/{slot}/load    rewind the session to slot {slot}
+            POST   /sessions/{id}/slots/{slot}/branch  {"session": new id} -> new session starting from slot {slot}
+            DELETE /sessions/{id}/slots/{slot} delete slot {slot}
+        """
+        self.dialogue_generator = dialogue_generator
+        self.pool = pool
+        self.started_at = time.time()
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get("/health", self.health),
+            web.post("/sessions/{session_id}/turn", self.turn),
+            web.get("/sessions/{session_id}", self.session_state),
+            web.post("/sessions/{session_id}/save", self.save),
+            web.delete("/sessions/{session_id}", self.close_session),
+            web.get("/sessions/{session_id}/ws", self.websocket),
+            web.get("/sessions/{session_id}/slots", self.list_slots),
+            web.post("/sessions/{session_id}/slots/{slot}", self.save_slot),
+            web.post("/sessions/{session_id}/slots/{slot}/load", self.load_slot),
+            web.post("/sessions/{session_id}/slots/{slot}/branch", self.branch),
+            web.delete("/sessions/{session_id}/slots/{slot}", self.delete_slot),
+        ])
+        self.app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_shutdown(self, app):
+        logger.info("Server shutting down. Saving %d resident sessions...", len(self.pool))
+        await self.pool.close_all()
+
+    def _session_id(self, request):
+        session_id = request.match_info["session_id"]
+        if not is_valid_session_id(session_id):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "invalid session id"}), content_type="application/json")
+        return session_id
+
+    async def _json_payload(self, request):
+        """Optional JSON object body ({} when empty or not an object)."""
+        if not request.can_read_body:
+            return {}
+        try:
+            payload = await request.json()
+        except ValueError:
+            return {}
+        return payload if isinstance(payload, dict) else {}
+
+    def _slot_error(self, e):
+        status = 404 if isinstance(e, FileNotFoundError) else 409 if isinstance(e, FileExistsError) else 400
+        return web.json_response({"error": str(e)}, status=status)
+
+    async def _run_turn(self, session, payload):
+        user_text = payload.get("input")
+        if not isinstance(user_text, str) or not user_text.strip():
+            return {"error": "'input' must be a non-empty string"}, 400
+        reports = []
+        try:
+            reply = await session.turn(self.dialogue_generator, user_text, image_url=payload.get("image_url"), reports=reports)
+        except Exception as e:
+            logger.error("Turn failed for session '%s': %s", session.session_id, e, exc_info=True)
+            return {"error": str(e), "reply": self.dialogue_generator.fallback_dialogue}, 500
+        return {
+            "session": session.session_id,
+            "reply": reply,
+            "character": session.logic.character_memory.character_name if session.logic.character_memory else "Character",
+            "roleplay_time": session.logic.current_roleplay_time.isoformat(),
+            "report": reports[0] if reports else None,
+        }, 200
+
+    async def health(self, request):
+        return web.json_response({
+            "status": "ok",
+            "uptime_s": time.time() - self.started_at,
+            "sessions": self.pool.snapshot_stats(),
+            "ollama_hosts": self.dialogue_generator.pool.snapshot(),
+            "llm_scheduler": self.dialogue_generator.scheduler.snapshot(),
+        })
+
+    async def turn(self, request):
+        session_id = self._session_id(request)
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({"error": "body must be JSON"}, status=400)
+        async with self.pool.checkout(session_id) as session:
+            body, status = await self._run_turn(session, payload if isinstance(payload, dict) else {})
+        return web.json_response(body, status=status)
+
+    async def session_state(self, request):
+        async with self.pool.checkout(self._session_id(request)) as session:
+            return web.json_response(session.state_summary())
+
+    async def save(self, request):
+        async with self.pool.checkout(self._session_id(request)) as session:
+            await session.save()
+        return web.json_response({"session": session.session_id, "saved": True})
+
+    async def close_session(self, request):
+        closed = await self.pool.close(self._session_id(request))
+        return web.json_response({"closed": closed}, status=200 if closed else 404)
+
+    async def list_slots(self, request):
+        async with self.pool.checkout(self._session_id(request)) as session:
+            slots = await asyncio.to_thread(session.logic.list_slots)
+        return web.json_response({"session": session.session_id, "slots": slots})
+
+    async def save_slot(self, request):
+        payload = await self._json_payload(request)
+        async with self.pool.checkout(self._session_id(request)) as session:
+            try:
+                meta = await session.save_slot(request.match_info["slot"], note=payload.get("note"))
+            except ValueError as e:
+                return self._slot_error(e)
+        return web.json_response({"session": session.session_id, "slot": meta})
+
+    async def load_slot(self, request):
+        async with self.pool.checkout(self._session_id(request)) as session:
+            try:
+                meta = await session.load_slot(request.match_info["slot"])
+            except (FileNotFoundError, ValueError) as e:
+                return self._slot_error(e)
+            return web.json_response({"slot": meta, "state": session.state_summary()})
+
+    async def branch(self, request):
+        session_id = self._session_id(request)
+        payload = await self._json_payload(request)
+        new_session_id = payload.get("session")
+        if not isinstance(new_session_id, str):
+            return web.json_response({"error": "'session' (new session id) is required"}, status=400)
+        try:
+            meta = await self.pool.branch(session_id, request.match_info["slot"], new_session_id)
+        except (FileNotFoundError, FileExistsError, ValueError) as e:
+            return self._slot_error(e)
+        return web.json_response({"session": new_session_id, "branched_from": {"session": session_id, "slot": meta}})
+
+    async def delete_slot(self, request):
+        async with self.pool.checkout(self._session_id(request)) as session:
+            try:
+                deleted = await asyncio.to_thread(session.logic.slots.delete, request.match_info["slot"])
+            except ValueError as e:
+                return self._slot_error(e)
+        return web.json_response({"deleted": deleted}, status=200 if deleted else 404)
+
+    async def websocket(self, request):
+        session_id = self._session_id(request)
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        logger.info("WebSocket connected for session '%s'.", session_id)
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                if message.type == WSMsgType.ERROR:
+                    logger.warning("WebSocket error for session '%s': %s", session_id, ws.exception())
+                continue
+            try:
+                payload = json.loads(message.data)
+                if not isinstance(payload, dict):
+                    payload = {"input": str(payload)}
+            except ValueError:
+                payload = {"input": message.data} # Plain text is taken as the user's line
+            # Checked out per message: an idle connection does not pin its session in memory
+            async with self.pool.checkout(session_id) as session:
+                body, _ = await self._run_turn(session, payload)
+            await ws.send_json(body)
+        logger.info("WebSocket closed for session '%s'.", session_id)
+        return ws
+
+
+async def serve(dialogue_generator, pool, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Runs the server until cancelled (Ctrl+C), then saves every resident session."""
+    server = RPServer(dialogue_generator, pool)
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    pool.start_reaper()
+    logger.info("RP server listening on http://%s:%d", host, port)
+    print(f"Serving on http://{host}:{port} (sessions in {pool.sessions_dir}). Press Ctrl+C to stop.")
+    try:
+        await asyncio.Event().wait()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await runner.cleanup() # Triggers on_shutdown, which saves the sessions
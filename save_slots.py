@@ -0,0 +1,162 @@
+# save_slots.py
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.slots')
+
+SLOTS_DIR = "slots"
+SLOT_META_FILE = "slot.json"
+SLOT_NAME_REGEX = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_slot_name(name):
+    """Slot names become directory names, so only a safe character set is accepted."""
+    return isinstance(name, str) and bool(SLOT_NAME_REGEX.match(name))
+
+
+def share_file(src, dst):
+    """Hard-links `src` to `dst` (no data copied); falls back to a copy where links are not supported."""
+    try:
+        os.link(src, dst)
+        return 0
+    except OSError:
+        shutil.copy2(src, dst)
+        return os.path.getsize(dst)
+
+
+class SaveSlots:
+    def __init__(self, slots_dir=SLOTS_DIR):
+        """
+        Named save slots of a session's state files, one directory per slot.
+
+        Files the owner only ever replaces atomically (write aside + rename) are hard-linked into the
+        slot, so a slot or a branch shares their data until the live copy is next rewritten
+        (copy-on-write at file level). Files written in place (the turn journal, a SQLite database)
+        are copied.
+        """
+        self.slots_dir = slots_dir
+
+    def path(self, name):
+        if not is_valid_slot_name(name):
+            raise ValueError(f"Invalid slot name '{name}'")
+        return os.path.join(self.slots_dir, name)
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.path(name), SLOT_META_FILE))
+
+    def meta(self, name):
+        if not self.exists(name):
+            raise FileNotFoundError(f"No save slot '{name}'")
+        with open(os.path.join(self.path(name), SLOT_META_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def list(self):
+        """Slot metadata, oldest first."""
+        if not os.path.isdir(self.slots_dir):
+            return []
+        slots = []
+        for name in os.listdir(self.slots_dir):
+            if is_valid_slot_name(name) and self.exists(name):
+                try:
+                    slots.append(self.meta(name))
+                except (IOError, ValueError) as e:
+                    logger.warning("Unreadable save slot '%s': %s", name, e)
+        return sorted(slots, key=lambda meta: meta.get("created_at", 0))
+
+    def save(self, name, shared=(), copied=(), writers=None, meta=None):
+        """
+        Writes slot `name` (replacing an existing one).
+
+        Args:
+            shared (list[str]): Paths hard-linked into the slot (missing ones are skipped).
+            copied (list[str]): Paths copied into the slot.
+            writers (dict): File name -> callable(dst_path) writing that file (e.g. a database backup).
+            meta (dict): Extra metadata stored in slot.json.
+        Returns:
+            dict: The slot metadata.
+        """
+        final_dir = self.path(name)
+        tmp_dir = os.path.join(self.slots_dir, f".tmp-{name}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        files, bytes_copied = {}, 0
+        try:
+            for src in shared:
+                if os.path.exists(src):
+                    bytes_copied += share_file(src, os.path.join(tmp_dir, os.path.basename(src)))
+                    files[os.path.basename(src)] = "shared"
+            for src in copied:
+                if os.path.exists(src):
+                    shutil.copy2(src, os.path.join(tmp_dir, os.path.basename(src)))
+                    bytes_copied += os.path.getsize(src)
+                    files[os.path.basename(src)] = "copied"
+            for filename, write in (writers or {}).items():
+                dst = os.path.join(tmp_dir, filename)
+                write(dst)
+                bytes_copied += os.path.getsize(dst)
+                files[filename] = "copied"
+            slot_meta = dict(meta or {}, name=name, created_at=time.time(), files=files, bytes_copied=bytes_copied)
+            with open(os.path.join(tmp_dir, SLOT_META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(slot_meta, f, ensure_ascii=False, indent=2)
+            # Swap in the complete slot; a crash leaves either the old one or the new one
+            old_dir = os.path.join(self.slots_dir, f".old-{name}")
+            shutil.rmtree(old_dir, ignore_errors=True)
+            if os.path.exists(final_dir):
+                os.replace(final_dir, old_dir)
+            os.replace(tmp_dir, final_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        logger.info("Save slot '%s' written to %s (%d files, %d bytes copied).", name, final_dir, len(files), bytes_copied)
+        return slot_meta
+
+    def restore(self, name, targets):
+        """
+        Puts slot `name`'s files in place.
+
+        Args:
+            targets (dict): File name -> destination path, for every file the owner manages. Destinations
+                            of files the slot does not hold are removed (e.g. a newer turn journal).
+        Returns:
+            dict: The slot metadata.
+        """
+        slot_dir = self.path(name)
+        slot_meta = self.meta(name)
+        for filename, dst in targets.items():
+            if os.path.exists(dst):
+                os.remove(dst)
+            mode = slot_meta["files"].get(filename)
+            if mode is None:
+                continue
+            src = os.path.join(slot_dir, filename)
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            if mode == "shared":
+                share_file(src, dst)
+            else:
+                shutil.copy2(src, dst) # The live file is written in place: it must not touch the slot's copy
+        logger.info("Save slot '%s' restored (%d files).", name, len(slot_meta["files"]))
+        return slot_meta
+
+    def branch(self, name, state_dir):
+        """Materializes slot `name` as a new session state directory (a new session opened there continues from the slot)."""
+        if os.path.isdir(state_dir) and os.listdir(state_dir):
+            raise FileExistsError(f"State directory '{state_dir}' is not empty")
+        slot_meta = self.meta(name)
+        os.makedirs(state_dir, exist_ok=True)
+        self.restore(name, {filename: os.path.join(state_dir, filename) for filename in slot_meta["files"]})
+        logger.info("Branched save slot '%s' into %s.", name, state_dir)
+        return slot_meta
+
+    def delete(self, name):
+        slot_dir = self.path(name)
+        if not os.path.exists(slot_dir):
+            return False
+        shutil.rmtree(slot_dir)
+        logger.info("Save slot '%s' deleted.", name)
+        return True
@@ -0,0 +1,376 @@
+# session.py (One conversation: its RPLogic, memories and state directory)
+import asyncio
+import logging
+import os
+import pickle
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from active_memory import ActiveMemoryFile
+from character_memory import CharacterMemory, UserMemory
+from dynamic_memory import DynamicMemory
+from emotionalcore import EmotionalCore
+from logic import RPLogic
+from save_slots import SLOTS_DIR, SaveSlots
+from long_term_memory import LONG_TERM_MEMORY_FILE, LongTermMemoryFile
+from turn_pipeline import DeferredWriter, run_turn
+
+# Get a logger specific to this module
+logger = logging.getLogger('session')
+
+SESSION_ID_REGEX = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+SNAPSHOT_FILE = "session_snapshot.pkl" # Full in-memory state of an evicted session (vector store excluded)
+SNAPSHOT_VERSION = 12 # Bumped when RPLogic gains state (2: turn journal, 3: autosaver, 4: SQLite store, 5: TurnEvent memories, 6: deque buffers, 7: JSONL LTM index, 8: summary index, 9: extractive summarizer, 10: consolidation thread, 11: emotion vectors, 12: emotion state back to dicts)
+UNSAFE_ID_CHARS_REGEX = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def is_valid_session_id(session_id):
+    """Session ids become directory names, so only a safe character set is accepted."""
+    return bool(SESSION_ID_REGEX.match(session_id)) and session_id not in (".", "..")
+
+
+def session_state_dir(sessions_dir, session_id):
+    return os.path.join(sessions_dir, UNSAFE_ID_CHARS_REGEX.sub("_", session_id))
+
+
+def write_snapshot(logic, state_dir, turns):
+    """Pickles the session's objects (RPLogic and the memories it references) except the vector store.
+
+    The vector store is persisted by RPLogic.close(), which must run first. Returns the snapshot size in bytes.
+    """
+    vector_memory = logic.vector_memory
+    logic.vector_memory = None # SentenceTransformer/FAISS are shared or saved separately
+    try:
+        data = pickle.dumps({"version": SNAPSHOT_VERSION, "logic": logic, "turns": turns}, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        logic.vector_memory = vector_memory
+    path = os.path.join(state_dir, SNAPSHOT_FILE)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return len(data)
+
+
+def read_snapshot(state_dir):
+    """Loads and removes an eviction snapshot. Returns (logic, turns) or None if there is none (or it is unusable)."""
+    path = os.path.join(state_dir, SNAPSHOT_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f) # Only ever written by write_snapshot for this state directory
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {snapshot.get('version')}")
+        logic = snapshot["logic"]
+    except Exception as e:
+        logger.error("Ignoring unusable session snapshot '%s': %s", path, e, exc_info=True)
+        return None
+    finally:
+        # A snapshot is consumed on load: later saves go to the JSON state, so a left-over snapshot would be stale
+        try: os.remove(path)
+        except OSError: pass
+    logic._init_vector_memory()
+    logic.last_real_time = time.time()
+    return logic, snapshot.get("turns", 0)
+
+
+def estimate_session_bytes(logic):
+    """Rough resident size of a session: pickled size of its objects plus the vector index and texts."""
+    vector_memory = logic.vector_memory
+    logic.vector_memory = None
+    try:
+        size = len(pickle.dumps(logic, protocol=pickle.HIGHEST_PROTOCOL))
+    finally:
+        logic.vector_memory = vector_memory
+    if vector_memory is not None and getattr(vector_memory, "index", None) is not None:
+        size += vector_memory.index.ntotal * vector_memory.embedding_dim * 4
+        size += sum(len(m.get("text", "")) for m in vector_memory.memory_data)
+    return size
+
+
+def create_session_logic(state_dir, user_name, **logic_options):
+    """Builds the memory components and RPLogic for one session, with all state files under `state_dir`.
+
+    `logic_options` are passed on to RPLogic (e.g. storage="sqlite").
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    character = CharacterMemory()
+    active = ActiveMemoryFile(long_term_file=LongTermMemoryFile(os.path.join(state_dir, LONG_TERM_MEMORY_FILE)))
+    user = UserMemory()
+    user.user_name = user_name
+    emotional_core = EmotionalCore(character_memory=character)
+    dynamic = DynamicMemory()
+    return RPLogic(
+        character_memory=character,
+        active_memory=active,
+        user_memory=user,
+        emotional_core=emotional_core,
+        dynamic_memory=dynamic,
+        state_dir=state_dir,
+        **logic_options,
+    )
+
+
+class Session:
+    def __init__(self, session_id, logic, state_dir, turns=0):
+        """A live conversation. Turns are serialized per session; different sessions run concurrently."""
+        self.session_id = session_id
+        self.logic = logic
+        self.state_dir = state_dir
+        self.writer = DeferredWriter()
+        self.lock = asyncio.Lock()
+        self.created_at = time.time()
+        self.last_used = time.time()
+        self.turns = turns
+        self.size_bytes = 0 # Estimated resident size, refreshed by SessionPool when it has a byte budget
+
+    @classmethod
+    async def open(cls, session_id, sessions_dir, user_name, on_session_start=None, logic_options=None):
+        """Creates the session's components in a worker thread: from an eviction snapshot if present, else from saved state."""
+        state_dir = session_state_dir(sessions_dir, session_id)
+        restored = await asyncio.to_thread(read_snapshot, state_dir)
+        if restored is not None:
+            logic, turns = restored
+            logger.info("Session '%s' rehydrated from snapshot (state in %s).", session_id, state_dir)
+            return cls(session_id, logic, state_dir, turns=turns)
+        logic = await asyncio.to_thread(create_session_logic, state_dir, user_name, **(logic_options or {}))
+        if on_session_start:
+            await asyncio.to_thread(on_session_start, logic)
+        logger.info("Session '%s' opened (state in %s).", session_id, state_dir)
+        return cls(session_id, logic, state_dir)
+
+    async def turn(self, dialogue_generator, user_text, image_url=None, reports=None):
+        """Runs one turn and returns the reply."""
+        async with self.lock:
+            self.last_used = time.time()
+            memory_input = user_text if not image_url else f"{user_text} [Image: {image_url}]"
+            reply = await run_turn(self.logic, dialogue_generator, self.writer, user_text, memory_input, image_url=image_url, reports=reports, session_id=self.session_id)
+            self.turns += 1
+            self.last_used = time.time()
+            return reply
+
+    def state_summary(self):
+        logic = self.logic
+        return {
+            "session": self.session_id,
+            "turns": self.turns,
+            "roleplay_time": logic.current_roleplay_time.isoformat(),
+            "location": logic.dynamic_memory.location,
+            "action": logic.dynamic_memory.current_action,
+            "topic": logic.current_topic_focus,
+            "pending_location": logic.pending_location_target,
+            "is_sleeping": logic.is_sleeping,
+            "fatigue_level": logic.emotional_core.fatigue_level,
+            "last_used": self.last_used,
+        }
+
+    async def save(self):
+        """Commits deferred bookkeeping and writes the session's state to its directory."""
+        async with self.lock:
+            await self.writer.barrier()
+            await asyncio.to_thread(self.logic._save_state)
+
+    async def save_slot(self, name, note=None):
+        """Commits deferred bookkeeping and records the session as save slot `name`."""
+        async with self.lock:
+            await self.writer.barrier()
+            return await asyncio.to_thread(self.logic.save_slot, name, note)
+
+    async def load_slot(self, name):
+        """Rewinds the session to save slot `name`."""
+        async with self.lock:
+            await self.writer.barrier()
+            self.last_used = time.time()
+            return await asyncio.to_thread(self.logic.load_slot, name)
+
+    async def close(self, snapshot=False):
+        """Saves and stops the session's background writer and autosaver. With `snapshot`, also pickles its full state for rehydration."""
+        async with self.lock:
+            await self.writer.barrier()
+            await asyncio.to_thread(self.logic.close)
+        await self.writer.aclose()
+        if snapshot:
+            size = await asyncio.to_thread(write_snapshot, self.logic, self.state_dir, self.turns)
+            logger.info("Session '%s' snapshotted (%d bytes) after %d turns.", self.session_id, size, self.turns)
+        else:
+            logger.info("Session '%s' closed after %d turns.", self.session_id, self.turns)
+
+
+class SessionPool:
+    def __init__(self, sessions_dir, user_name, on_session_start=None, max_sessions=0, max_bytes=0, idle_ttl=0.0, logic_options=None):
+        """
+        Resident sessions by id, bounded by count and/or estimated bytes.
+
+        Least recently used sessions beyond a bound, and sessions idle longer than `idle_ttl` seconds,
+        are snapshotted to their state directory and dropped from memory; the next request for them
+        rehydrates them. 0 disables a bound. Sessions in the middle of a turn are never evicted.
+        `logic_options` are passed to RPLogic for every new session (see create_session_logic).
+        """
+        self.sessions_dir = sessions_dir
+        self.user_name = user_name
+        self.on_session_start = on_session_start
+        self.logic_options = dict(logic_options or {})
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.sessions = OrderedDict() # LRU order: least recently used first
+        self._opening = {} # session id -> task opening it, so concurrent first requests share one open
+        self._evicting = {} # session id -> task writing its snapshot
+        self._checked_out = {} # session id -> number of handlers currently using it
+        self._reaper_task = None
+        self.stats = {"hits": 0, "opened": 0, "rehydrated": 0, "evicted": 0, "expired": 0}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def resident_bytes(self):
+        return sum(session.size_bytes for session in self.sessions.values())
+
+    async def get(self, session_id):
+        """Returns the session, opening or rehydrating it if it is not resident, and marks it most recently used."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.stats["hits"] += 1
+            self.sessions.move_to_end(session_id)
+            return session
+        eviction = self._evicting.get(session_id)
+        if eviction is not None:
+            await asyncio.shield(eviction) # Reopen from the snapshot, not from half-written state
+        task = self._opening.get(session_id)
+        if task is None:
+            snapshot_exists = os.path.exists(os.path.join(session_state_dir(self.sessions_dir, session_id), SNAPSHOT_FILE))
+            self.stats["rehydrated" if snapshot_exists else "opened"] += 1
+            task = asyncio.ensure_future(Session.open(session_id, self.sessions_dir, self.user_name, self.on_session_start, self.logic_options))
+            self._opening[session_id] = task
+        try:
+            session = await asyncio.shield(task)
+        finally:
+            self._opening.pop(session_id, None)
+        if session_id not in self.sessions:
+            self.sessions[session_id] = session
+            if self.max_bytes:
+                session.size_bytes = await asyncio.to_thread(estimate_session_bytes, session.logic)
+            await self._enforce_bounds(keep=session_id)
+        return self.sessions.get(session_id, session)
+
+    @asynccontextmanager
+    async def checkout(self, session_id):
+        """Yields the session for a turn, then refreshes its size estimate and applies the bounds."""
+        self._checked_out[session_id] = self._checked_out.get(session_id, 0) + 1
+        session = None
+        try:
+            session = await self.get(session_id)
+            yield session
+        finally:
+            remaining = self._checked_out.pop(session_id) - 1
+            if remaining:
+                self._checked_out[session_id] = remaining
+            if self.max_bytes and session is not None and self.sessions.get(session_id) is session:
+                await session.writer.barrier() # Size after this turn's bookkeeping
+                session.size_bytes = await asyncio.to_thread(estimate_session_bytes, session.logic)
+            await self._enforce_bounds(keep=session_id)
+
+    def _busy(self, session_id):
+        return session_id in self._checked_out or self.sessions[session_id].lock.locked()
+
+    def _over_bounds(self):
+        if self.max_sessions and len(self.sessions) > self.max_sessions:
+            return True
+        return bool(self.max_bytes) and self.resident_bytes() > self.max_bytes
+
+    async def _enforce_bounds(self, keep=None):
+        for session_id in list(self.sessions):
+            if not self._over_bounds():
+                break
+            if session_id == keep or self._busy(session_id):
+                continue
+            try:
+                await self.evict(session_id)
+            except Exception as e:
+                logger.error("Could not evict session '%s': %s", session_id, e, exc_info=True)
+        if self._over_bounds():
+            logger.warning("Session pool still over its bounds (%d sessions, ~%d bytes): remaining sessions are busy.",
+                           len(self.sessions), self.resident_bytes())
+
+    async def evict(self, session_id):
+        """Snapshots a session to disk and drops it from memory."""
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        task = asyncio.ensure_future(session.close(snapshot=True))
+        self._evicting[session_id] = task
+        try:
+            await asyncio.shield(task)
+        finally:
+            if self._evicting.get(session_id) is task:
+                del self._evicting[session_id]
+        self.stats["evicted"] += 1
+        return True
+
+    async def close(self, session_id):
+        """Saves and drops a session for good (no snapshot)."""
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            await session.close()
+        return session is not None
+
+    async def branch(self, session_id, from_slot, new_session_id):
+        """Creates session `new_session_id` from save slot `from_slot` of `session_id` (the source need not be resident)."""
+        if not is_valid_session_id(new_session_id):
+            raise ValueError(f"Invalid session id '{new_session_id}'")
+        if new_session_id in self.sessions or new_session_id in self._opening:
+            raise FileExistsError(f"Session '{new_session_id}' already exists")
+        slots = SaveSlots(os.path.join(session_state_dir(self.sessions_dir, session_id), SLOTS_DIR))
+        meta = await asyncio.to_thread(slots.branch, from_slot, session_state_dir(self.sessions_dir, new_session_id))
+        logger.info("Session '%s' branched from slot '%s' of session '%s'.", new_session_id, from_slot, session_id)
+        return meta
+
+    async def close_all(self):
+        await self.stop_reaper()
+        for session_id in list(self.sessions):
+            await self.close(session_id)
+
+    async def expire_idle(self):
+        """Evicts sessions idle longer than idle_ttl."""
+        if not self.idle_ttl:
+            return 0
+        cutoff = time.time() - self.idle_ttl
+        expired = 0
+        for session_id, session in list(self.sessions.items()):
+            if session.last_used < cutoff and not self._busy(session_id):
+                if await self.evict(session_id):
+                    expired += 1
+        self.stats["expired"] += expired
+        return expired
+
+    def start_reaper(self, interval_seconds=30.0):
+        """Starts a background task that evicts idle sessions every `interval_seconds`."""
+        if not self.idle_ttl or (self._reaper_task and not self._reaper_task.done()):
+            return
+
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval_seconds)
+                try:
+                    expired = await self.expire_idle()
+                    if expired:
+                        logger.info("Evicted %d idle sessions (ttl %.0fs). Resident: %d.", expired, self.idle_ttl, len(self.sessions))
+                except Exception as e:
+                    logger.error("Idle-session reaper failed: %s", e, exc_info=True)
+
+        self._reaper_task = asyncio.get_running_loop().create_task(_loop())
+
+    async def stop_reaper(self):
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+
+    def snapshot_stats(self):
+        return {**self.stats, "resident": len(self.sessions), "resident_bytes": self.resident_bytes()}
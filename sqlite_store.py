@@ -0,0 +1,186 @@
+# sqlite_store.py
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.sqlite')
+
+STATE_DB_FILE = "state.sqlite3"
+STORAGE_BACKENDS = ("files", "sqlite")
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ltm_events (
+    position INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vector_memories (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    timestamp REAL,
+    roleplay_time TEXT,
+    location TEXT,
+    topic TEXT,
+    is_sleeping INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_vector_memories_location ON vector_memories(location);
+CREATE INDEX IF NOT EXISTS idx_vector_memories_topic ON vector_memories(topic);
+CREATE INDEX IF NOT EXISTS idx_vector_memories_roleplay_time ON vector_memories(roleplay_time);
+CREATE INDEX IF NOT EXISTS idx_vector_memories_timestamp ON vector_memories(timestamp);
+"""
+
+
+class SQLiteStateStore:
+    def __init__(self, path=STATE_DB_FILE):
+        """
+        One SQLite database (WAL mode) for a session's general state, long-term memory events and
+        vector memories (text, metadata and float32 embedding). Each commit() is one transaction,
+        so the four kinds of state can no longer disagree after a crash.
+        """
+        self.path = path
+        self._lock = threading.Lock() # The connection is shared by the turn writer, autosave and shutdown threads
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # Durable at each commit in WAL mode, except on power loss
+            conn.executescript(SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO state(key, value, updated_at) VALUES ('schema_version', ?, ?)", (str(SCHEMA_VERSION), time.time()))
+            self._conn = conn
+            logger.info("SQLite state store opened at %s (WAL).", self.path)
+        return self._conn
+
+    def __getstate__(self):
+        # Connections do not pickle (session snapshots); it is reopened on first use
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def has_state(self):
+        """True once a state has been committed (otherwise the session is new or still on the JSON files)."""
+        with self._lock:
+            return self._connect().execute("SELECT 1 FROM state WHERE key = 'general'").fetchone() is not None
+
+    def backup(self, path):
+        """Writes a consistent copy of the database to `path` (SQLite online backup; concurrent commits wait)."""
+        with self._lock:
+            dst = sqlite3.connect(path)
+            try:
+                self._connect().backup(dst)
+            finally:
+                dst.close()
+
+    def load_state(self):
+        """Returns the saved general state dict, or None if nothing was saved yet."""
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM state WHERE key = 'general'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def ltm_events(self):
+        with self._lock:
+            rows = self._connect().execute("SELECT text FROM ltm_events ORDER BY position").fetchall()
+        return [text for (text,) in rows]
+
+    def vector_rows(self):
+        """(memory object, float32 embedding) pairs in id order, as VectorMemoryStore.load_rows expects."""
+        with self._lock:
+            rows = self._connect().execute("SELECT id, text, metadata, embedding FROM vector_memories ORDER BY id").fetchall()
+        return [
+            ({"id": memory_id, "text": text, "metadata": json.loads(metadata)}, np.frombuffer(embedding, dtype='float32'))
+            for memory_id, text, metadata, embedding in rows
+        ]
+
+    def commit(self, state_json, vector_rows=(), ltm_events=(), ltm_start=0, replace_vectors=False, replace_ltm=False):
+        """
+        Writes a turn (or a full save) in one transaction.
+
+        Args:
+            state_json (str): General state (RPLogic._collect_state) as JSON.
+            vector_rows (list): New (memory object, embedding) pairs.
+            ltm_events (list[str]): New LTM events, stored from position `ltm_start`.
+            replace_vectors / replace_ltm (bool): Drop the stored rows first (the in-memory store was reset).
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR REPLACE INTO state(key, value, updated_at) VALUES ('general', ?, ?)", (state_json, now))
+                if replace_vectors:
+                    conn.execute("DELETE FROM vector_memories")
+                if vector_rows:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO vector_memories(id, text, metadata, embedding, timestamp, roleplay_time, location, topic, is_sleeping) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [self._vector_params(memory, embedding) for memory, embedding in vector_rows],
+                    )
+                if replace_ltm:
+                    conn.execute("DELETE FROM ltm_events")
+                if ltm_events:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO ltm_events(position, text, created_at) VALUES (?, ?, ?)",
+                        [(ltm_start + offset, text, now) for offset, text in enumerate(ltm_events)],
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _vector_params(memory, embedding):
+        metadata = memory.get("metadata") or {}
+        is_sleeping = metadata.get("is_sleeping")
+        return (
+            int(memory["id"]),
+            memory.get("text", ""),
+            json.dumps(metadata, ensure_ascii=False),
+            np.asarray(embedding, dtype='float32').tobytes(),
+            metadata.get("timestamp"),
+            metadata.get("roleplay_time"),
+            metadata.get("location"),
+            metadata.get("topic"),
+            None if is_sleeping is None else int(bool(is_sleeping)),
+        )
+
+    def find_memories(self, location=None, topic=None, since_roleplay_time=None, until_roleplay_time=None, limit=50):
+        """Vector memories filtered on the indexed metadata columns (newest first), without their embeddings."""
+        clauses, params = [], []
+        if location is not None:
+            clauses.append("location = ?"); params.append(location)
+        if topic is not None:
+            clauses.append("topic = ?"); params.append(topic)
+        if since_roleplay_time is not None:
+            clauses.append("roleplay_time >= ?"); params.append(since_roleplay_time)
+        if until_roleplay_time is not None:
+            clauses.append("roleplay_time < ?"); params.append(until_roleplay_time)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, text, metadata FROM vector_memories {where} ORDER BY roleplay_time DESC, id DESC LIMIT ?",
+                params + [int(limit)],
+            ).fetchall()
+        return [{"id": memory_id, "text": text, "metadata": json.loads(metadata)} for memory_id, text, metadata in rows]
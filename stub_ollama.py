@@ -0,0 +1,306 @@
+# stub_ollama.py (Offline stand-in for Ollama, for hermetic latency benchmarks)
+import argparse
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Get a logger specific to this module
+logger = logging.getLogger('stub_ollama')
+
+DEFAULT_PORT = 11435 # Next to the real Ollama port so both can run side by side
+FAILURE_MODES = ("http500", "disconnect", "stall")
+
+DEFAULT_OUTPUTS = {
+    "action": [
+        "*Poppy rolls her eyes and taps her pen against the desk.*",
+        "*She crosses her arms, glancing at the clock.*",
+        "*Poppy sighs and flips to the next page of her notes.*",
+    ],
+    "dialogue": [
+        "Ugh, fine. But if we fail this project, it's completely on you.",
+        "Whatever. Just hand me the worksheet before I change my mind.",
+        "You're seriously asking me that right now? Unbelievable.",
+    ],
+    "summary": [
+        "Lin and Poppy argued about the project, then agreed to split the work.",
+    ],
+}
+
+TOKEN_REGEX = re.compile(r"\S+\s*|\s+")
+
+
+class StubConfig:
+    def __init__(self, tokens_per_sec=30.0, first_token_latency=0.2, load_duration=0.0, fail_rate=0.0,
+                 fail_mode="http500", stall_seconds=30.0, outputs=None, seed=None):
+        """
+        Behaviour of the stub server.
+
+        Args:
+            tokens_per_sec (float): Streaming rate after the first token (0 = as fast as possible).
+            first_token_latency (float): Seconds before the first token (prompt evaluation time).
+            load_duration (float): Seconds an empty "load model" request takes.
+            fail_rate (float): Probability (0-1) that a chat request fails.
+            fail_mode (str): How it fails: http500, disconnect (mid-stream) or stall (no tokens for stall_seconds).
+            outputs (dict): Canned texts per call type (action/dialogue/summary), used round-robin.
+            seed (int): Seed for failure injection.
+        """
+        if fail_mode not in FAILURE_MODES:
+            raise ValueError(f"Unknown failure mode '{fail_mode}'. Expected one of {FAILURE_MODES}.")
+        self.tokens_per_sec = tokens_per_sec
+        self.first_token_latency = first_token_latency
+        self.load_duration = load_duration
+        self.fail_rate = fail_rate
+        self.fail_mode = fail_mode
+        self.stall_seconds = stall_seconds
+        self.outputs = {**DEFAULT_OUTPUTS, **(outputs or {})}
+        self._cycles = {kind: itertools.cycle(texts) for kind, texts in self.outputs.items() if texts}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "loads": 0, "failures": 0, "tokens": 0, "cancelled": 0}
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def should_fail(self):
+        with self._lock:
+            return self.fail_rate > 0 and self._random.random() < self.fail_rate
+
+    def canned_output(self, prompt):
+        """Picks the next canned text for the call type the prompt looks like."""
+        lowered = prompt.lower()
+        if "writing the actions" in lowered or "action description" in lowered:
+            kind = "action"
+        elif "summarize" in lowered:
+            kind = "summary"
+        else:
+            kind = "dialogue"
+        with self._lock:
+            return next(self._cycles[kind]) if kind in self._cycles else ""
+
+
+def tokenize(text, options):
+    """Splits the canned text into word tokens, honouring num_predict and stop sequences like Ollama does."""
+    for stop in options.get("stop") or []:
+        if stop and stop in text:
+            text = text[:text.index(stop)]
+    tokens = TOKEN_REGEX.findall(text)
+    num_predict = options.get("num_predict")
+    if isinstance(num_predict, int) and num_predict > 0:
+        tokens = tokens[:num_predict]
+    return tokens
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Chunked streaming, like the real server
+    server_version = "StubOllama/0.1"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    @property
+    def config(self):
+        return self.server.stub_config
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path in ("/", ""):
+            data = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path == "/api/ps":
+            self._send_json(200, {"models": [{"name": name} for name in sorted(self.server.loaded_models)]})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": name} for name in sorted(self.server.loaded_models)]})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"error": f"invalid JSON: {e}"})
+            return
+        model = body.get("model", "stub")
+        messages = body.get("messages") or []
+        options = body.get("options") or {}
+
+        if not messages:
+            # Empty messages = load the model into memory (what warm-up and keep-alive send)
+            self.config.count("loads")
+            if model not in self.server.loaded_models:
+                time.sleep(self.config.load_duration)
+                self.server.loaded_models.add(model)
+            self._send_json(200, {"model": model, "message": {"role": "assistant", "content": ""}, "done": True,
+                                  "done_reason": "load", "load_duration": int(self.config.load_duration * 1e9)})
+            return
+
+        self.config.count("requests")
+        self.server.loaded_models.add(model)
+        failing = self.config.should_fail()
+        if failing and self.config.fail_mode == "http500":
+            self.config.count("failures")
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        prompt = messages[-1].get("content", "")
+        tokens = tokenize(self.config.canned_output(prompt), options)
+        if failing and self.config.fail_mode == "disconnect":
+            tokens = tokens[:max(1, len(tokens) // 2)]
+        if body.get("stream", True):
+            self._stream(model, tokens, failing)
+        else:
+            self._respond(model, tokens, failing)
+
+    def _token_delay(self):
+        rate = self.config.tokens_per_sec
+        return 1.0 / rate if rate > 0 else 0.0
+
+    def _final_chunk(self, model, content, token_count, started):
+        total_ns = int((time.perf_counter() - started) * 1e9)
+        return {"model": model, "message": {"role": "assistant", "content": content}, "done": True, "done_reason": "stop",
+                "total_duration": total_ns, "load_duration": 0, "eval_count": token_count,
+                "eval_duration": int(token_count * self._token_delay() * 1e9)}
+
+    def _respond(self, model, tokens, failing):
+        started = time.perf_counter()
+        time.sleep(self.config.first_token_latency + self._token_delay() * max(0, len(tokens) - 1))
+        if failing:
+            self.config.count("failures")
+            if self.config.fail_mode == "stall":
+                time.sleep(self.config.stall_seconds)
+            self.close_connection = True
+            return
+        self.config.count("tokens", len(tokens))
+        self._send_json(200, self._final_chunk(model, "".join(tokens), len(tokens), started))
+
+    def _stream(self, model, tokens, failing):
+        started = time.perf_counter()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        try:
+            if failing and self.config.fail_mode == "stall":
+                self.config.count("failures")
+                time.sleep(self.config.stall_seconds)
+            time.sleep(self.config.first_token_latency)
+            for index, token in enumerate(tokens):
+                if index:
+                    time.sleep(self._token_delay())
+                chunk = {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+                self._write_chunk((json.dumps(chunk) + "\n").encode("utf-8"))
+                sent += 1
+            if failing and self.config.fail_mode == "disconnect":
+                self.config.count("failures")
+                self.close_connection = True # Drop the stream without the final chunk
+                return
+            self._write_chunk((json.dumps(self._final_chunk(model, "", sent, started)) + "\n").encode("utf-8"))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client closed the stream early (early stop, hedge loser, deadline)
+            self.config.count("cancelled")
+            self.close_connection = True
+        finally:
+            self.config.count("tokens", sent)
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, config=None):
+        super().__init__((host, port), StubOllamaHandler)
+        self.stub_config = config or StubConfig()
+        self.loaded_models = set()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves from a daemon thread (for use inside benchmarks). Returns the base URL."""
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        logger.info("Stub Ollama server listening on %s", self.base_url)
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def load_outputs(path):
+    """Reads canned outputs from a JSON file: {"action": [...], "dialogue": [...], "summary": [...]}."""
+    with open(path, 'r', encoding='utf-8') as f:
+        outputs = json.load(f)
+    if not isinstance(outputs, dict):
+        raise ValueError(f"Canned outputs file '{path}' must contain a JSON object.")
+    return outputs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Ollama chat API (no model needed).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--tokens-per-sec", type=float, default=30.0, help="Streaming rate after the first token (0 = unthrottled).")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument("--load-duration", type=float, default=0.0, help="Seconds a model load (empty messages) takes the first time.")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability that a chat request fails.")
+    parser.add_argument("--fail-mode", choices=FAILURE_MODES, default="http500")
+    parser.add_argument("--stall-seconds", type=float, default=30.0, help="How long a 'stall' failure withholds tokens.")
+    parser.add_argument("--outputs", help="JSON file of canned outputs per call type (action/dialogue/summary).")
+    parser.add_argument("--seed", type=int, help="Seed for failure injection.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)-8s - %(name)-15s - %(message)s")
+    args = parse_args()
+    stub_config = StubConfig(
+        tokens_per_sec=args.tokens_per_sec,
+        first_token_latency=args.first_token_latency,
+        load_duration=args.load_duration,
+        fail_rate=args.fail_rate,
+        fail_mode=args.fail_mode,
+        stall_seconds=args.stall_seconds,
+        outputs=load_outputs(args.outputs) if args.outputs else None,
+        seed=args.seed,
+    )
+    server = StubOllamaServer(args.host, args.port, stub_config)
+    logger.info("Stub Ollama server listening on %s (%.1f tok/s, first token %.2fs, fail rate %.2f/%s)",
+                server.base_url, args.tokens_per_sec, args.first_token_latency, args.fail_rate, args.fail_mode)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("Stub Ollama server stopped. Stats: %s", stub_config.stats)
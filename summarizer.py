@@ -0,0 +1,252 @@
+# summarizer.py (Extractive long-term memory summaries: sentence embeddings + clustering + TextRank)
+import argparse
+import json
+import logging
+import re
+import time
+
+import numpy as np
+
+from turn_event import TurnEvent, render_summary
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.summarizer')
+
+SUMMARIZERS = ("extractive", "keywords")
+SENTENCE_SPLIT_REGEX = re.compile(r"(?<=[.!?…])\s+|(?<=[.!?…][*\"'])\s+|\n+") # Also after "*action.*" and closing quotes
+MIN_SENTENCE_WORDS = 3 # Shorter fragments ("Ok.", "*nods*") are only kept if nothing else is left
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_MAX_ITERATIONS = 100
+TEXTRANK_TOLERANCE = 1e-6
+KMEANS_MAX_ITERATIONS = 20
+KEYWORD_BOOST = 2.0 # Extra teleport weight of sentences mentioning an important keyword
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_SPLIT_REGEX.split(text or "") if sentence and sentence.strip()]
+
+
+def event_units(event):
+    """(speaker, sentence) pairs of a turn; free-form events have no speaker."""
+    if event.text is not None:
+        return [(None, sentence) for sentence in split_sentences(event.text)]
+    return ([("User", sentence) for sentence in split_sentences(event.user_input)]
+            + [(event.character, sentence) for sentence in split_sentences(event.response)])
+
+
+def textrank(similarity, teleport, damping=TEXTRANK_DAMPING):
+    """PageRank scores over a non-negative similarity matrix (zero diagonal), teleporting by `teleport`."""
+    n = len(similarity)
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    # Sentences similar to nothing spread their score evenly instead of leaking it
+    transition = np.where(row_sums > 0, similarity / np.where(row_sums > 0, row_sums, 1.0), 1.0 / n)
+    teleport = teleport / teleport.sum()
+    scores = np.full(n, 1.0 / n)
+    for _ in range(TEXTRANK_MAX_ITERATIONS):
+        updated = (1.0 - damping) * teleport + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < TEXTRANK_TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+
+def cluster(embeddings, k, scores):
+    """Spherical k-means over L2-normalized rows.
+
+    Deterministic seeding: the best-scored row, then each time the row with the best score x distance to the
+    seeds so far (plain farthest-first would seed on outliers such as a repeated stage direction).
+    """
+    centroids = [embeddings[int(np.argmax(scores))]]
+    for _ in range(1, k):
+        closest = np.max(embeddings @ np.array(centroids).T, axis=1) # Similarity to the nearest chosen seed
+        centroids.append(embeddings[int(np.argmax(scores * (1.0 - closest)))])
+    centroids = np.array(centroids)
+    labels = None
+    for _ in range(KMEANS_MAX_ITERATIONS):
+        updated = np.argmax(embeddings @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(updated, labels):
+            break
+        labels = updated
+        for c in range(k):
+            members = embeddings[labels == c]
+            if len(members):
+                centroid = members.mean(axis=0)
+                norm = np.linalg.norm(centroid)
+                if norm > 0:
+                    centroids[c] = centroid / norm
+    return labels
+
+
+class ExtractiveSummarizer:
+    def __init__(self, vector_memory=None, sentences=5, important_keywords=()):
+        """
+        Compresses a batch of turns into its `sentences` most representative sentences.
+
+        The batch's sentences are embedded in one call, ranked with TextRank over their cosine similarity
+        (teleport weighted towards the important keywords) and grouped with k-means; the best-ranked
+        sentence of each cluster is kept, in chronological order. Each becomes a free-form TurnEvent
+        that keeps its turn's location, topic, time and emotions.
+
+        Args:
+            vector_memory (VectorMemoryStore): Supplies the embedding model (not pickled; the owner re-attaches it).
+            sentences (int): Sentences per summary (one per cluster).
+            important_keywords (list[str]): Keywords whose sentences are favoured.
+        """
+        self.vector_memory = vector_memory
+        self.sentences = sentences
+        self.important_keywords = list(important_keywords)
+        self.last_stats = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["vector_memory"] = None # Shared model and FAISS index are not pickled (session snapshots)
+        return state
+
+    def summarize(self, batch):
+        """Returns the summary as a tuple of TurnEvents (empty if the batch has no text or no model is attached)."""
+        if self.vector_memory is None:
+            return ()
+        start = time.perf_counter()
+        units = []
+        seen = set()
+        for event in batch:
+            for speaker, sentence in event_units(event):
+                text = f"{speaker}: {sentence}" if speaker else sentence
+                if text not in seen:
+                    seen.add(text)
+                    units.append((event, sentence, text))
+        long_units = [unit for unit in units if len(unit[1].split()) >= MIN_SENTENCE_WORDS]
+        units = long_units or units
+        if not units:
+            return ()
+
+        sentences = [sentence for _, sentence, _ in units]
+        # One encoder call for the batch. Speaker-labelled like the turns in the vector store; the store keeps these
+        # vectors, so the summary index gets the selected ones without encoding them again
+        embeddings = self.vector_memory.embeddings_for([text for _, _, text in units])
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms > 0, norms, 1.0)
+
+        k = min(self.sentences, len(units))
+        if k == len(units):
+            selected = list(range(len(units)))
+        else:
+            similarity = np.clip(embeddings @ embeddings.T, 0.0, None)
+            np.fill_diagonal(similarity, 0.0)
+            teleport = np.array([1.0 + (KEYWORD_BOOST if any(kw in sentence.lower() for kw in self.important_keywords) else 0.0)
+                                 for sentence in sentences])
+            scores = textrank(similarity, teleport)
+            labels = cluster(embeddings, k, scores)
+            selected = sorted(int(np.flatnonzero(labels == c)[np.argmax(scores[labels == c])]) for c in range(k) if np.any(labels == c))
+
+        summary = tuple(
+            TurnEvent(text=units[i][2], location=units[i][0].location, action=units[i][0].action, topic=units[i][0].topic,
+                      emotion_labels=units[i][0].emotion_labels, fatigue=units[i][0].fatigue, is_sleeping=units[i][0].is_sleeping,
+                      roleplay_time=units[i][0].roleplay_time, timestamp=units[i][0].timestamp)
+            for i in selected
+        )
+        input_chars = sum(len(event.render()) for event in batch)
+        summary_chars = len(render_summary(summary))
+        self.last_stats = {
+            "turns": len(batch),
+            "sentences": len(units),
+            "selected": len(summary),
+            "input_chars": input_chars,
+            "summary_chars": summary_chars,
+            "compression_ratio": input_chars / summary_chars if summary_chars else 0.0,
+            "seconds": time.perf_counter() - start,
+        }
+        logger.info("Summarized %d turns (%d sentences) into %d sentences: %d -> %d chars in %.1f ms.",
+                    len(batch), len(units), len(summary), input_chars, summary_chars, self.last_stats["seconds"] * 1000)
+        return summary
+
+
+# --- Benchmark (python summarizer.py memory_data.json ...) ---
+
+RAG_TEXT_REGEX = re.compile(r"^User: '(.*)'\n([^\n:]+): '(.*)'$", re.DOTALL)
+
+
+def load_turns(paths):
+    """TurnEvents from vector data files (memory_data.json of a session): the text and metadata of every turn."""
+    turns = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            memory_data = json.load(f).get("memory_data", [])
+        for memory in memory_data:
+            metadata = memory.get("metadata") or {}
+            fields = {key: metadata.get(key) for key in ("location", "action", "topic", "fatigue", "roleplay_time", "timestamp")}
+            match = RAG_TEXT_REGEX.match(memory.get("text", ""))
+            if match:
+                turns.append(TurnEvent(user_input=match.group(1), character=match.group(2), response=match.group(3),
+                                       is_sleeping=bool(metadata.get("is_sleeping")), **fields))
+            elif memory.get("text"):
+                turns.append(TurnEvent(text=memory["text"], **fields))
+    return turns
+
+
+def run_benchmark(turns, vector_memory, batch_size=25, sentences=5, repeat=3):
+    """Summarizes every full batch of `turns` with both compressors. Returns (per-batch rows, totals)."""
+    from active_memory import IMPORTANT_KEYWORDS as keywords, select_by_keywords # The previous (keyword) compression
+
+    summarizer = ExtractiveSummarizer(vector_memory, sentences=sentences, important_keywords=keywords)
+    rows = []
+    for offset in range(0, len(turns) - batch_size + 1, batch_size):
+        batch = turns[offset:offset + batch_size]
+        timings = []
+        for _ in range(repeat):
+            vector_memory._recent_embeddings.clear() # Time the encoder call every run
+            summary = summarizer.summarize(batch)
+            timings.append(summarizer.last_stats["seconds"])
+        keyword_chars = len(render_summary(select_by_keywords(batch, keywords, sentences)))
+        rows.append(dict(summarizer.last_stats, keyword_chars=keyword_chars, seconds=min(timings), summary=render_summary(summary)))
+    totals = {}
+    if rows:
+        input_chars = sum(row["input_chars"] for row in rows)
+        summary_chars = sum(row["summary_chars"] for row in rows)
+        keyword_chars = sum(row["keyword_chars"] for row in rows)
+        totals = {
+            "batches": len(rows),
+            "turns_per_batch": batch_size,
+            "input_chars": input_chars,
+            "keyword_chars": keyword_chars,
+            "summary_chars": summary_chars,
+            "compression_ratio": input_chars / summary_chars if summary_chars else 0.0,
+            "keyword_compression_ratio": input_chars / keyword_chars if keyword_chars else 0.0,
+            "ms_per_batch_mean": 1000 * sum(row["seconds"] for row in rows) / len(rows),
+            "ms_per_batch_max": 1000 * max(row["seconds"] for row in rows),
+        }
+    return rows, totals
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the extractive LTM summarizer on recorded turns (compression ratio and time per batch).")
+    parser.add_argument("data", nargs="+", help="Vector data files with recorded turns (a session's memory_data.json).")
+    parser.add_argument("--batch-size", type=int, default=25, help="Turns per batch (ActiveMemoryFile threshold).")
+    parser.add_argument("--sentences", type=int, default=5, help="Sentences per summary (ActiveMemoryFile summary_size).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per batch (the fastest is reported).")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="SentenceTransformer model.")
+    parser.add_argument("--show", action="store_true", help="Print each summary.")
+    parser.add_argument("--report", help="Write per-batch rows and totals to this JSON file.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)-8s - %(name)-15s - %(message)s")
+    args = parse_args()
+    from vector_memory import VectorMemoryStore
+    turns = load_turns(args.data)
+    if len(turns) < args.batch_size:
+        raise SystemExit(f"Only {len(turns)} turns in {args.data}; need at least --batch-size ({args.batch_size}).")
+    rows, totals = run_benchmark(turns, VectorMemoryStore(model_name=args.model), args.batch_size, args.sentences, args.repeat)
+    for number, row in enumerate(rows, start=1):
+        print(f"batch {number:3d}: {row['sentences']:4d} sentences, {row['input_chars']:6d} -> {row['summary_chars']:5d} chars "
+              f"(x{row['compression_ratio']:.1f}; keywords {row['keyword_chars']} chars), {row['seconds'] * 1000:.1f} ms")
+        if args.show:
+            print("    " + row["summary"].replace("\n", "\n    "))
+    print(f"{totals['batches']} batches of {totals['turns_per_batch']} turns: compression x{totals['compression_ratio']:.1f} "
+          f"(keyword selection x{totals['keyword_compression_ratio']:.1f}), "
+          f"{totals['ms_per_batch_mean']:.1f} ms per batch (max {totals['ms_per_batch_max']:.1f} ms)")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({"totals": totals, "batches": rows}, f, indent=2, ensure_ascii=False)
+        print(f"Report written to {args.report}")
@@ -0,0 +1,65 @@
+# summary_index.py
+import logging
+
+import numpy as np
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.summaries')
+
+LTM_SUMMARIES_IN_CONTEXT = 5 # Long-term summaries injected into the prompt
+
+
+class LongTermSummaryIndex:
+    def __init__(self):
+        """
+        Small in-memory similarity index over the long-term summaries (row i = LTM position i).
+
+        A summary's vector is the normalized mean of its events' embeddings. Whole turns are already in the
+        vector store and extracted sentences were just encoded by the summarizer, so adding a summary
+        normally needs no encoder call (see VectorMemoryStore.embeddings_for).
+        The matrix is plain NumPy so it is kept in session snapshots; after a restart it is rebuilt on load.
+        """
+        self.embeddings = None # float32 (n x dim), rows L2-normalized
+
+    def __len__(self):
+        return 0 if self.embeddings is None else len(self.embeddings)
+
+    def reset(self):
+        self.embeddings = None
+
+    def sync(self, ltm, vector_memory):
+        """Adds the summaries `ltm` holds past this index. Returns the number added."""
+        if len(self) > len(ltm):
+            logger.info("Long-term memory shrank (%d -> %d summaries). Rebuilding the summary index.", len(self), len(ltm))
+            self.reset()
+        summaries = ltm.since(len(self))
+        if not summaries:
+            return 0
+        texts, owners = [], []
+        for row, summary in enumerate(summaries):
+            for event in summary:
+                texts.append(event.rag_text())
+                owners.append(row)
+        vectors = np.zeros((len(summaries), vector_memory.embedding_dim), dtype='float32')
+        if texts:
+            np.add.at(vectors, owners, vector_memory.embeddings_for(texts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1.0) # Direction only: the mean and the normalized mean rank the same
+        self.embeddings = vectors if self.embeddings is None else np.vstack([self.embeddings, vectors])
+        logger.debug("Summary index: %d summaries added (%d total).", len(summaries), len(self))
+        return len(summaries)
+
+    def search(self, query_embedding, k=LTM_SUMMARIES_IN_CONTEXT):
+        """LTM positions of the `k` summaries most similar to `query_embedding` (cosine), best first."""
+        if not len(self) or k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.embeddings @ (query / norm)
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        return [int(position) for position in top[np.argsort(-scores[top], kind='stable')]]
@@ -0,0 +1,158 @@
+# turn_event.py
+import logging
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.event')
+
+SUMMARY_SEPARATOR = "\n---\n" # Between the events of a long-term summary when rendered
+
+
+class TurnEvent:
+    """
+    One committed turn, as structured fields, shared by the dynamic, active, long-term and vector tiers.
+
+    Nothing is formatted when a turn is recorded: render() builds the tagged log line only when a prompt
+    needs it, and keyword scans run on a lowercased copy made once per event (not once per tier per turn).
+    Free-form entries (system context, events saved by older versions as strings) only carry `text`.
+    """
+    __slots__ = ("user_input", "character", "response", "location", "action", "topic", "pending_location",
+                 "emotion_labels", "emotions", "fatigue", "is_sleeping", "roleplay_time", "timestamp", "text",
+                 "_search_text", "_hash")
+
+    FIELDS = __slots__[:-2] # Persisted fields (search text and hash are caches)
+
+    def __init__(self, user_input=None, character=None, response=None, location=None, action=None, topic=None,
+                 pending_location=None, emotion_labels=(), emotions=None, fatigue=None, is_sleeping=False,
+                 roleplay_time=None, timestamp=None, text=None):
+        self.user_input = user_input
+        self.character = character
+        self.response = response
+        self.location = location
+        self.action = action
+        self.topic = topic
+        self.pending_location = pending_location
+        self.emotion_labels = tuple(emotion_labels or ())
+        self.emotions = emotions # Detailed emotion intensities (vector metadata)
+        self.fatigue = fatigue
+        self.is_sleeping = is_sleeping
+        self.roleplay_time = roleplay_time # ISO string
+        self.timestamp = timestamp
+        self.text = text
+        self._search_text = None
+        self._hash = None
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(text=text)
+
+    @classmethod
+    def from_data(cls, data):
+        """Inverse of to_dict(). Also accepts a plain string (dynamic memory saved by older versions)."""
+        if isinstance(data, cls):
+            return data
+        if isinstance(data, str):
+            return cls.from_text(data)
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+    def to_dict(self):
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not None and value != ():
+                data[field] = list(value) if field == "emotion_labels" else value
+        return data
+
+    def render(self):
+        """Tagged log line used in prompts (same format the dynamic memory used to store)."""
+        if self.text is not None:
+            return self.text
+        fatigue = f"{self.fatigue:.1f}" if isinstance(self.fatigue, (int, float)) else self.fatigue
+        return (f"User: '{self.user_input}'. {self.character}: '{self.response}'. "
+                f"[Loc: {self.location}] [Act: {self.action}] "
+                f"[Topic: {self.topic}] [Pending: {self.pending_location if self.pending_location else 'None'}] "
+                f"[Emo: {', '.join(self.emotion_labels)}] [Fatigue: {fatigue}] [Sleeping: {self.is_sleeping}]")
+
+    def rag_text(self):
+        """Text embedded for retrieval (the exchange only, without the state tags)."""
+        if self.text is not None:
+            return self.text
+        return f"User: '{self.user_input}'\n{self.character}: '{self.response}'"
+
+    def metadata(self):
+        """Vector store metadata for this turn."""
+        return {
+            "timestamp": self.timestamp,
+            "roleplay_time": self.roleplay_time,
+            "location": self.location,
+            "action": self.action,
+            "topic": self.topic,
+            "emotions": self.emotions if self.emotions is not None else {},
+            "fatigue": self.fatigue,
+            "is_sleeping": self.is_sleeping,
+        }
+
+    def search_text(self):
+        """Lowercased rendered text for keyword checks, computed once."""
+        if self._search_text is None:
+            self._search_text = self.render().lower()
+        return self._search_text
+
+    def mentions(self, keywords):
+        search_text = self.search_text()
+        return any(keyword in search_text for keyword in keywords)
+
+    def preview(self, length=70):
+        """Short text for logs (does not render the tags)."""
+        if self.text is not None:
+            return self.text[:length]
+        return f"User: '{self.user_input}'. {self.character}: '{self.response}'"[:length]
+
+    def _key(self):
+        # What render() shows (events that render the same are duplicates, as the old strings were); no timestamps
+        fatigue = round(self.fatigue, 1) if isinstance(self.fatigue, (int, float)) else self.fatigue
+        return (self.text, self.user_input, self.character, self.response, self.location, self.action, self.topic,
+                self.pending_location or None, self.emotion_labels, fatigue, self.is_sleeping)
+
+    def __eq__(self, other):
+        if not isinstance(other, TurnEvent):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        # Cached: active memory keeps a hash index of its buffer. Events are not modified after creation.
+        if self._hash is None:
+            self._hash = hash(self._key())
+        return self._hash
+
+    def __getstate__(self):
+        # Caches are not pickled (str hashes differ between processes)
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.FIELDS, state):
+            setattr(self, field, value)
+        self._search_text = None
+        self._hash = None
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return f"TurnEvent({self.preview(60)!r})"
+
+
+def summary_from_data(data):
+    """A long-term summary (tuple of TurnEvents) from its saved form: a list of event dicts, or an older joined string."""
+    if isinstance(data, str):
+        return (TurnEvent.from_text(data),)
+    return tuple(TurnEvent.from_data(item) for item in data)
+
+
+def summary_to_data(summary):
+    return [event.to_dict() for event in summary]
+
+
+def render_summary(summary):
+    if isinstance(summary, str):
+        return summary
+    return SUMMARY_SEPARATOR.join(event.render() for event in summary)
@@ -0,0 +1,78 @@
+# turn_journal.py
+import json
+import logging
+import os
+
+# Get a logger specific to this module, inheriting from 'memory'
+logger = logging.getLogger('memory.journal')
+
+TURN_JOURNAL_FILE = "turn_journal.jsonl"
+
+
+class TurnJournal:
+    def __init__(self, path=TURN_JOURNAL_FILE, fsync=True):
+        """
+        Append-only JSONL log of committed turns, replayed on top of the last state snapshot.
+
+        Args:
+            path (str): Journal file (one JSON record per line).
+            fsync (bool): Force each record to disk before append() returns (survives power loss, not just a crash).
+        """
+        self.path = path
+        self.rotated_path = path + ".prev" # Records a snapshot in progress is about to cover
+        self.fsync = fsync
+
+    def append(self, record):
+        """Writes one record as a single line. The file is only ever appended to, so a crash can at worst tear the last line."""
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    # A crash can tear the last write; segments appended after it (rotate) are still read
+                    logger.warning("Skipping torn turn journal line %d in '%s': %s", line_number, path, e)
+        return records
+
+    def records(self):
+        """Returns the journal records in order (rotated segment first), skipping torn lines."""
+        return self._read(self.rotated_path) + self._read(self.path)
+
+    def rotate(self):
+        """Starts a new segment before a snapshot is written, so turns appended meanwhile are not dropped with the old one."""
+        if not os.path.exists(self.path):
+            return
+        if os.path.exists(self.rotated_path):
+            # A previous snapshot failed: keep its records and add the new ones after them
+            with open(self.path, 'r', encoding='utf-8') as src, open(self.rotated_path, 'a', encoding='utf-8') as dst:
+                dst.write(src.read())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.rotated_path)
+
+    def discard_rotated(self):
+        """Drops the rotated segment once the snapshot that covers it is on disk."""
+        try:
+            os.remove(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def reset(self):
+        """Empties the journal (both segments)."""
+        self.discard_rotated()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
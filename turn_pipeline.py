@@ -0,0 +1,185 @@
+# turn_pipeline.py
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Get a logger specific to this module
+logger = logging.getLogger('turn_pipeline')
+
+
+class TurnGraph:
+    def __init__(self):
+        """
+        Small dependency graph of async stages for one turn.
+
+        Each stage starts as soon as the stages it depends on have finished, so independent
+        stages (e.g. RAG retrieval and the narrative-action call) run concurrently.
+        """
+        self.stages = {} # name -> (coroutine function, tuple of dependency names)
+        self.timings = {} # name -> (start, end) in seconds relative to run() start
+
+    def add_stage(self, name, func, deps=()):
+        """Registers `func(results)` as a stage. `results` maps finished stage names to their return values."""
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'.")
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    async def run(self):
+        """Runs every stage and returns the results dict. The first stage error cancels the rest and is re-raised."""
+        results = {}
+        tasks = {}
+        origin = time.perf_counter()
+
+        async def _run_stage(name):
+            func, deps = self.stages[name]
+            if deps:
+                await asyncio.gather(*(tasks[dep] for dep in deps))
+            start = time.perf_counter() - origin
+            try:
+                results[name] = await func(results)
+            finally:
+                self.timings[name] = (start, time.perf_counter() - origin)
+            return results[name]
+
+        # Stages are registered after their dependencies, so creating tasks in order is safe
+        for name in self.stages:
+            tasks[name] = asyncio.ensure_future(_run_stage(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+        return results
+
+    def critical_path(self):
+        """Returns (stage names, latency in seconds) of the chain that determined the turn's total time."""
+        if not self.timings:
+            return [], 0.0
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        latency = self.timings[name][1]
+        path = [name]
+        while True:
+            deps = [d for d in self.stages[name][1] if d in self.timings]
+            if not deps:
+                break
+            # The dependency that finished last is the one the stage was waiting on
+            name = max(deps, key=lambda n: self.timings[n][1])
+            path.append(name)
+        path.reverse()
+        return path, latency
+
+    def report(self):
+        """Per-stage durations plus the critical path, for logging."""
+        path, latency = self.critical_path()
+        return {
+            "stages": {name: end - start for name, (start, end) in self.timings.items()},
+            "critical_path": path,
+            "critical_path_s": latency,
+        }
+
+
+class DeferredWriter:
+    def __init__(self, window=50):
+        """
+        Runs post-turn bookkeeping (memory/state writes) on one background worker thread.
+
+        Writes run one at a time in submission order. Call `barrier()` before reading the state
+        they modify; it waits until every submitted write has been committed.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bookkeeping")
+        self._pending = None # asyncio.Future of the last submitted write
+        self.write_durations = deque(maxlen=window) # Seconds each write took (hidden from the user)
+        self.wait_durations = deque(maxlen=window) # Seconds barrier() actually had to block
+        self.errors = 0
+
+    def _timed(self, func, args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.write_durations.append(time.perf_counter() - start)
+
+    def submit(self, func, *args):
+        """Queues `func(*args)` on the worker thread and returns immediately."""
+        self._pending = asyncio.get_running_loop().run_in_executor(self._executor, self._timed, func, args)
+        return self._pending
+
+    async def barrier(self):
+        """Waits for the last submitted write. Errors are logged, not raised, so one bad write does not end the session."""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return 0.0
+        start = time.perf_counter()
+        try:
+            await pending
+        except Exception as e:
+            self.errors += 1
+            logger.error("Deferred bookkeeping failed: %s", e, exc_info=True)
+        waited = time.perf_counter() - start
+        self.wait_durations.append(waited)
+        return waited
+
+    async def aclose(self):
+        """Commits outstanding writes and stops the worker."""
+        await self.barrier()
+        self._executor.shutdown(wait=True)
+
+
+async def run_turn(logic, dialogue_generator, writer, user_text, memory_input, image_url=None, reports=None, session_id=None):
+    """
+    Runs one turn as a stage graph and returns the reply to display.
+
+        context (state + EmotionalCore) -> action --+
+        retrieval ----------------------------------+-> dialogue
+        (memory update is handed to `writer` and runs after the reply is returned)
+
+    Retrieval (RAG memories and relevant long-term summaries) runs while the action call is in flight; blocking RPLogic calls use worker threads.
+    If `reports` is given, the turn's timing report (stages, critical path, tiers) is appended to it.
+    `session_id` keys the turn's LLM calls in the generator's fair scheduler.
+    """
+    async def _context(results):
+        return await asyncio.to_thread(logic.construct_base_context, user_text)
+
+    async def _retrieval(results):
+        return await asyncio.to_thread(logic.retrieve_context, user_text)
+
+    async def _action(results):
+        return await dialogue_generator.generate_narrative_action(results["context"])
+
+    async def _dialogue(results):
+        context = dict(results["context"], **results["retrieval"])
+        return await dialogue_generator.generate_dialogue(context, results["action"], image_url=image_url)
+
+    graph = (
+        TurnGraph()
+        .add_stage("context", _context)
+        .add_stage("retrieval", _retrieval)
+        .add_stage("action", _action, deps=("context",))
+        .add_stage("dialogue", _dialogue, deps=("context", "retrieval", "action"))
+    )
+    # The previous turn's bookkeeping must be committed before this turn reads state
+    commit_wait = await writer.barrier()
+    with dialogue_generator.turn_scope(session_id=session_id) as turn:
+        results = await graph.run()
+
+    if logic.active_memory:
+        writer.submit(logic.manage_dynamic_memory, memory_input, results["dialogue"][1])
+    else:
+        logger.warning("Active memory missing when calling manage_dynamic_memory.")
+
+    report = graph.report()
+    report["commit_wait_s"] = commit_wait
+    report["tiers"] = dict(turn["tiers"])
+    logger.info(
+        "Turn stages: %s | critical path %s (%.2fs) | waited %.3fs for previous bookkeeping",
+        {name: round(seconds, 3) for name, seconds in report["stages"].items()},
+        " -> ".join(report["critical_path"]), report["critical_path_s"], commit_wait,
+    )
+    if reports is not None:
+        reports.append(report)
+    return results["dialogue"][0]
@@ -6,10 +6,32 @@ from sentence_transformers import SentenceTransformer # type: ignore
 import faiss # type: ignore # Facebook AI Similarity Search
 import os # Needed for checking file existence
 import json # Needed for saving/loading data
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
 
 # Get a logger specific to this module, inheriting from 'memory'
 logger = logging.getLogger('memory.vector')
 
+RECENT_EMBEDDINGS_CACHE = 512 # Texts encoded by embeddings_for() outside the index (summary sentences) kept for reuse
+
+# Embedding models are loaded once per process and shared by every store (one per session)
+_shared_models = {}
+_shared_models_lock = threading.Lock()
+
+
+def get_shared_embedding_model(model_name):
+    """Returns (model, encode lock) for `model_name`, loading it on first use.
+
+    The lock serializes encode() calls: the fast tokenizer is not safe to use from several threads at once.
+    """
+    with _shared_models_lock:
+        if model_name not in _shared_models:
+            logger.info(f"Loading shared SentenceTransformer model: {model_name}")
+            _shared_models[model_name] = (SentenceTransformer(model_name), threading.Lock())
+        return _shared_models[model_name]
+
+
 class VectorMemoryStore:
     def __init__(self, model_name='all-MiniLM-L6-v2', embedding_dim=None):
         """
@@ -24,12 +46,18 @@ class VectorMemoryStore:
         self.embedding_model = None
         self.index = None
         self.memory_data = []
+        self._memory_ids = [] # Ids of memory_data, in the same (ascending) order, for lookups by id
+        self._swap_lock = threading.Lock() # compact() swaps index and memory data under it; retrieval reads them together
         self.next_id = 0
+        self.dirty = False # Inserts not yet saved to disk
+        self._text_positions = {} # Memory text -> position in memory_data (built lazily by embeddings_for)
+        self._text_positions_count = 0
+        self._recent_embeddings = OrderedDict() # Text -> embedding of recent texts that are not in the index
 
         try:
-            # Load the sentence transformer model
-            self.embedding_model = SentenceTransformer(self.model_name)
-            logger.info(f"Loaded SentenceTransformer model: {self.model_name}")
+            # Load the sentence transformer model (shared across stores in this process)
+            self.embedding_model, self._encode_lock = get_shared_embedding_model(self.model_name)
+            logger.info(f"Using SentenceTransformer model: {self.model_name}")
 
             # Get embedding dimension if not provided
             if embedding_dim is None:
@@ -53,6 +81,55 @@ class VectorMemoryStore:
 
         logger.info("VectorMemoryStore initialized successfully.")
 
+    def _encode(self, texts):
+        with self._encode_lock:
+            return self.embedding_model.encode(texts, convert_to_numpy=True)
+
+    def encode_query(self, query_text):
+        """Float32 embedding (1 x dim) of a query, to run several searches with one encoder call."""
+        query_embedding = self._encode([query_text])
+        if query_embedding.ndim == 1: query_embedding = np.expand_dims(query_embedding, axis=0)
+        return query_embedding.astype('float32')
+
+    def embeddings_for(self, texts):
+        """
+        Float32 embeddings (len(texts) x dim) of `texts`.
+
+        Texts already stored (e.g. the turns a long-term summary is made of) or embedded recently reuse
+        that vector; only the others are encoded, in one call.
+        """
+        if len(self.memory_data) < self._text_positions_count:
+            self._text_positions, self._text_positions_count = {}, 0 # The store was reloaded
+        for position in range(self._text_positions_count, len(self.memory_data)):
+            self._text_positions[self.memory_data[position].get("text")] = position
+        self._text_positions_count = len(self.memory_data)
+
+        embeddings = np.zeros((len(texts), self.embedding_dim), dtype='float32')
+        missing = []
+        flat_index = faiss.downcast_index(self.index.index) if self.index is not None else None
+        for i, text in enumerate(texts):
+            position = self._text_positions.get(text)
+            if flat_index is not None and position is not None and position < flat_index.ntotal:
+                embeddings[i] = flat_index.reconstruct(position)
+            elif text in self._recent_embeddings:
+                embeddings[i] = self._recent_embeddings[text]
+            else:
+                missing.append(i)
+        if missing:
+            encoded = self._encode([texts[i] for i in missing])
+            embeddings[missing] = np.asarray(encoded, dtype='float32').reshape(len(missing), -1)
+            self._remember_embeddings([texts[i] for i in missing], embeddings[missing])
+        logger.debug("Embeddings for %d texts (%d reused from the index, %d encoded).", len(texts), len(texts) - len(missing), len(missing))
+        return embeddings
+
+    def _remember_embeddings(self, texts, embeddings):
+        """Keeps recently encoded texts (e.g. summary sentences) so the next embeddings_for() can reuse them."""
+        for text, embedding in zip(texts, embeddings):
+            self._recent_embeddings[text] = np.asarray(embedding, dtype='float32')
+            self._recent_embeddings.move_to_end(text)
+        while len(self._recent_embeddings) > RECENT_EMBEDDINGS_CACHE:
+            self._recent_embeddings.popitem(last=False)
+
     def add_memory(self, event_text, metadata=None):
         """
         Adds a new memory event to the store.
@@ -75,9 +152,10 @@ class VectorMemoryStore:
         logger.debug("Input text: '%s...'", event_text[:100])
         logger.debug("Metadata: %s", metadata)
 
+        memory_object = None
         try:
             # 1. Generate embedding
-            embedding = self.embedding_model.encode([event_text], convert_to_numpy=True)
+            embedding = self._encode([event_text])
             if embedding.ndim == 1: embedding = np.expand_dims(embedding, axis=0)
             embedding = embedding.astype('float32')
             logger.debug(f"Generated embedding shape: {embedding.shape}")
@@ -96,6 +174,7 @@ class VectorMemoryStore:
 
             # 3. Store the memory object data (text + metadata)
             self.memory_data.append(memory_object)
+            self._memory_ids.append(memory_id)
 
             # 4. Add the embedding vector to the FAISS index with its ID
             faiss_id = np.array([memory_id], dtype='int64')
@@ -103,19 +182,22 @@ class VectorMemoryStore:
 
             logger.info(f"Added memory ID {memory_id} to store and FAISS index. Index size: {self.index.ntotal}")
             self.next_id += 1
+            self.dirty = True
 
         except Exception as e:
             logger.error(f"Failed to add memory: {e}", exc_info=True)
             # Consider rolling back the addition to self.memory_data if index add fails
-            if len(self.memory_data) == self.next_id + 1:
+            if self.memory_data and self.memory_data[-1] is memory_object:
                  self.memory_data.pop()
+                 if self._memory_ids and self._memory_ids[-1] == memory_object["id"]:
+                     self._memory_ids.pop()
                  logger.warning("Rolled back addition to memory_data due to error.")
 
 
         logger.debug("--- VectorMemory: add_memory finished ---")
 
 
-    def retrieve_relevant_memories(self, query_text, k=5, threshold=None):
+    def retrieve_relevant_memories(self, query_text, k=5, threshold=None, query_embedding=None):
         """
         Retrieves the k most relevant memories based on semantic similarity.
 
@@ -124,13 +206,16 @@ class VectorMemoryStore:
             k (int): The maximum number of memories to retrieve.
             threshold (float, optional): A similarity threshold (e.g., L2 distance).
                                         Memories less similar than this are excluded.
+            query_embedding (np.ndarray, optional): Embedding of `query_text` from encode_query() (skips encoding).
 
         Returns:
             list[dict]: A list of the most relevant memory objects, ordered by similarity.
                         Returns empty list if no relevant memories are found or on error.
         """
+        # One consistent view: a consolidation pass on another thread may swap in a compacted store meanwhile
+        index, memory_data, memory_ids = self._snapshot()
         # Check if initialization was successful and index has items
-        if not self.embedding_model or not self.index or self.index.ntotal == 0:
+        if not self.embedding_model or not index or index.ntotal == 0:
              logger.debug("Retrieval attempted but store not ready or index is empty.")
              return []
         if not isinstance(query_text, str) or not query_text.strip():
@@ -143,18 +228,18 @@ class VectorMemoryStore:
 
         retrieved_memories = []
         try:
-            # 1. Generate query embedding
-            query_embedding = self.embedding_model.encode([query_text], convert_to_numpy=True)
-            if query_embedding.ndim == 1: query_embedding = np.expand_dims(query_embedding, axis=0)
-            query_embedding = query_embedding.astype('float32')
+            # 1. Generate query embedding (unless the caller already has it)
+            if query_embedding is None:
+                query_embedding = self.encode_query(query_text)
             logger.debug(f"Query embedding shape: {query_embedding.shape}")
 
             # 2. Search the FAISS index
-            # Ensure k is not greater than the number of items in the index
-            actual_k = min(k, self.index.ntotal)
+            # Ensure k is not greater than the number of items in the index. Twice as many candidates as needed,
+            # since memories downweighted by consolidation can drop below the cut
+            actual_k = min(k * 2, index.ntotal)
             if actual_k == 0: return [] # Should be caught by ntotal check above, but belt-and-suspenders
             logger.debug(f"Searching FAISS index with k={actual_k}")
-            distances, ids = self.index.search(query_embedding, actual_k)
+            distances, ids = index.search(query_embedding, actual_k)
             logger.debug(f"FAISS search results - Distances: {distances}, IDs: {ids}")
 
             # Process results
@@ -172,18 +257,20 @@ class VectorMemoryStore:
                         continue
 
                     # Retrieve the full memory object
-                    if 0 <= memory_id < len(self.memory_data):
+                    stored_memory = self._memory_by_id(int(memory_id), memory_data, memory_ids)
+                    if stored_memory is not None:
                         # Important: Create a copy to avoid modifying the stored object
-                        memory_object = self.memory_data[memory_id].copy()
+                        memory_object = stored_memory.copy()
                         # Add similarity score (L2 distance, smaller is better)
                         memory_object["similarity_score"] = float(distance)
                         retrieved_memories.append(memory_object)
                         logger.debug(f"Retrieved relevant memory ID {memory_id} with distance {distance}")
                     else:
-                        logger.warning(f"FAISS returned ID {memory_id} which is out of bounds for memory_data (size {len(self.memory_data)}).")
+                        logger.warning(f"FAISS returned ID {memory_id} which is not in memory_data (size {len(memory_data)}).")
 
-            # Sort by similarity score (ascending for L2 distance)
-            retrieved_memories.sort(key=lambda x: x.get("similarity_score", float('inf')))
+            # Sort by similarity score (ascending for L2 distance), stretched for memories consolidation downweighted
+            retrieved_memories.sort(key=lambda x: x.get("similarity_score", float('inf')) / (x.get("metadata") or {}).get("weight", 1.0))
+            retrieved_memories = retrieved_memories[:k]
 
         except Exception as e:
             logger.error(f"Failed to retrieve memories: {e}", exc_info=True)
@@ -193,27 +280,98 @@ class VectorMemoryStore:
         logger.debug("--- VectorMemory: retrieve_relevant_memories finished ---")
         return retrieved_memories
 
-    def save_memory(self, index_path="memory_index.faiss", data_path="memory_data.json"):
-         """Saves the FAISS index and memory data to disk."""
-         if not self.index:
-              logger.error("Cannot save memory: FAISS index not initialized.")
-              return
-         logger.info(f"Saving FAISS index to {index_path} and data to {data_path}...")
+    def _snapshot(self):
+        """(index, memory_data, memory ids) as of one moment; compact() replaces all three together."""
+        with self._swap_lock:
+            return self.index, self.memory_data, self._memory_ids
+
+    @staticmethod
+    def _memory_by_id(memory_id, memory_data, memory_ids):
+        """The memory object with `memory_id` in `memory_data`, or None. Ids increase with position but have gaps after compact()."""
+        if 0 <= memory_id < len(memory_data) and memory_data[memory_id]["id"] == memory_id:
+            return memory_data[memory_id]
+        position = bisect_left(memory_ids, memory_id)
+        if position < len(memory_data) and memory_data[position]["id"] == memory_id:
+            return memory_data[position]
+        return None
+
+    def compact(self, remove_ids=(), updates=None):
+        """
+        Rewrites the store: drops the memories in `remove_ids`, applies `updates` and rebuilds the FAISS index
+        with only the remaining vectors. Ids and order are kept (with gaps); next_id does not change.
+
+        Args:
+            remove_ids (set[int]): Memories to drop.
+            updates (dict): id -> (text, metadata, embedding or None to keep the stored vector).
+        Returns:
+            int: Number of memories removed.
+        """
+        updates = updates or {}
+        flat_index = faiss.downcast_index(self.index.index)
+        stored = flat_index.reconstruct_n(0, flat_index.ntotal) if flat_index.ntotal else np.zeros((0, self.embedding_dim), dtype='float32')
+        kept_memories, kept_embeddings = [], []
+        for position, memory in enumerate(self.memory_data):
+            if memory["id"] in remove_ids:
+                continue
+            embedding = stored[position]
+            if memory["id"] in updates:
+                text, metadata, new_embedding = updates[memory["id"]]
+                memory = {"id": memory["id"], "text": text, "metadata": metadata}
+                if new_embedding is not None:
+                    embedding = np.asarray(new_embedding, dtype='float32')
+            kept_memories.append(memory)
+            kept_embeddings.append(embedding)
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(self.embedding_dim))
+        if kept_memories:
+            index.add_with_ids(np.vstack(kept_embeddings).astype('float32'), np.array([m["id"] for m in kept_memories], dtype='int64'))
+        removed = len(self.memory_data) - len(kept_memories)
+        kept_ids = [memory["id"] for memory in kept_memories]
+        with self._swap_lock:
+            self.index, self.memory_data, self._memory_ids = index, kept_memories, kept_ids
+        self._text_positions, self._text_positions_count = {}, 0
+        self.dirty = True
+        logger.info(f"Compacted vector memory: {removed} removed, {len(updates)} updated, {len(kept_memories)} left.")
+        return removed
+
+    def serialize(self):
+         """In-memory copy of the index and data file contents (taken under the owner's state lock; written by write_serialized)."""
+         # Exclude the large embedding list from the JSON data file for efficiency
+         data_to_save = [
+             {k: v for k, v in mem.items() if k != 'embedding'}
+             for mem in self.memory_data
+         ]
+         data_json = json.dumps({"memory_data": data_to_save, "next_id": self.next_id}, ensure_ascii=False, indent=2)
+         return faiss.serialize_index(self.index), data_json
+
+    def write_serialized(self, serialized, index_path="memory_index.faiss", data_path="memory_data.json"):
+         """Writes the output of serialize() to disk. Returns True on success."""
+         index_bytes, data_json = serialized
          try:
-             logger.debug(f"Writing FAISS index with {self.index.ntotal} vectors.")
-             faiss.write_index(self.index, index_path)
-
-             # Save memory_data (list of dicts) and next_id as JSON
-             # Exclude the large embedding list from the JSON data file for efficiency
-             data_to_save = [
-                 {k: v for k, v in mem.items() if k != 'embedding'}
-                 for mem in self.memory_data
-             ]
-             with open(data_path, 'w', encoding='utf-8') as f:
-                 json.dump({"memory_data": data_to_save, "next_id": self.next_id}, f, ensure_ascii=False, indent=2)
+             logger.debug(f"Writing FAISS index ({len(index_bytes)} bytes) to {index_path}.")
+             # Written aside and renamed into place: save slots hard-link these files and must keep the old contents
+             index_bytes.tofile(index_path + ".tmp") # Same format as faiss.write_index
+             with open(data_path + ".tmp", 'w', encoding='utf-8') as f:
+                 f.write(data_json)
+             os.replace(index_path + ".tmp", index_path)
+             os.replace(data_path + ".tmp", data_path)
              logger.info("Memory saved successfully.")
+             return True
          except Exception as e:
              logger.error(f"Failed to save memory: {e}", exc_info=True)
+             return False
+
+    def save_memory(self, index_path="memory_index.faiss", data_path="memory_data.json"):
+         """Saves the FAISS index and memory data to disk. Returns True on success."""
+         if not self.index:
+              logger.error("Cannot save memory: FAISS index not initialized.")
+              return False
+         logger.info(f"Saving FAISS index to {index_path} and data to {data_path}...")
+         logger.debug(f"Writing FAISS index with {self.index.ntotal} vectors.")
+         self.dirty = False
+         saved = self.write_serialized(self.serialize(), index_path=index_path, data_path=data_path)
+         if not saved:
+             self.dirty = True
+         return saved
 
     def load_memory(self, index_path="memory_index.faiss", data_path="memory_data.json"):
          """Loads the FAISS index and memory data from disk."""
@@ -239,6 +397,7 @@ class VectorMemoryStore:
                  with open(data_path, 'r', encoding='utf-8') as f:
                      loaded_data = json.load(f)
                      self.memory_data = loaded_data.get("memory_data", [])
+                     self._memory_ids = [memory["id"] for memory in self.memory_data]
                      self.next_id = loaded_data.get("next_id", 0)
                  logger.info(f"Loaded memory data ({len(self.memory_data)} items). Next ID: {self.next_id}")
 
@@ -257,3 +416,29 @@ class VectorMemoryStore:
          else:
              logger.warning(f"Memory files not found ({index_path} or {data_path}). Starting with empty memory.")
 
+
+    def rows_since(self, position=0):
+         """(memory object, float32 embedding) pairs for the memories added from `position` on (for the SQLite store)."""
+         if not self.index or position >= len(self.memory_data):
+             return []
+         # Memories and vectors are added together, so the flat index keeps them in memory_data order
+         embeddings = faiss.downcast_index(self.index.index).reconstruct_n(position, len(self.memory_data) - position)
+         return list(zip(self.memory_data[position:], embeddings))
+
+    def load_rows(self, rows, next_id=0):
+         """
+         Rebuilds the index and memory data from (memory object, embedding) pairs in id order (from the SQLite store).
+
+         `next_id` is the saved high-water mark: consolidation may have pruned the newest memories, whose ids
+         must not be handed out again.
+         """
+         self.index = faiss.IndexIDMap(faiss.IndexFlatL2(self.embedding_dim))
+         self.memory_data = [memory for memory, _ in rows]
+         self._memory_ids = [memory["id"] for memory in self.memory_data]
+         if rows:
+             embeddings = np.vstack([embedding for _, embedding in rows]).astype('float32')
+             ids = np.array([memory["id"] for memory in self.memory_data], dtype='int64')
+             self.index.add_with_ids(embeddings, ids)
+         self.next_id = max(next_id, self.memory_data[-1]["id"] + 1 if self.memory_data else 0)
+         self.dirty = False
+         logger.info(f"Loaded {len(self.memory_data)} memories from rows. Next ID: {self.next_id}")